@@ -0,0 +1,326 @@
+"""
+Benchmarks for certificate generation, import and nginx rendering.
+
+Every run works in a scratch directory built from synthetic data, so results only depend on the code and the machine:
+
+    * generate_N        A full generate_certificates run for a config.yml with N synthetic clients (--clients). The
+                        synthetic config uses --key-profile, ecdsa-p256 by default, because RSA key generation time
+                        is too random to compare runs. generate_key measures key generation on its own.
+    * generate_key      Generating one key with the default key profile. RSA key generation time varies a lot from
+                        key to key, so compare this one over a high --repeat.
+    * create_ssl_cert   Issuing one certificate from a pre-generated key: signing, serialization and file writes
+    * pkcs12            generate_pkcs12_certificate without a password and with the default profile
+    * convert_pem_files Splitting a server PEM file into .crt and .key
+    * validate_server_cert_M
+                        Building a trust store from M root CA files (--roots) and validating a server cert against it
+    * render_nginx      Rendering nginx.conf.j2 through configure_nginx
+
+Results are written as JSON. Save one as a baseline and compare later runs against it. Any benchmark whose fastest
+run is more than --threshold slower than the baseline's fastest run is flagged and the exit status is 1. The fastest
+run is compared because it is the one least disturbed by the rest of the machine:
+
+    python benchmark_certs.py --output baseline.json
+    python benchmark_certs.py --compare baseline.json
+
+The benchmarks import the scripts from ../python_container and need the packages in its requirements.txt.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PYTHON_CONTAINER_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'python_container')
+CONFIG_TEMPLATE = os.path.join(os.path.dirname(SCRIPT_DIR), 'config.yml')
+sys.path.insert(0, PYTHON_CONTAINER_DIR)
+
+import yaml  # noqa: E402
+from cryptography import x509  # noqa: E402
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+from cryptography.x509.oid import NameOID  # noqa: E402
+
+import configure_nginx  # noqa: E402
+import generate_certificates  # noqa: E402
+from artifact_cache import ArtifactCache  # noqa: E402
+from helper_functions import PatchesLogger, convert_pem_files, generate_key, generate_pkcs12_certificate, \
+    get_key_profile  # noqa: E402
+from import_keys import validate_server_cert  # noqa: E402
+
+# Bump this if the layout of the results file changes. Results with another version cannot be compared.
+RESULTS_VERSION = 1
+
+
+def synthetic_config(client_count: int, key_profile: str) -> dict:
+    """Builds a config.yml from the template in podman-build with client_count synthetic clients.
+
+    Args:
+        client_count (int): The number of clients.
+        key_profile (str): The key profile of every certificate.
+
+    Returns:
+        dict: The config. client0 is the PATCHES_ADMINISTRATOR.
+    """
+    with open(CONFIG_TEMPLATE, 'r') as f:
+        config = yaml.safe_load(f)
+
+    template_client = next(iter(config['clients'].values()))
+    config['clients'] = {f"client{i}": dict(template_client, dns_1=f"client{i}.lan") for i in range(client_count)}
+    config['PATCHES_ADMINISTRATOR'] = 'client0'
+    config['key_profile'] = key_profile
+    return config
+
+
+def write_config(directory: str, config: dict) -> None:
+    """Writes a config dict as config.yml in a directory."""
+    with open(os.path.join(directory, 'config.yml'), 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+
+def measure(function: Callable[[], None], repeat: int) -> Dict[str, float]:
+    """Runs a function repeat times and summarizes how long it took.
+
+    Args:
+        function (callable): The code to time. It takes no arguments.
+        repeat (int): How many times to run it.
+
+    Returns:
+        dict: The number of runs and the median, min and max seconds per run.
+    """
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return {'runs': repeat, 'median': statistics.median(durations), 'min': min(durations), 'max': max(durations)}
+
+
+def run_generate(argv: List[str]) -> None:
+    """Runs generate_certificates.main and raises if it fails, so a failed run is never timed as a fast one."""
+    status = generate_certificates.main(argv)
+    if status != 0:
+        raise RuntimeError(f"generate_certificates.main({argv}) failed with exit status {status}.")
+
+
+def self_signed_ca(name: str):
+    """Creates a throwaway ECDSA root CA. Returns the key and certificate."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    certificate = (x509.CertificateBuilder()
+                   .subject_name(subject)
+                   .issuer_name(subject)
+                   .public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(datetime.utcnow())
+                   .not_valid_after(datetime.utcnow() + timedelta(days=30))
+                   .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+                   .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+                   .sign(key, hashes.SHA256()))
+    return key, certificate
+
+
+class PregeneratedKeys:
+    """Stands in for a KeyPool so create_ssl_cert can be timed without the randomness of key generation."""
+
+    def __init__(self, key_profile, count: int):
+        self._keys = [generate_key(key_profile) for _ in range(count)]
+
+    def take(self, key_profile):
+        return self._keys.pop()
+
+
+def run_benchmarks(work_dir: str, client_counts: List[int], root_count: int, repeat: int, generate_repeat: int,
+                   workers: int, key_profile: str) -> Dict[str, dict]:
+    """Runs every benchmark inside work_dir.
+
+    Args:
+        work_dir (str): An empty scratch directory. The benchmarks change into it.
+        client_counts (list): The client counts of the end to end generate runs.
+        root_count (int): The number of root CA files validate_server_cert is given.
+        repeat (int): How many times to run each per function benchmark.
+        generate_repeat (int): How many times to run each end to end generate run.
+        workers (int): The --workers value for the end to end generate runs.
+        key_profile (str): The key profile of the synthetic configs.
+
+    Returns:
+        dict: The measurements of each benchmark by name.
+    """
+    results = {}
+    os.chdir(work_dir)
+    shutil.copy(os.path.join(PYTHON_CONTAINER_DIR, 'nginx.conf.j2'), work_dir)
+
+    # End to end generate runs. A run issues the root CA, the three server certificates and one per client.
+    for client_count in client_counts:
+        run_dir = os.path.join(work_dir, f"generate_{client_count}")
+        os.makedirs(run_dir)
+        os.chdir(run_dir)
+        write_config(run_dir, synthetic_config(client_count, key_profile))
+        measurement = measure(lambda: run_generate([
+            '--cert-dir', 'certs', '--root-cert-dir', 'ca', '--ipv4-address', '10.0.0.5', '--non-interactive',
+            '--reuse-root-ca', 'no', '--workers', str(workers)]), generate_repeat)
+        measurement['certificates_per_second'] = (client_count + 4) / measurement['median']
+        results[f"generate_{client_count}"] = measurement
+        os.chdir(work_dir)
+
+    # Per function benchmarks share one root CA and server certificate
+    os.makedirs('unit')
+    os.chdir('unit')
+    root_key, root_cert = self_signed_ca('benchmark-root')
+    key_profile = get_key_profile(None)
+    results['generate_key'] = measure(lambda: generate_key(key_profile), repeat)
+
+    keys = PregeneratedKeys(key_profile, repeat)
+    counter = iter(range(repeat))
+
+    def issue():
+        generate_certificates.create_ssl_cert(
+            root_private_key=root_key, root_cert=root_cert, cert_directory='.', host_name=f"host{next(counter)}.lan",
+            country='US', state='Ohio', locality='Dayton', organization_name='Dell', organization_unit='Federal',
+            dns_1='host.lan', days=30, key_pool=keys, key_profile=key_profile)
+
+    results['create_ssl_cert'] = measure(issue, repeat)
+
+    issue_args = dict(root_private_key=root_key, root_cert=root_cert, cert_directory='.', host_name='server.lan',
+                      country='US', state='Ohio', locality='Dayton', organization_name='Dell',
+                      organization_unit='Federal', dns_1='server.lan', days=30, key_profile=key_profile)
+    generate_certificates.create_ssl_cert(**issue_args)
+    artifacts = ArtifactCache()
+    server_key = artifacts.private_key('server.lan.key')
+    server_cert = artifacts.certificate('server.lan.crt')
+
+    results['pkcs12_no_password'] = measure(
+        lambda: generate_pkcs12_certificate('server', server_key, server_cert, root_cert), repeat)
+    results['pkcs12_password'] = measure(
+        lambda: generate_pkcs12_certificate('server', server_key, server_cert, root_cert, 'benchmark'), repeat)
+
+    results['convert_pem_files'] = measure(lambda: convert_pem_files('server.lan.pem'), repeat)
+
+    # Decoy roots first so the real root is the last of root_count files
+    root_files = []
+    for i in range(root_count - 1):
+        _, decoy_cert = self_signed_ca(f"decoy-root-{i}")
+        root_files.append(f"decoy{i}.pem")
+        with open(root_files[-1], 'wb') as f:
+            f.write(decoy_cert.public_bytes(serialization.Encoding.PEM))
+    with open('root.pem', 'wb') as f:
+        f.write(root_cert.public_bytes(serialization.Encoding.PEM))
+    root_files.append('root.pem')
+    results[f"validate_server_cert_{root_count}"] = measure(
+        lambda: validate_server_cert('server.lan.pem', root_files, artifacts=ArtifactCache()), repeat)
+
+    os.chdir(work_dir)
+    nginx_args = configure_nginx.build_parser().parse_args([
+        '--server-name', 'patches', '--server-domain', 'lan', '--ipv4-address', '10.0.0.5', '--nginx-config-dir', '.',
+        '--server-cert', 'patches.lan.crt', '--server-key', 'patches.lan.key', '--server-ca', 'root.pem',
+        '--root-cert-dir', 'root_certs', '--root-cert-path', 'root_certs/root.pem', '--cert-dir', 'server_certs',
+        '--frontend-port', '3000', '--backend-port', '9000'])
+    results['render_nginx'] = measure(lambda: configure_nginx.render_nginx_config(nginx_args), repeat)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Compares results against a baseline.
+
+    Args:
+        results (dict): The results of this run.
+        baseline (dict): The results of the baseline run.
+        threshold (float): The allowed slowdown as a fraction, for example 0.15 for 15%.
+
+    Returns:
+        list: One message per benchmark that got slower than the threshold allows.
+    """
+    regressions = []
+    for name, measurement in results['benchmarks'].items():
+        baseline_measurement = baseline['benchmarks'].get(name)
+        if baseline_measurement is None:
+            print(f"{name}: no baseline")
+            continue
+        ratio = measurement['min'] / baseline_measurement['min']
+        verdict = 'REGRESSION' if ratio > 1 + threshold else 'ok'
+        print(f"{name}: {baseline_measurement['min'] * 1000:.2f} ms -> {measurement['min'] * 1000:.2f} ms "
+              f"({(ratio - 1) * 100:+.1f}%) {verdict}")
+        if verdict == 'REGRESSION':
+            regressions.append(f"{name} is {(ratio - 1) * 100:.1f}% slower than the baseline.")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Runs the benchmarks, writes the results and optionally compares them with a baseline.
+
+    Args:
+        argv (list, optional): The command line arguments without the program name. Defaults to sys.argv.
+
+    Returns:
+        int: 1 if a regression was found, otherwise 0.
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks certificate generation, import and nginx rendering.')
+    parser.add_argument('--clients', type=str, default='10,100',
+                        help='Comma separated client counts for the end to end generate runs. Defaults to 10,100. '
+                             'Use 10,100,1000 for the full suite.')
+    parser.add_argument('--roots', type=int, default=50,
+                        help='The number of root CA files validate_server_cert is given. Defaults to 50.')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='How many times each per function benchmark runs. Defaults to 20.')
+    parser.add_argument('--generate-repeat', dest='generate_repeat', type=int, default=3,
+                        help='How many times each end to end generate run is repeated. Defaults to 3.')
+    parser.add_argument('--key-profile', dest='key_profile', type=str, default='ecdsa-p256',
+                        help='The key profile of the synthetic configs. Defaults to ecdsa-p256.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='The --workers value for the end to end generate runs. Defaults to 1.')
+    parser.add_argument('--output', type=str, default='benchmark_results.json',
+                        help='Where to write the results. Defaults to benchmark_results.json.')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='A previous results file to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='The slowdown that counts as a regression, as a fraction. Defaults to 0.15.')
+    args = parser.parse_args(argv)
+
+    # The scripts log every certificate. Only warnings matter here.
+    PatchesLogger.get_logger().setLevel(logging.WARNING)
+
+    output = os.path.abspath(args.output)
+    baseline_file = os.path.abspath(args.compare) if args.compare else None
+    client_counts = [int(count) for count in args.clients.split(',') if count]
+    work_dir = tempfile.mkdtemp(prefix='patches-benchmark-')
+    try:
+        benchmarks = run_benchmarks(work_dir, client_counts, args.roots, args.repeat, args.generate_repeat, args.workers,
+                                    args.key_profile)
+    finally:
+        os.chdir(SCRIPT_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {'version': RESULTS_VERSION, 'created': datetime.utcnow().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+               'benchmarks': benchmarks}
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for name, measurement in benchmarks.items():
+        print(f"{name}: median {measurement['median'] * 1000:.2f} ms, min {measurement['min'] * 1000:.2f} ms over "
+              f"{measurement['runs']} runs")
+    print(f"Wrote {output}")
+
+    if baseline_file:
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('version') != RESULTS_VERSION:
+            print(f"{baseline_file} has results version {baseline.get('version')}, expected {RESULTS_VERSION}.")
+            return 1
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -577,6 +577,36 @@ check_nginx_status() {
   fi
 }
 
+# export_frontend_build copies the built frontend out of the patches-base image into ${TOP_DIR}/frontend_build so
+# nginx can serve it directly. It is copied again every time nginx starts so it always matches the image. With
+# NGINX_STATIC_PRECOMPRESSED the text files are also stored gzip compressed next to the originals.
+#
+# Parameters:
+#   None
+#
+# Environment Variables:
+#   TOP_DIR - the top-level directory of the Patches application
+#   NGINX_STATIC_PRECOMPRESSED - whether to write .gz copies of the text files
+#
+# Returns:
+#   None
+function export_frontend_build() {
+
+  rm -rf "${TOP_DIR}/frontend_build"
+
+  # Make sure any old containers are cleaned up
+  podman rm -f patches-frontend-export &>/dev/null || true
+
+  podman create --name patches-frontend-export localhost/dell/patches-base:latest > /dev/null
+  podman cp patches-frontend-export:/home/node/app/build "${TOP_DIR}/frontend_build"
+  podman rm -f patches-frontend-export > /dev/null
+
+  if [[ "${NGINX_STATIC_PRECOMPRESSED}" == "true" ]]; then
+    find "${TOP_DIR}/frontend_build" -type f \( -name '*.js' -o -name '*.css' -o -name '*.html' -o -name '*.json' \
+      -o -name '*.svg' -o -name '*.txt' -o -name '*.map' \) -size +1k -exec gzip -k -9 -f {} +
+  fi
+}
+
 # run_nginx - runs an Nginx container using Podman
 #
 # This function generates the Nginx configuration, asks the user if they want to run with sudo, and then
@@ -595,6 +625,13 @@ check_nginx_status() {
 #   None
 function run_nginx() {
 
+  # With NGINX_STATIC_FRONTEND nginx serves the built frontend itself from a read-only mount
+  local static_frontend_args=()
+  if [[ "${NGINX_STATIC_FRONTEND}" == "true" ]]; then
+    export_frontend_build
+    static_frontend_args=(--volume "${TOP_DIR}/frontend_build:/patches/frontend:ro,Z")
+  fi
+
   # Check if unprivileged ports start at 80 or lower
   if check_unprivileged_ports; then
     patches_echo "Unprivileged ports already start at 80 or lower. Skipping."
@@ -603,6 +640,7 @@ function run_nginx() {
       --env-file ${TOP_DIR}/.patches-nginx \
       --volume ${SCRIPT_DIR}/nginx_config/nginx.conf:/etc/nginx/nginx.conf:Z \
       --volume ${TOP_DIR}/${CERT_DIRECTORY}:/patches/${CERT_DIRECTORY}:z \
+      "${static_frontend_args[@]}" \
       --publish 443:443 \
       --publish 80:80 \
       --detach \
@@ -632,6 +670,7 @@ function run_nginx() {
         --env-file ${TOP_DIR}/.patches-nginx \
         --volume ${SCRIPT_DIR}/nginx_config/nginx.conf:/etc/nginx/nginx.conf:Z \
         --volume ${TOP_DIR}/${CERT_DIRECTORY}:/patches/${CERT_DIRECTORY}:z \
+        "${static_frontend_args[@]}" \
         --publish 443:443 \
         --publish 80:80 \
         --detach \
@@ -661,6 +700,7 @@ function run_nginx() {
         --env-file ${TOP_DIR}/.patches-nginx \
         --volume ${SCRIPT_DIR}/nginx_config/nginx.conf:/etc/nginx/nginx.conf:Z \
         --volume ${TOP_DIR}/${CERT_DIRECTORY}:/patches/${CERT_DIRECTORY}:z \
+        "${static_frontend_args[@]}" \
         --publish ${nginx_port}:443 \
         --detach \
         --network host-bridge-net \
@@ -695,10 +735,20 @@ function generate_certificates() {
     get_ip_address
   fi
 
-  # Setup environment variables for the certificate generator
+  # Setup environment variables for the certificate generator. KEY_POOL_PASSPHRASE is passed with --env below so it is
+  # never written to disk.
   echo "IPV4_ADDRESS=${ipv4_address}" > ${TOP_DIR}/.patches-certificate-generator
   echo "ROOT_CERT_DIRECTORY=${ROOT_CERT_DIRECTORY}" >> ${TOP_DIR}/.patches-certificate-generator
   echo "CERT_DIRECTORY=${CERT_DIRECTORY}" >> ${TOP_DIR}/.patches-certificate-generator
+  echo "PATCHES_CONFIG_CACHE=${CERT_DIRECTORY}/.config_snapshot.json" >> ${TOP_DIR}/.patches-certificate-generator
+  echo "CERT_WORKERS=${CERT_WORKERS}" >> ${TOP_DIR}/.patches-certificate-generator
+  echo "CERT_INCREMENTAL=${CERT_INCREMENTAL}" >> ${TOP_DIR}/.patches-certificate-generator
+  echo "CERT_TIMINGS=${CERT_TIMINGS}" >> ${TOP_DIR}/.patches-certificate-generator
+  echo "CERT_NON_INTERACTIVE=${CERT_NON_INTERACTIVE}" >> ${TOP_DIR}/.patches-certificate-generator
+  echo "PKCS_PASSWORD_SOURCE=${PKCS_PASSWORD_SOURCE}" >> ${TOP_DIR}/.patches-certificate-generator
+  if [ -n "${KEY_POOL_DIRECTORY}" ]; then
+    echo "KEY_POOL_DIRECTORY=${CERT_DIRECTORY}/${KEY_POOL_DIRECTORY}" >> ${TOP_DIR}/.patches-certificate-generator
+  fi
 
   # Check to see if the generic client names are still present
   if [[ -n ${clients_gelante+x} ]] && [[ -n ${clients_geleisi+x} ]]; then
@@ -715,8 +765,9 @@ function generate_certificates() {
     --name patches-certificate-generator \
     -it \
     --env-file ${TOP_DIR}/.patches-certificate-generator \
+    ${KEY_POOL_PASSPHRASE:+--env KEY_POOL_PASSPHRASE="$KEY_POOL_PASSPHRASE"} \
     --volume ${TOP_DIR}/${CERT_DIRECTORY}:/app/${CERT_DIRECTORY}:Z \
-    --volume ${SCRIPT_DIR}/config.yml:/app/config.yml:Z \
+    --volume ${SCRIPT_DIR}:/patches/config:z \
     --entrypoint /app/generate_certificates_entrypoint.sh \
     localhost/dell/patches-python:latest
 
@@ -1091,6 +1142,7 @@ function patches_setup() {
   echo "SSL_ON=0" >> "${TOP_DIR}/.patches-backend" # This is for the connection to postgresql internally
   echo "DISABLE_CLIENT_CERT_AUTH=${DISABLE_CLIENT_CERT_AUTH}" >> "${TOP_DIR}/.patches-backend"
   echo "DISABLE_CLIENT_CERT_REQUEST=${DISABLE_CLIENT_CERT_REQUEST}" >> "${TOP_DIR}/.patches-backend"
+  echo "CLIENT_IDENTITY_HEADERS=${CLIENT_IDENTITY_HEADERS}" >> "${TOP_DIR}/.patches-backend"
   source ${TOP_DIR}/.patches-backend
 
   # Setup the environment variables for the postgres container
@@ -1133,12 +1185,18 @@ function patches_setup() {
   echo "SERVER_NAME=${SERVER_NAME}" >> "${TOP_DIR}/.patches-nginx"
   echo "SERVER_DOMAIN=${SERVER_DOMAIN}" >> "${TOP_DIR}/.patches-nginx"
   if [ -n "${SERVER_DOMAIN}" ]; then
-    echo "SERVER_CERT=/patches/${CERT_DIRECTORY}/${SERVER_NAME}.${SERVER_DOMAIN}.crt" >> "${TOP_DIR}/.patches-nginx"
-    echo "SERVER_KEY=/patches/${CERT_DIRECTORY}/${SERVER_NAME}.${SERVER_DOMAIN}.key" >> "${TOP_DIR}/.patches-nginx"
+    server_cert_name="${SERVER_NAME}.${SERVER_DOMAIN}"
   else
-    echo "SERVER_CERT=/patches/${CERT_DIRECTORY}/${SERVER_NAME}.crt" >> "${TOP_DIR}/.patches-nginx"
-    echo "SERVER_KEY=/patches/${CERT_DIRECTORY}/${SERVER_NAME}.key" >> "${TOP_DIR}/.patches-nginx"
+    server_cert_name="${SERVER_NAME}"
   fi
+  # import-keys records the full chain it writes in SERVER_FULLCHAIN and generate clears it. Serve the chain only
+  # while it is recorded so clients receive the intermediates along with the imported server certificate.
+  if [[ -n "${SERVER_FULLCHAIN}" && -f "${TOP_DIR}/${CERT_DIRECTORY}/${SERVER_FULLCHAIN}" ]]; then
+    echo "SERVER_CERT=/patches/${CERT_DIRECTORY}/${SERVER_FULLCHAIN}" >> "${TOP_DIR}/.patches-nginx"
+  else
+    echo "SERVER_CERT=/patches/${CERT_DIRECTORY}/${server_cert_name}.crt" >> "${TOP_DIR}/.patches-nginx"
+  fi
+  echo "SERVER_KEY=/patches/${CERT_DIRECTORY}/${server_cert_name}.key" >> "${TOP_DIR}/.patches-nginx"
   echo "SERVER_CA=/patches/${CERT_DIRECTORY}/${ROOT_CERT_DIRECTORY}" >> "${TOP_DIR}/.patches-nginx"
   echo "ROOT_CERT_DIRECTORY=/patches/${CERT_DIRECTORY}/${ROOT_CERT_DIRECTORY}" >> "${TOP_DIR}/.patches-nginx"
   if [ -n "${ROOT_CA_DOMAIN}" ]; then
@@ -1151,6 +1209,19 @@ function patches_setup() {
   echo "FRONTEND_PORT=${FRONTEND_PORT}" >> ${TOP_DIR}/.patches-nginx
   echo "DISABLE_CLIENT_CERT_AUTH=${DISABLE_CLIENT_CERT_AUTH}" >> ${TOP_DIR}/.patches-nginx
   echo "DISABLE_CLIENT_CERT_REQUEST=${DISABLE_CLIENT_CERT_REQUEST}" >> ${TOP_DIR}/.patches-nginx
+  echo "CLIENT_IDENTITY_HEADERS=${CLIENT_IDENTITY_HEADERS}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_TLS_PROFILE=${NGINX_TLS_PROFILE}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_WORKER_PROCESSES=${NGINX_WORKER_PROCESSES}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_WORKER_CONNECTIONS=${NGINX_WORKER_CONNECTIONS}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_STATIC_FRONTEND=${NGINX_STATIC_FRONTEND}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_STATIC_PRECOMPRESSED=${NGINX_STATIC_PRECOMPRESSED}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_LOG_PROFILE=${NGINX_LOG_PROFILE}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_ACCESS_LOG_BUFFER=${NGINX_ACCESS_LOG_BUFFER}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_ACCESS_LOG_GZIP=${NGINX_ACCESS_LOG_GZIP}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_UPSTREAM_KEEPALIVE=${NGINX_UPSTREAM_KEEPALIVE}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_BACKEND_SERVERS=${NGINX_BACKEND_SERVERS}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_FRONTEND_SERVERS=${NGINX_FRONTEND_SERVERS}" >> ${TOP_DIR}/.patches-nginx
+  echo "NGINX_LOAD_BALANCING=${NGINX_LOAD_BALANCING}" >> ${TOP_DIR}/.patches-nginx
 
   # Before continuing we need to make sure that all the build containers are present
   check_images
@@ -1296,9 +1367,11 @@ EOF
 # import_keys is responsible for importing certificates and keys for Patches
 #
 # Parameters:
-#   If two arguments are provided:
+#   If two or more arguments are provided:
 #     arg1: The root CA public certificate (and optionally private key) in PEM format.
 #     arg2: The server private key/public certificate in PEM format.
+#     arg3...: Optional intermediate CA public certificates in PEM format, if the server certificate was not issued
+#              directly by the root CA.
 #
 #   If one argument is provided:
 #     arg1: The file path to a PKCS file which includes the root CA public certificate and the server's public certificate/private key.
@@ -1333,10 +1406,11 @@ function import_keys() {
 
   echo "ROOT_CERT_DIRECTORY=/patches/${CERT_DIRECTORY}/${ROOT_CERT_DIRECTORY}" > ${TOP_DIR}/.patches-import-keys
   echo "CERT_DIRECTORY=/patches/${CERT_DIRECTORY}" >> ${TOP_DIR}/.patches-import-keys
+  echo "PATCHES_CONFIG_CACHE=/patches/${CERT_DIRECTORY}/.config_snapshot.json" >> ${TOP_DIR}/.patches-import-keys
 
   # Remove any old values in config.yml
   # Define the keys to search and remove the values
-  keys=("ROOT_CA_PEM:" "SERVER_PEM:" "PKCS_FILE:")
+  keys=("ROOT_CA_PEM:" "SERVER_PEM:" "SERVER_FULLCHAIN:" "PKCS_FILE:")
 
   # Iterate over each key
   for key in "${keys[@]}"; do
@@ -1346,9 +1420,10 @@ function import_keys() {
 
   mkdir -p "${TOP_DIR}/${CERT_DIRECTORY}/${ROOT_CERT_DIRECTORY}"
 
-  if [[ "$#" -eq 2 ]]; then
+  if [[ "$#" -ge 2 ]]; then
     root_ca_public_key="$1"
     server_key="$2"
+    intermediate_pem_files=""
 
     # Check if server_key is an absolute path
     if [[ ! "$server_key" = /* ]]; then
@@ -1372,15 +1447,28 @@ function import_keys() {
       cp -f "${root_ca_public_key}" "${TOP_DIR}/${CERT_DIRECTORY}/${ROOT_CERT_DIRECTORY}"
     fi
 
+    # Copy any intermediate CA certificates to CERT_DIRECTORY
+    for intermediate_cert in "${@:3}"; do
+      if [[ ! "$intermediate_cert" = /* ]]; then
+        patches_echo "Error: Intermediate CA certificate path must be an absolute path. This command does not accept relative paths." --error
+        exit 1
+      fi
+      if [[ "${intermediate_cert}" != "${TOP_DIR}/${CERT_DIRECTORY}/$(basename "${intermediate_cert}")" ]]; then
+        cp -f "${intermediate_cert}" "${TOP_DIR}/${CERT_DIRECTORY}"
+      fi
+      intermediate_pem_files="${intermediate_pem_files:+${intermediate_pem_files}:}/patches/${CERT_DIRECTORY}/$(basename "${intermediate_cert}")"
+    done
+
     echo "server_pem_file=/patches/${CERT_DIRECTORY}/${server_pem_file}" >> ${TOP_DIR}/.patches-import-keys
     echo "root_ca_pem_file=/patches/${CERT_DIRECTORY}/${root_ca_pem_file}" >> ${TOP_DIR}/.patches-import-keys
+    echo "intermediate_pem_files=${intermediate_pem_files}" >> ${TOP_DIR}/.patches-import-keys
 
     podman run \
       --name import-keys \
       -it \
       --env-file ${TOP_DIR}/.patches-import-keys \
       --volume ${TOP_DIR}/${CERT_DIRECTORY}:/patches/${CERT_DIRECTORY}:Z \
-      --volume ${SCRIPT_DIR}/config.yml:/app/config.yml:Z \
+      --volume ${SCRIPT_DIR}:/patches/config:z \
       --entrypoint /app/import_keys_entrypoint.sh \
       localhost/dell/patches-python:latest
   elif [[ "$#" -eq 1 ]]; then
@@ -1414,7 +1502,7 @@ function import_keys() {
       --env-file ${TOP_DIR}/.patches-import-keys \
       ${pkcs_password:+--env PKCS_PASSWORD="$pkcs_password"} \
       --volume ${TOP_DIR}/${CERT_DIRECTORY}:/patches/${CERT_DIRECTORY}:Z \
-      --volume ${SCRIPT_DIR}/config.yml:/app/config.yml:Z \
+      --volume ${SCRIPT_DIR}:/patches/config:z \
       --entrypoint /app/import_keys_entrypoint.sh \
       localhost/dell/patches-python:latest
 
@@ -1444,6 +1532,7 @@ function validate_certs() {
 
   echo "ROOT_CERT_DIRECTORY=/patches/${CERT_DIRECTORY}/${ROOT_CERT_DIRECTORY}" > ${TOP_DIR}/.patches-import-keys
   echo "CERT_DIRECTORY=/patches/${CERT_DIRECTORY}" >> ${TOP_DIR}/.patches-import-keys
+  echo "PATCHES_CONFIG_CACHE=/patches/${CERT_DIRECTORY}/.config_snapshot.json" >> ${TOP_DIR}/.patches-import-keys
   echo "server_pem_file=/patches/${CERT_DIRECTORY}/${2}" >> ${TOP_DIR}/.patches-import-keys
   echo "root_ca_pem_file=/patches/${CERT_DIRECTORY}/${ROOT_CERT_DIRECTORY}/${1}" >> ${TOP_DIR}/.patches-import-keys
   echo "VALIDATE=true" >> ${TOP_DIR}/.patches-import-keys
@@ -1453,7 +1542,7 @@ function validate_certs() {
     -it \
     --env-file ${TOP_DIR}/.patches-import-keys \
     --volume ${TOP_DIR}/${CERT_DIRECTORY}:/patches/${CERT_DIRECTORY}:Z \
-    --volume ${SCRIPT_DIR}/config.yml:/app/config.yml:Z \
+    --volume ${SCRIPT_DIR}:/patches/config:z \
     --entrypoint /app/import_keys_entrypoint.sh \
     localhost/dell/patches-python:latest
 
@@ -1461,6 +1550,99 @@ function validate_certs() {
   podman rm -f import-keys || true
 }
 
+# validate_keys checks every PKCS#12 and PEM file in a directory against the root CA certificates in
+# ROOT_CERT_DIRECTORY without importing any of them. The directory and CERT_DIRECTORY are mounted read-only.
+#
+# Parameters:
+#   arg1: The absolute path of the directory holding the certificate files to check.
+#
+# Environment Variables:
+#   CERT_DIRECTORY: Path to the certificate directory
+#   ROOT_CERT_DIRECTORY: Path to the root certificate directory
+#   TOP_DIR: Path to the top-level directory
+#
+# Returns:
+#   None. The report is written to ${TOP_DIR}/logs/validation_report.jsonl with one JSON line per file.
+#
+function validate_keys() {
+
+  local validate_directory="$1"
+
+  if [[ -z "$validate_directory" || ! "$validate_directory" = /* || ! -d "$validate_directory" ]]; then
+    patches_echo "Error: validate-keys requires the absolute path of a directory containing .p12, .pfx, .pem or .crt files." --error
+    exit 1
+  fi
+
+  check_images
+
+  patches_read "Enter the password for the PKCS#12 files, if any. If there is no password, leave this empty." --password
+  local pkcs_password="$RETURN_VALUE"
+
+  mkdir -p "${TOP_DIR}/logs"
+
+  # Make sure any old containers are cleaned up
+  podman rm -f import-keys || true
+
+  echo "ROOT_CERT_DIRECTORY=/patches/${CERT_DIRECTORY}/${ROOT_CERT_DIRECTORY}" > ${TOP_DIR}/.patches-import-keys
+  echo "CERT_DIRECTORY=/patches/${CERT_DIRECTORY}" >> ${TOP_DIR}/.patches-import-keys
+  echo "PATCHES_CONFIG_CACHE=/patches/${CERT_DIRECTORY}/.config_snapshot.json" >> ${TOP_DIR}/.patches-import-keys
+  echo "VALIDATE_DIR=/patches/validate" >> ${TOP_DIR}/.patches-import-keys
+  echo "VALIDATE_REPORT=/patches/logs/validation_report.jsonl" >> ${TOP_DIR}/.patches-import-keys
+
+  podman run \
+    --name import-keys \
+    -it \
+    --env-file ${TOP_DIR}/.patches-import-keys \
+    ${pkcs_password:+--env PKCS_PASSWORD="$pkcs_password"} \
+    --volume ${TOP_DIR}/${CERT_DIRECTORY}:/patches/${CERT_DIRECTORY}:ro,Z \
+    --volume ${validate_directory}:/patches/validate:ro,z \
+    --volume ${TOP_DIR}/logs:/patches/logs:Z \
+    --volume ${SCRIPT_DIR}:/patches/config:ro,z \
+    --entrypoint /app/import_keys_entrypoint.sh \
+    localhost/dell/patches-python:latest
+
+  # Make sure any old containers are cleaned up
+  podman rm -f import-keys || true
+
+  patches_echo "The validation report was written to ${TOP_DIR}/logs/validation_report.jsonl."
+}
+
+# certificate_inventory lists the certificates in CERT_DIRECTORY and ROOT_CERT_DIRECTORY. The results are cached in
+# ${CERT_DIRECTORY}/.inventory.sqlite so later runs only parse the files that changed.
+#
+# Parameters:
+#   All arguments are passed to the inventory, for example --expiring-within 30 or --issued-by <root CA name>.
+#
+# Environment Variables:
+#   CERT_DIRECTORY: Path to the certificate directory
+#   ROOT_CERT_DIRECTORY: Path to the root certificate directory
+#   TOP_DIR: Path to the top-level directory
+#   PKCS_PASSWORD_SOURCE: Where client PKCS#12 passwords come from, as for the certificate generator. PKCS_PASSWORD and
+#                         PKCS_PASSWORD_<CLIENT> are passed through from the host environment.
+#
+# Returns:
+#   None. The matching certificates are printed.
+#
+function certificate_inventory() {
+
+  check_images
+
+  # Make sure any old containers are cleaned up
+  podman rm -f certificate-inventory &>/dev/null || true
+
+  podman run \
+    --name certificate-inventory \
+    --rm \
+    --env CERT_DIRECTORY=/patches/${CERT_DIRECTORY} \
+    --env ROOT_CERT_DIRECTORY=${ROOT_CERT_DIRECTORY} \
+    --env PKCS_PASSWORD_SOURCE=${PKCS_PASSWORD_SOURCE} \
+    --env 'PKCS_PASSWORD*' \
+    --volume ${TOP_DIR}/${CERT_DIRECTORY}:/patches/${CERT_DIRECTORY}:Z \
+    --entrypoint python \
+    localhost/dell/patches-python:latest \
+    /app/patches_certs.py inventory "$@"
+}
+
 # check_images is responsible for checking if the required Patches images exist.
 #
 # Parameters:
@@ -1695,6 +1877,11 @@ while [[ $# -gt 0 ]]; do
       echo -e "${EXPLANATION_COLOR}                          if the PEM files have import passwords. The second option is to pass the path to a"
       echo -e "${EXPLANATION_COLOR}                          PKCS#12 file containing your server's certificate/private key and the trust chain."
       echo -e "${EXPLANATION_COLOR}                          The PKCS#12 file *can* contain a password."      
+      echo -e "${COMMAND_COLOR}  validate-keys${EXPLANATION_COLOR}           Checks every PKCS#12/PEM file in a directory against the root CA certs without"
+      echo -e "${EXPLANATION_COLOR}                          importing them. Expects the absolute path of the directory. Writes a JSON line per"
+      echo -e "${EXPLANATION_COLOR}                          file to \${TOP_DIR}/logs/validation_report.jsonl"
+      echo -e "${COMMAND_COLOR}  inventory${EXPLANATION_COLOR}               Lists the certificates in the certificate directories. Accepts --expiring-within"
+      echo -e "${EXPLANATION_COLOR}                          <days>, --issued-by <CA name>, --name <name> and --format json to filter the list."
       echo -e "${COMMAND_COLOR}  restart-nginx${EXPLANATION_COLOR}           Restarts nginx only. This can be necessary if patches-backend changes IP."
       echo -e "${COMMAND_COLOR}  version${EXPLANATION_COLOR}                 Prints the Patches version."
       echo
@@ -1976,6 +2163,18 @@ logs)
 
     ;;
 
+  validate-keys)
+
+    validate_keys "$2"
+
+    ;;
+
+  inventory)
+
+    certificate_inventory "${@:2}"
+
+    ;;
+
   import-repository)
 
     while true; do
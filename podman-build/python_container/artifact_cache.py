@@ -0,0 +1,150 @@
+import hashlib
+import mmap
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from cryptography.x509 import Certificate
+
+from helper_functions import PrivateKey
+
+# Files at least this large are memory-mapped instead of read into memory. Only the PEM blocks that are actually parsed
+# are copied out of the mapping.
+MMAP_THRESHOLD = 1024 * 1024
+
+# Matches one PEM block. Group 1 is the label, for example CERTIFICATE or RSA PRIVATE KEY.
+PEM_BLOCK = re.compile(rb'-----BEGIN ([A-Z0-9 ]+)-----\r?\n.*?-----END \1-----\r?\n?', re.DOTALL)
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+def pem_blocks(data: Buffer) -> Iterator[Tuple[str, bytes]]:
+    """Walks the PEM blocks in a buffer in one pass.
+
+    Args:
+        data (bytes or mmap): The contents of a PEM file. A memory map is scanned in place.
+
+    Yields:
+        tuple: The label of each block (for example "CERTIFICATE") and the block itself as bytes.
+    """
+    for match in PEM_BLOCK.finditer(data):
+        yield match.group(1).decode('ascii'), match.group(0)
+
+
+class ArtifactCache:
+    """Loads the certificates and keys used by a run once and hands the same objects to every stage.
+
+    Every file is read once. Files of MMAP_THRESHOLD bytes or more are memory-mapped and only the PEM blocks that are
+    parsed are copied out of them, so asking for the first certificate of a large bundle does not load the whole
+    bundle. Parsed certificates and keys are kept for the rest of the run. Anything that rewrites a
+    file must call invalidate so the next reader sees the new contents.
+    """
+
+    def __init__(self):
+        self._buffers: Dict[str, Buffer] = {}
+        self._hashes: Dict[str, str] = {}
+        self._certificates: Dict[str, List[Certificate]] = {}
+        self._first_certificates: Dict[str, Certificate] = {}
+        self._private_keys: Dict[str, Optional[PrivateKey]] = {}
+
+    def read(self, path: str) -> Buffer:
+        """Returns the contents of a file, reading it on first use.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            bytes or mmap: The contents of the file. Large files are returned as a read-only memory map.
+        """
+        if path not in self._buffers:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= MMAP_THRESHOLD:
+                    self._buffers[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self._buffers[path] = f.read()
+        return self._buffers[path]
+
+    def sha256(self, path: str) -> str:
+        """Returns the hex encoded SHA256 of a file's contents."""
+        if path not in self._hashes:
+            self._hashes[path] = hashlib.sha256(self.read(path)).hexdigest()
+        return self._hashes[path]
+
+    def certificates(self, path: str) -> List[Certificate]:
+        """Returns every certificate in a PEM file, parsing them on first use.
+
+        Args:
+            path (str): The path of the PEM file.
+
+        Returns:
+            list: The certificates in the order they appear in the file.
+        """
+        if path not in self._certificates:
+            self._certificates[path] = [x509.load_pem_x509_certificate(block, default_backend())
+                                        for label, block in pem_blocks(self.read(path)) if label == 'CERTIFICATE']
+        return self._certificates[path]
+
+    def certificate(self, path: str) -> Certificate:
+        """Returns the first certificate in a PEM file.
+
+        Only the first certificate is parsed unless certificates was already called for the file.
+
+        Args:
+            path (str): The path of the PEM file.
+
+        Raises:
+            ValueError: If the file does not contain a certificate.
+
+        Returns:
+            Certificate: The first certificate in the file.
+        """
+        if path not in self._first_certificates:
+            if path in self._certificates:
+                certificate = next(iter(self._certificates[path]), None)
+            else:
+                certificate = next((x509.load_pem_x509_certificate(block, default_backend())
+                                    for label, block in pem_blocks(self.read(path)) if label == 'CERTIFICATE'), None)
+            if certificate is None:
+                raise ValueError(f"No certificate found in {path}.")
+            self._first_certificates[path] = certificate
+        return self._first_certificates[path]
+
+    def private_key(self, path: str) -> Optional[PrivateKey]:
+        """Returns the unencrypted private key in a PEM file, parsing it on first use.
+
+        Args:
+            path (str): The path of the PEM file.
+
+        Returns:
+            PrivateKey: The first private key in the file, or None if the file has no private key or it is encrypted.
+        """
+        if path not in self._private_keys:
+            private_key = None
+            for label, block in pem_blocks(self.read(path)):
+                if label.endswith('PRIVATE KEY'):
+                    try:
+                        private_key = load_pem_private_key(block, password=None, backend=default_backend())
+                    except (ValueError, TypeError):
+                        pass
+                    break
+            self._private_keys[path] = private_key
+        return self._private_keys[path]
+
+    def invalidate(self, path: str) -> None:
+        """Forgets everything loaded from a file so it is read again on next use.
+
+        Args:
+            path (str): The path of the file that changed.
+
+        Returns:
+            None
+        """
+        buffer = self._buffers.pop(path, None)
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+        for cache in (self._hashes, self._certificates, self._first_certificates, self._private_keys):
+            cache.pop(path, None)
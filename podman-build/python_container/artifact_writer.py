@@ -0,0 +1,214 @@
+"""
+Crash-safe writing of the files of issued certificates.
+
+All the files of one certificate (.key, .csr, .crt, .pem and .p12) are first written to a private staging directory
+next to their destination. Files holding a private key are created with mode 0600 so they are never readable by
+anyone else, not even briefly. Once every file of the certificate is complete, each one is moved into place with its
+own rename, so no file is ever half written. The set as a whole is not replaced atomically: a run interrupted while
+publishing can leave some new files next to some old ones. Publishing therefore creates a .<name>.publishing marker
+before the first rename and removes it after the last one, and `publish_interrupted` tells the reuse and incremental
+logic to issue such a certificate again instead of trusting its mixed files. Private keys are renamed last, so the
+marker is always in place while a new key sits next to an old certificate.
+
+Nothing is fsynced while certificates are issued. `ArtifactWriter.sync` flushes every published file and directory
+once at the end of the run, which is much faster than syncing each file of a large batch. Files are guaranteed to
+survive a power failure once sync returns.
+"""
+
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+from patches_logging import PatchesLogger
+
+logger = PatchesLogger.get_logger()
+
+# Staging directories are named .<certificate name>.<random>.staging inside the destination directory
+STAGING_SUFFIX = '.staging'
+
+# A .<certificate name>.publishing marker exists while the files of a certificate are being moved into place
+PUBLISHING_SUFFIX = '.publishing'
+
+PRIVATE_FILE_MODE = 0o600
+PUBLIC_FILE_MODE = 0o644
+
+
+class StagedArtifacts:
+    """The files of one certificate while they are being written. Created by `ArtifactWriter.begin`.
+
+    Use it as a context manager. The files are published when the with block finishes and discarded if it raises.
+    """
+
+    def __init__(self, writer: 'ArtifactWriter', directory: str, name: str):
+        self._writer = writer
+        self._directory = directory
+        self._staging_directory = tempfile.mkdtemp(prefix=f".{name}.", suffix=STAGING_SUFFIX, dir=directory)
+        self._name = name
+        self._files: List[Tuple[str, str, bool]] = []
+
+    def add(self, file_name: str, data: bytes, private: bool = False) -> str:
+        """Writes one file to the staging directory.
+
+        Args:
+            file_name (str): The name of the file in the destination directory.
+            data (bytes): The contents of the file.
+            private (bool): Whether the file holds a private key. Private files are created with mode 0600.
+
+        Returns:
+            str: The path the file will be published at.
+        """
+        with self.open(file_name, private) as f:
+            f.write(data)
+        return os.path.join(self._directory, file_name)
+
+    def open(self, file_name: str, private: bool = False) -> BinaryIO:
+        """Opens one file in the staging directory for writing, for contents that are written piece by piece.
+
+        Args:
+            file_name (str): The name of the file in the destination directory.
+            private (bool): Whether the file holds a private key. Private files are created with mode 0600.
+
+        Returns:
+            file: The staged file, opened in binary mode. Close it before publishing.
+        """
+        staged_path = os.path.join(self._staging_directory, file_name)
+        fd = os.open(staged_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                     PRIVATE_FILE_MODE if private else PUBLIC_FILE_MODE)
+        self._files.append((staged_path, os.path.join(self._directory, file_name), private))
+        return os.fdopen(fd, 'wb')
+
+    def publish(self) -> List[str]:
+        """Moves every staged file into the destination directory and removes the staging directory.
+
+        Each file is moved with its own rename, so the set is not replaced atomically. The publishing marker is
+        created before the first rename and removed after the last, and private files are moved last. See
+        `publish_interrupted`.
+
+        Returns:
+            list: The published paths, public files first, each group in the order it was added.
+        """
+        marker = _publishing_marker(self._directory, self._name)
+        os.close(os.open(marker, os.O_WRONLY | os.O_CREAT, PUBLIC_FILE_MODE))
+        published = []
+        for staged_path, destination, _ in sorted(self._files, key=lambda file: file[2]):
+            os.replace(staged_path, destination)
+            published.append(destination)
+        os.remove(marker)
+        os.rmdir(self._staging_directory)
+        self._writer.record(published)
+        return published
+
+    def discard(self) -> None:
+        """Removes the staging directory and everything in it. Nothing is published."""
+        shutil.rmtree(self._staging_directory, ignore_errors=True)
+
+    def __enter__(self) -> 'StagedArtifacts':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.publish()
+        else:
+            self.discard()
+
+
+class ArtifactWriter:
+    """Stages and publishes certificate files, and syncs everything it published once per run.
+
+    One writer is used for the whole run. Worker processes use their own writer and hand the paths they published to
+    the main process, which passes them to `record` so that `sync` covers them too.
+    """
+
+    def __init__(self):
+        self._published: List[str] = []
+
+    def begin(self, directory: str, name: str) -> StagedArtifacts:
+        """Starts writing the files of one certificate.
+
+        Args:
+            directory (str): The directory the files are published in.
+            name (str): The name of the certificate. Only used to name the staging directory.
+
+        Returns:
+            StagedArtifacts: The staging area for the certificate's files.
+        """
+        return StagedArtifacts(self, directory, name)
+
+    def record(self, paths: Iterable[str]) -> None:
+        """Adds published paths to the set that sync flushes."""
+        self._published.extend(paths)
+
+    def drain(self) -> List[str]:
+        """Returns the paths published so far and forgets them. Worker processes return these to the main process."""
+        published, self._published = self._published, []
+        return published
+
+    def sync(self) -> None:
+        """Flushes every published file, then every directory they were published in, to disk.
+
+        Returns:
+            None
+        """
+        directories = []
+        for path in dict.fromkeys(self._published):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            directory = os.path.dirname(os.path.abspath(path))
+            if directory not in directories:
+                directories.append(directory)
+        for directory in directories:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if self._published:
+            logger.info(f"Synced {len(directories)} directories and {len(set(self._published))} certificate files to "
+                        f"disk.")
+        self._published = []
+
+
+def _publishing_marker(directory: str, name: str) -> str:
+    """Returns the path of the marker that exists while the files of a certificate are being published."""
+    return os.path.join(directory, f".{name}{PUBLISHING_SUFFIX}")
+
+
+def publish_interrupted(directory: str, name: str) -> bool:
+    """Checks whether a run was interrupted while publishing the files of a certificate.
+
+    The files of such a certificate may be a mix of the previous and the new ones, so they must not be reused. The
+    marker stays until the certificate is published again.
+
+    Args:
+        directory (str): The directory the certificate's files are published in.
+        name (str): The name of the certificate, as given to `ArtifactWriter.begin`.
+
+    Returns:
+        bool: True if the certificate's files may be incomplete.
+    """
+    return os.path.exists(_publishing_marker(directory, name))
+
+
+def remove_stale_staging(directory: Optional[str]) -> None:
+    """Removes the staging directories an interrupted run left behind.
+
+    Only call this before any certificates are issued. It would remove the staging directories of a run in progress.
+    Publishing markers are left in place because they tell the next run which certificates to issue again.
+
+    Args:
+        directory (str, optional): The directory certificates are published in. Nothing happens if it does not exist.
+
+    Returns:
+        None
+    """
+    if not directory or not os.path.isdir(directory):
+        return
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if entry.startswith('.') and entry.endswith(STAGING_SUFFIX) and os.path.isdir(path):
+            logger.warning(f"Removing {path}, left behind by an interrupted run.")
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,197 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.x509 import Certificate
+
+from artifact_writer import publish_interrupted
+from helper_functions import PatchesLogger
+
+logger = PatchesLogger.get_logger()
+
+# The name of the manifest file kept in CERT_DIRECTORY
+MANIFEST_FILE_NAME = 'certificate_manifest.json'
+
+# Bump this if the layout of the manifest changes. Manifests with a different version are ignored.
+MANIFEST_VERSION = 1
+
+
+class CertificateManifest:
+    """Tracks the certificates issued by generate_certificates.py so reruns only issue what changed.
+
+    For every certificate the manifest records a hash of the config.yml inputs that produced it, the files written for
+    it, its serial number, its SHA256 fingerprint and its expiry. A certificate has to be issued again if it is new,
+    its inputs changed, any of its files are missing, its certificate file was replaced by something else (such as an
+    import), a run was interrupted while publishing them or it expires within the renewal window.
+
+    Attributes:
+        path (str): The path of the manifest file.
+        certificates (dict): The manifest entries keyed by certificate name.
+        secret (str): A random hex key kept in the manifest. PKCS#12 passwords are hashed with an HMAC under this key,
+                      so a changed password reissues the certificate without the password being stored.
+        passwords_prompted (bool): Whether the PKCS#12 passwords are prompted for. See input_hash.
+    """
+
+    def __init__(self, cert_directory: str, passwords_prompted: bool = False):
+        self.path = os.path.join(cert_directory, MANIFEST_FILE_NAME)
+        self.certificates = {}
+        self.secret = None
+        self.passwords_prompted = passwords_prompted
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.certificates = data.get('certificates', {})
+                self.secret = data.get('secret')
+            else:
+                logger.warning(f"Ignoring {self.path} because it was written by a different version of the "
+                               f"certificate generator. All certificates will be issued.")
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {e}. All certificates will be issued.")
+
+        # Manifests written before passwords were tracked have no secret. Their client entries were hashed without the
+        # password, so those certificates are issued once more and recorded with it.
+        if self.secret is None:
+            self.secret = secrets.token_hex(32)
+
+    def _password_digest(self, password: Optional[str]) -> Optional[str]:
+        """Returns the HMAC of a PKCS#12 password under the manifest secret, or None if there is no password."""
+        if not password:
+            return None
+        return hmac.new(bytes.fromhex(self.secret), password.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def _fingerprint(crt_file: str) -> Optional[str]:
+        """Returns the hex encoded SHA256 fingerprint of a PEM certificate file, or None if it cannot be read."""
+        try:
+            with open(crt_file, 'rb') as f:
+                certificate = x509.load_pem_x509_certificate(f.read(), default_backend())
+        except (OSError, ValueError):
+            return None
+        return certificate.fingerprint(hashes.SHA256()).hex()
+
+    def input_hash(self, cert_args: dict, root_cert: Optional[Certificate] = None) -> str:
+        """Hashes the inputs that determine the contents of a certificate.
+
+        The key pool and the CSR option are left out because they do not change the certificate itself. The PKCS#12
+        password is included as an HMAC under the manifest secret so that changing it, or switching to or from no
+        password, exports the .p12 again. Prompted passwords are only asked for the certificates being issued, so
+        when passwords are prompted only that fact is hashed. The root CA fingerprint is included so that replacing
+        the root CA reissues every certificate it signed.
+
+        Args:
+            cert_args (dict): The keyword arguments used to create the certificate.
+            root_cert (Certificate, optional): The certificate of the CA that signs the certificate. None for the root
+                                               CA itself.
+
+        Returns:
+            str: The hex encoded SHA256 of the inputs.
+        """
+        inputs = {key: value for key, value in cert_args.items() if key not in ('password', 'key_pool', 'write_csr')}
+        if 'password' in cert_args:
+            inputs['password'] = 'prompt' if self.passwords_prompted else self._password_digest(cert_args['password'])
+        if inputs.get('key_profile') is not None:
+            inputs['key_profile'] = inputs['key_profile'].name
+        if root_cert is not None:
+            inputs['root_ca'] = root_cert.fingerprint(hashes.SHA256()).hex()
+
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def needs_issue(self, name: str, inputs_hash: str, renew_days: int) -> Optional[str]:
+        """Checks whether a certificate has to be issued.
+
+        Args:
+            name (str): The name of the certificate.
+            inputs_hash (str): The hash of the current inputs. See input_hash.
+            renew_days (int): Certificates expiring within this many days are issued again.
+
+        Returns:
+            str: Why the certificate has to be issued ("new", "changed", "missing", "interrupted", "replaced" or
+                 "expiring"), or None if the existing certificate is current.
+        """
+        entry = self.certificates.get(name)
+        if entry is None:
+            return 'new'
+        if entry['inputs_hash'] != inputs_hash:
+            return 'changed'
+        if not all(os.path.isfile(file) for file in entry['files']):
+            return 'missing'
+        if publish_interrupted(os.path.dirname(entry['files'][0]), name):
+            return 'interrupted'
+        # Entries written before fingerprints were recorded have none, so those certificates are issued once more
+        if self._fingerprint(entry.get('certificate', entry['files'][1])) != entry.get('fingerprint'):
+            return 'replaced'
+        not_valid_after = datetime.fromisoformat(entry['not_valid_after'])
+        if not_valid_after - datetime.now(timezone.utc) < timedelta(days=renew_days):
+            return 'expiring'
+        return None
+
+    def record(self, name: str, inputs_hash: str, crt_file: str, files: List[str]) -> None:
+        """Records a newly issued certificate.
+
+        Args:
+            name (str): The name of the certificate.
+            inputs_hash (str): The hash of the inputs the certificate was issued from. See input_hash.
+            crt_file (str): The path of the certificate in PEM format. The serial and expiry are read from it.
+            files (list): All files written for the certificate.
+
+        Returns:
+            None
+        """
+        with open(crt_file, 'rb') as f:
+            certificate = x509.load_pem_x509_certificate(f.read(), default_backend())
+
+        self.certificates[name] = {
+            'inputs_hash': inputs_hash,
+            'certificate': crt_file,
+            'fingerprint': certificate.fingerprint(hashes.SHA256()).hex(),
+            'serial': format(certificate.serial_number, 'x'),
+            'not_valid_after': certificate.not_valid_after_utc.isoformat(),
+            'files': files,
+        }
+
+    def prune(self, names: Iterable[str]) -> None:
+        """Forgets the certificates that are no longer in config.yml.
+
+        The files of a removed certificate are left where they are. Only its manifest entry is dropped, so the
+        manifest does not grow with every client that was ever configured.
+
+        Args:
+            names (iterable): The names of every certificate the current config.yml describes.
+
+        Returns:
+            None
+        """
+        removed = sorted(set(self.certificates) - set(names))
+        for name in removed:
+            del self.certificates[name]
+        if removed:
+            logger.info(f"Removed {', '.join(removed)} from {self.path} because they are no longer in config.yml.")
+
+    def save(self) -> None:
+        """Writes the manifest to disk.
+
+        The manifest is written to a temporary file first and renamed into place so an interrupted run never leaves a
+        truncated manifest behind. It holds the password HMAC secret, so only the owner can read it.
+
+        Returns:
+            None
+        """
+        temp_path = f"{self.path}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'secret': self.secret, 'certificates': self.certificates}, f,
+                      indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
@@ -6,71 +6,230 @@ a file named 'nginx.conf' in the directory specified by the SCRIPT_DIR environme
 
 import argparse
 import os
+from typing import List, Optional
 
-from jinja2 import Environment, FileSystemLoader
-
-# Set up argument parser
-parser = argparse.ArgumentParser(description='Generates an Nginx configuration file using Jinja2 templating.')
-parser.add_argument('--server-name', required=True, help='The domain name of the server (just the name)')
-parser.add_argument('--server-domain', required=True, help='The top-level domain of the server')
-parser.add_argument('--ipv4-address', required=True, help='The IPv4 address of the server')
-parser.add_argument('--nginx-config-dir', required=True, help='The directory in which to write the resulting Nginx '
-                                                              'configuration file')
-parser.add_argument('--server-cert', required=True, help='Name of the server certificate file')
-parser.add_argument('--server-key', required=True, help='Name of the server private key file')
-parser.add_argument('--server-ca', required=True, help='Name of the server CA certificate file')
-parser.add_argument('--root-cert-dir', required=True, help='Directory containing root CA certificates')
-parser.add_argument('--root-cert-path', required=True, help='The path to the root certificate')
-parser.add_argument('--cert-dir', required=True, help='Directory containing client certificates')
-parser.add_argument('--frontend-port', required=True, type=int, help='Port number for the ReactJS frontend')
-parser.add_argument('--backend-port', required=True, type=int, help='Port number for the NodeJS backend')
-parser.add_argument('--disable-client-cert-auth', action='store_true',
-                    help='Turns off client certificate authentication to use Patches. '
-                         'The certificate is still required for the admin page.')
-
-parser.add_argument('--disable-client-cert-request', action='store_true',
-                    help='Turns off requests for client certificates. This will stop Patches '
-                         'from prompting users for a certificate when they come to the website. '
-                         'This will also disable client certificate authentication.')
-
-# Parse arguments
-args = parser.parse_args()
-
-# Define variables
-dns_1 = args.server_name + '.' + args.server_domain
-ip_1 = args.ipv4_address
-nginx_config_dir = args.nginx_config_dir
-server_cert = args.server_cert
-server_key = args.server_key
-server_ca = args.server_ca
-root_cert_dir = args.root_cert_dir
-root_cert_path = args.root_cert_path
-cert_dir = args.cert_dir
-frontend_port = args.frontend_port
-backend_port = args.backend_port
-disable_client_cert_auth = args.disable_client_cert_auth
-disable_client_cert_request = args.disable_client_cert_request
-
-# Load Jinja2 template
-env = Environment(loader=FileSystemLoader('.'))
-template = env.get_template('nginx.conf.j2')
-
-# Render template with variables
-config = template.render(
-    dns_1=dns_1,
-    ip_1=ip_1,
-    server_cert=server_cert,
-    server_key=server_key,
-    server_ca=server_ca,
-    root_cert_dir=root_cert_dir,
-    root_cert_path=root_cert_path,
-    cert_dir=cert_dir,
-    frontend_port=frontend_port,
-    backend_port=backend_port,
-    disable_client_cert_auth=disable_client_cert_auth,
-    disable_client_cert_request=disable_client_cert_request
-)
-
-# Write rendered template to file
-with open(os.path.join(nginx_config_dir, 'nginx.conf'), 'w') as f:
-    f.write(config)
+# The TLS profiles nginx.conf.j2 can render. baseline leaves the TLS settings at the nginx defaults. performance limits
+# the protocols to TLS 1.2 and 1.3, adds a shared TLS session cache so returning browsers resume their session instead
+# of repeating the full handshake and client certificate verification, and turns on HTTP/2.
+TLS_PROFILES = ('baseline', 'performance')
+
+# The maximum number of simultaneous connections per worker process unless --worker-connections is given. Every proxied
+# request holds a client and an upstream connection.
+DEFAULT_WORKER_CONNECTIONS = 4096
+
+# The access log profiles and the name of the log_format each one renders. full logs both client certificate PEMs on
+# every request. compact logs one short line with the client certificate serial and fingerprint and the upstream
+# timings. json logs the same fields as one JSON object per line for log ingestion.
+LOG_PROFILES = {'full': 'custom', 'compact': 'compact', 'json': 'json'}
+
+# How the backend and frontend upstream pools pick a server, mapped to the nginx directive that selects the method.
+# round-robin is the nginx default and needs no directive.
+LOAD_BALANCING_METHODS = {'round-robin': None, 'least-conn': 'least_conn', 'ip-hash': 'ip_hash'}
+
+
+def upstream_servers(servers: Optional[str], default_host: str, port: int) -> List[str]:
+    """Returns the servers of an upstream pool.
+
+    Args:
+        servers (str, optional): Comma separated host:port pairs. A host without a port uses the given port.
+        default_host (str): The only server of the pool when servers is empty.
+        port (int): The port of the default host and of hosts given without a port.
+
+    Returns:
+        list: The host:port of every server in the pool.
+    """
+    hosts = [host.strip() for host in (servers or '').split(',') if host.strip()] or [default_host]
+    return [host if ':' in host else f"{host}:{port}" for host in hosts]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the command line parser for configure_nginx.
+
+    Returns:
+        ArgumentParser: The parser. patches_certs.py uses it for the render-nginx subcommand.
+    """
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description='Generates an Nginx configuration file using Jinja2 templating.')
+    parser.add_argument('--server-name', required=True, help='The domain name of the server (just the name)')
+    parser.add_argument('--server-domain', required=True, help='The top-level domain of the server')
+    parser.add_argument('--ipv4-address', required=True, help='The IPv4 address of the server')
+    parser.add_argument('--nginx-config-dir', required=True, help='The directory in which to write the resulting Nginx '
+                                                                  'configuration file')
+    parser.add_argument('--server-cert', required=True, help='Name of the server certificate file')
+    parser.add_argument('--server-key', required=True, help='Name of the server private key file')
+    parser.add_argument('--server-ca', required=True, help='Name of the server CA certificate file')
+    parser.add_argument('--root-cert-dir', required=True, help='Directory containing root CA certificates')
+    parser.add_argument('--root-cert-path', required=True, help='The path to the root certificate')
+    parser.add_argument('--cert-dir', required=True, help='Directory containing client certificates')
+    parser.add_argument('--frontend-port', required=True, type=int, help='Port number for the ReactJS frontend')
+    parser.add_argument('--backend-port', required=True, type=int, help='Port number for the NodeJS backend')
+    parser.add_argument('--disable-client-cert-auth', action='store_true',
+                        help='Turns off client certificate authentication to use Patches. '
+                             'The certificate is still required for the admin page.')
+
+    parser.add_argument('--disable-client-cert-request', action='store_true',
+                        help='Turns off requests for client certificates. This will stop Patches '
+                             'from prompting users for a certificate when they come to the website. '
+                             'This will also disable client certificate authentication.')
+
+    parser.add_argument('--client-identity-headers', action='store_true',
+                        help='Forward the subject, issuer, serial, fingerprint and verification result of the client '
+                             'certificate in X-SSL-Client-* headers instead of the whole certificate in X-SSL-CERT. '
+                             'The backend must run with CLIENT_IDENTITY_HEADERS=true.')
+
+    parser.add_argument('--tls-profile', choices=TLS_PROFILES, default='baseline',
+                        help='baseline keeps the nginx TLS defaults. performance allows only TLS 1.2 and 1.3, caches '
+                             'TLS sessions so reconnecting browsers skip the full handshake and turns on HTTP/2. '
+                             'Defaults to baseline.')
+    parser.add_argument('--ssl-session-cache-size', type=int, default=10,
+                        help='The size of the shared TLS session cache in megabytes. One megabyte holds about 4000 '
+                             'sessions. Only used by the performance profile. Defaults to 10.')
+    parser.add_argument('--ssl-session-timeout', default='1h',
+                        help='How long a cached TLS session can be resumed, in nginx time units. Only used by the '
+                             'performance profile. Defaults to 1h.')
+    parser.add_argument('--ssl-session-tickets', action='store_true',
+                        help='Also resume TLS 1.2 sessions with session tickets. The ticket key only changes when '
+                             'nginx restarts, which weakens forward secrecy, so this is off by default.')
+    parser.add_argument('--worker-processes', type=int, default=None,
+                        help='The number of nginx worker processes. Defaults to auto, which lets nginx start one '
+                             'worker per CPU available to the nginx container.')
+    parser.add_argument('--worker-connections', type=int, default=DEFAULT_WORKER_CONNECTIONS,
+                        help=f'The maximum number of simultaneous connections per nginx worker process. Defaults '
+                             f'to {DEFAULT_WORKER_CONNECTIONS}.')
+
+    parser.add_argument('--log-profile', choices=list(LOG_PROFILES), default='full',
+                        help='The access log format. full logs both client certificate PEMs on every request, compact '
+                             'one line with the certificate serial and fingerprint and the upstream timings, json the '
+                             'same fields as JSON. Defaults to full.')
+    parser.add_argument('--access-log-buffer', default=None,
+                        help='Buffer access log writes up to this size, for example 64k, instead of writing every '
+                             'request. Defaults to writing every request right away.')
+    parser.add_argument('--access-log-flush', default='5s',
+                        help='Write buffered access log lines at least this often. Only used with --access-log-buffer. '
+                             'Defaults to 5s.')
+    parser.add_argument('--access-log-gzip', type=int, choices=range(0, 10), default=0, metavar='LEVEL',
+                        help='Compress buffered access log writes with this gzip level, 1 to 9. Only used with '
+                             '--access-log-buffer and only useful when the access log is a file. The nginx image sends it to stdout. Defaults to 0 (off).')
+
+    parser.add_argument('--static-root', default=None,
+                        help='Serve the built frontend directly from this directory. The content hashed bundles under '
+                             '/static/ are cached by browsers for a year, other files are revalidated and gzip '
+                             'compressed. Only requests that match no file, such as the SPA index and its client side '
+                             'routes, are proxied to the frontend. Without it every request is proxied.')
+    parser.add_argument('--static-precompressed', action='store_true',
+                        help='Serve the .gz file next to a static file, if there is one, instead of compressing the '
+                             'file on every request. Only used with --static-root.')
+
+    parser.add_argument('--backend-servers', default=None,
+                        help='Comma separated host:port pairs of the backend instances requests to /api are balanced '
+                             'across. Defaults to patches-backend on --backend-port.')
+    parser.add_argument('--frontend-servers', default=None,
+                        help='Comma separated host:port pairs of the frontend instances. Defaults to patches-frontend '
+                             'on --frontend-port.')
+    parser.add_argument('--load-balancing', choices=list(LOAD_BALANCING_METHODS), default='round-robin',
+                        help='How requests are spread across several backend or frontend instances. Defaults to '
+                             'round-robin.')
+    parser.add_argument('--upstream-keepalive', type=int, default=0,
+                        help='The number of idle connections each nginx worker keeps open to each upstream pool so '
+                             'requests reuse them instead of connecting, and for the backend doing a TLS handshake, '
+                             'every time. Defaults to 0 (off), which opens a new connection for every request.')
+    parser.add_argument('--upstream-keepalive-timeout', default='60s',
+                        help='How long an idle upstream connection is kept open. Only used with --upstream-keepalive. '
+                             'Defaults to 60s.')
+    parser.add_argument('--proxy-connect-timeout', default=None,
+                        help='How long to wait for a connection to the backend or frontend. Defaults to the nginx '
+                             'default of 60s.')
+    parser.add_argument('--proxy-read-timeout', default=None,
+                        help='How long to wait between two reads of a response. Defaults to the nginx default of 60s.')
+    parser.add_argument('--proxy-send-timeout', default=None,
+                        help='How long to wait between two writes of a request. Defaults to the nginx default of 60s.')
+    parser.add_argument('--proxy-buffer-size', default=None,
+                        help='The size of the buffer for the response headers, for example 16k. Defaults to the nginx '
+                             'default of one memory page.')
+    parser.add_argument('--proxy-buffers', default=None,
+                        help='The number and size of the buffers for a response body, for example "8 16k". Defaults '
+                             'to the nginx default of 8 buffers of one memory page.')
+    parser.add_argument('--proxy-busy-buffers-size', default=None,
+                        help='How much of a response can be busy being sent to the client while it is still being '
+                             'read, for example 32k. Defaults to the nginx default of two buffers.')
+    return parser
+
+
+def render_nginx_config(args: argparse.Namespace) -> str:
+    """Renders nginx.conf.j2 with the values from the command line.
+
+    Args:
+        args (Namespace): The parsed command line arguments.
+
+    Returns:
+        str: The rendered Nginx configuration.
+    """
+    # jinja2 is only needed here so the other patches_certs subcommands never import it
+    from jinja2 import Environment, FileSystemLoader
+
+    # Load Jinja2 template
+    env = Environment(loader=FileSystemLoader('.'))
+    template = env.get_template('nginx.conf.j2')
+
+    # Render template with variables
+    return template.render(
+        dns_1=args.server_name + '.' + args.server_domain,
+        ip_1=args.ipv4_address,
+        server_cert=args.server_cert,
+        server_key=args.server_key,
+        server_ca=args.server_ca,
+        root_cert_dir=args.root_cert_dir,
+        root_cert_path=args.root_cert_path,
+        cert_dir=args.cert_dir,
+        frontend_port=args.frontend_port,
+        backend_port=args.backend_port,
+        disable_client_cert_auth=args.disable_client_cert_auth,
+        disable_client_cert_request=args.disable_client_cert_request,
+        client_identity_headers=args.client_identity_headers,
+        static_root=args.static_root,
+        static_precompressed=args.static_precompressed,
+        log_profile=args.log_profile,
+        log_format=LOG_PROFILES[args.log_profile],
+        access_log_buffer=None if args.access_log_buffer in (None, '', '0') else args.access_log_buffer,
+        access_log_flush=args.access_log_flush,
+        access_log_gzip=args.access_log_gzip,
+        tls_profile=args.tls_profile,
+        ssl_session_cache_size=args.ssl_session_cache_size,
+        ssl_session_timeout=args.ssl_session_timeout,
+        ssl_session_tickets=args.ssl_session_tickets,
+        worker_processes=args.worker_processes or 'auto',
+        worker_connections=args.worker_connections,
+        backend_servers=upstream_servers(args.backend_servers, 'patches-backend', args.backend_port),
+        frontend_servers=upstream_servers(args.frontend_servers, 'patches-frontend', args.frontend_port),
+        load_balancing=LOAD_BALANCING_METHODS[args.load_balancing],
+        upstream_keepalive=args.upstream_keepalive,
+        upstream_keepalive_timeout=args.upstream_keepalive_timeout,
+        proxy_connect_timeout=args.proxy_connect_timeout,
+        proxy_read_timeout=args.proxy_read_timeout,
+        proxy_send_timeout=args.proxy_send_timeout,
+        proxy_buffer_size=args.proxy_buffer_size,
+        proxy_buffers=args.proxy_buffers,
+        proxy_busy_buffers_size=args.proxy_busy_buffers_size
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Writes nginx.conf into the directory given by --nginx-config-dir.
+
+    Args:
+        argv (list, optional): The command line arguments without the program name. Defaults to sys.argv.
+
+    Returns:
+        int: The exit status.
+    """
+    args = build_parser().parse_args(argv)
+    config = render_nginx_config(args)
+
+    # Write rendered template to file
+    with open(os.path.join(args.nginx_config_dir, 'nginx.conf'), 'w') as f:
+        f.write(config)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -15,7 +15,7 @@ export FRONTEND_PORT="${FRONTEND_PORT}"
 
 # SERVER_CA, ROOT_CERT_DIRECTORY, and CERT_DIRECTORY are currently unused but I included them here because they may
 # be useful in the future.
-command=("python" "configure_nginx.py" "--server-name" "${SERVER_NAME}" "--server-domain" "${SERVER_DOMAIN}" "--ipv4-address" "${IPV4_ADDRESS}")
+command=("python" "patches_certs.py" "render-nginx" "--server-name" "${SERVER_NAME}" "--server-domain" "${SERVER_DOMAIN}" "--ipv4-address" "${IPV4_ADDRESS}")
 command+=("--nginx-config-dir" "/app/nginx_config" "--server-cert" "${SERVER_CERT}" "--server-key" "${SERVER_KEY}")
 command+=("--server-ca" "${SERVER_CA}" "--root-cert-dir" "${ROOT_CERT_DIRECTORY}" "--root-cert-path" "${ROOT_CERT_PATH}")
 command+=("--cert-dir" "${CERT_DIRECTORY}" "--backend-port" "${BACKEND_PORT}" "--frontend-port" "${FRONTEND_PORT}")
@@ -28,4 +28,56 @@ if [[ "${DISABLE_CLIENT_CERT_REQUEST}" == 'true' ]]; then
   command+=("--disable-client-cert-request")
 fi
 
+if [[ "${CLIENT_IDENTITY_HEADERS}" == 'true' ]]; then
+  command+=("--client-identity-headers")
+fi
+
+if [ -n "${NGINX_TLS_PROFILE}" ]; then
+  command+=("--tls-profile" "${NGINX_TLS_PROFILE}")
+fi
+
+if [ -n "${NGINX_WORKER_PROCESSES}" ]; then
+  command+=("--worker-processes" "${NGINX_WORKER_PROCESSES}")
+fi
+
+if [ -n "${NGINX_WORKER_CONNECTIONS}" ]; then
+  command+=("--worker-connections" "${NGINX_WORKER_CONNECTIONS}")
+fi
+
+if [[ "${NGINX_STATIC_FRONTEND}" == 'true' ]]; then
+  command+=("--static-root" "/patches/frontend")
+fi
+
+if [[ "${NGINX_STATIC_PRECOMPRESSED}" == 'true' ]]; then
+  command+=("--static-precompressed")
+fi
+
+if [ -n "${NGINX_LOG_PROFILE}" ]; then
+  command+=("--log-profile" "${NGINX_LOG_PROFILE}")
+fi
+
+if [ -n "${NGINX_ACCESS_LOG_BUFFER}" ]; then
+  command+=("--access-log-buffer" "${NGINX_ACCESS_LOG_BUFFER}")
+fi
+
+if [ -n "${NGINX_ACCESS_LOG_GZIP}" ]; then
+  command+=("--access-log-gzip" "${NGINX_ACCESS_LOG_GZIP}")
+fi
+
+if [ -n "${NGINX_UPSTREAM_KEEPALIVE}" ]; then
+  command+=("--upstream-keepalive" "${NGINX_UPSTREAM_KEEPALIVE}")
+fi
+
+if [ -n "${NGINX_BACKEND_SERVERS}" ]; then
+  command+=("--backend-servers" "${NGINX_BACKEND_SERVERS}")
+fi
+
+if [ -n "${NGINX_FRONTEND_SERVERS}" ]; then
+  command+=("--frontend-servers" "${NGINX_FRONTEND_SERVERS}")
+fi
+
+if [ -n "${NGINX_LOAD_BALANCING}" ]; then
+  command+=("--load-balancing" "${NGINX_LOAD_BALANCING}")
+fi
+
 "${command[@]}"
@@ -1,27 +1,40 @@
 import argparse
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from getpass import getpass
 from ipaddress import IPv4Address
-from typing import Optional
+from typing import List, Optional, Tuple, Union
 
-import yaml
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from cryptography.hazmat.primitives import serialization
 from cryptography.x509 import Certificate
 from cryptography.x509.oid import NameOID
 
 from helper_functions import patches_read, combine_keys_to_pem, generate_pkcs12_certificate, PatchesLogger, \
-    update_config_file
+    update_config_fields, KeyProfile, PrivateKey, get_key_profile, signature_hash, \
+    private_key_format, DEFAULT_ROOT_CA_KEY_PROFILE, PKCS_PASSWORD_SOURCES, load_pkcs_passwords, Pkcs12Profile
+from artifact_writer import ArtifactWriter, publish_interrupted, remove_stale_staging
+from cert_manifest import CertificateManifest, MANIFEST_FILE_NAME
+from key_pool import KeyPool, generate_private_key, key_pool_from_environment
+from patches_config import ConfigError, load_config
+from timings import add_instrumentation_arguments, instrumented, timings
+from trust_store import authority_key_identifier_for
 
 # Get the logger instance
 logger = PatchesLogger.get_logger()
 
+# The root CA key and certificate, and the artifact writer, used by client certificate worker processes. See
+# _init_client_worker.
+_worker_root_key = None
+_worker_root_cert = None
+_worker_writer = None
 
-def create_root_ca(country, state, locality, organization_name, root_ca_name, root_cert_directory):
+
+def create_root_ca(country, state, locality, organization_name, root_ca_name, root_cert_directory, key_pool=None,
+                   key_profile=None, reuse_existing=None, writer=None):
     """Creates a new root Certificate Authority (CA) and private key.
 
     Args:
@@ -31,10 +44,18 @@ def create_root_ca(country, state, locality, organization_name, root_ca_name, ro
         organization_name (str): # The organization name for the certificate
         root_ca_name (str): The name of the root CA.
         root_cert_directory (str): The directory where the root CA certificates and keys will be stored.
+        key_pool (KeyPool, optional): The pool to take the private key from. Defaults to None, which generates the key
+                                      inline.
+        key_profile (KeyProfile, optional): The key algorithm profile of the root CA. Defaults to
+                                            DEFAULT_ROOT_CA_KEY_PROFILE.
+        reuse_existing (bool, optional): Whether to reuse existing root CA files. Defaults to None, which asks the
+                                         user.
+        writer (ArtifactWriter, optional): The run's artifact writer. Defaults to None, which uses a writer of its
+                                           own that is never synced.
 
     Returns:
-        Tuple of RSAPrivateKey and Certificate: The private key and root CA certificate in
-        cryptography.hazmat.primitives.asymmetric.rsa.RSAPrivateKey and cryptography.x509.Certificate formats,
+        Tuple of PrivateKey and Certificate: The private key and root CA certificate in
+        cryptography.hazmat.primitives.asymmetric private key and cryptography.x509.Certificate formats,
         respectively.
 
     """
@@ -50,12 +71,18 @@ def create_root_ca(country, state, locality, organization_name, root_ca_name, ro
     key_file = os.path.join(root_cert_directory, f'{root_ca_name}.key')
     crt_file = os.path.join(root_cert_directory, f'{root_ca_name}.crt')
     pem_file = os.path.join(root_cert_directory, f'{root_ca_name}.pem')
-    if os.path.isfile(key_file) and os.path.isfile(crt_file):
+    if publish_interrupted(root_cert_directory, root_ca_name):
+        logger.warning(f"An earlier run was interrupted while writing the {root_ca_name} files. They may not belong "
+                       f"together, so a new root CA will be created.")
+    elif os.path.isfile(key_file) and os.path.isfile(crt_file):
         # Check if user wants to use existing key and certificate files
         while True:
-            use_existing_files = patches_read(f"{key_file} and {crt_file} were found in "
-                                              f"{os.path.abspath(root_cert_directory)}. Do you want to use these files "
-                                              f"instead of creating new certificates? (yes/no): ")
+            if reuse_existing is None:
+                use_existing_files = patches_read(f"{key_file} and {crt_file} were found in "
+                                                  f"{os.path.abspath(root_cert_directory)}. Do you want to use these "
+                                                  f"files instead of creating new certificates? (yes/no): ")
+            else:
+                use_existing_files = 'yes' if reuse_existing else 'no'
             if use_existing_files.lower() == 'yes':
                 # Load key and certificate files
                 logger.info('Reading existing root CA certificate and private key...')
@@ -65,7 +92,6 @@ def create_root_ca(country, state, locality, organization_name, root_ca_name, ro
                     with open(key_file, 'rb') as f:
                         root_private_key = serialization.load_pem_private_key(f.read(), password=None,
                                                                               backend=default_backend())
-                    update_config_file('ROOT_CA_PEM', f"{root_ca_name}.pem")
                     logger.info('CA cert and key loaded successfully.')
                     return root_private_key, root_cert
                 except Exception as e:
@@ -78,9 +104,12 @@ def create_root_ca(country, state, locality, organization_name, root_ca_name, ro
 
     elif os.path.isfile(pem_file):
         while True:
-            use_existing = patches_read(
-                f"{pem_file} was found in {os.path.abspath(root_cert_directory)}. Do you want to use "
-                f"that file instead of creating a new certificate? (yes/no): ")
+            if reuse_existing is None:
+                use_existing = patches_read(
+                    f"{pem_file} was found in {os.path.abspath(root_cert_directory)}. Do you want to use "
+                    f"that file instead of creating a new certificate? (yes/no): ")
+            else:
+                use_existing = 'yes' if reuse_existing else 'no'
             if use_existing.lower() == "yes":
                 # Load PEM file
                 logger.info('Reading existing root CA certificate in PEM format...')
@@ -98,12 +127,13 @@ def create_root_ca(country, state, locality, organization_name, root_ca_name, ro
             else:
                 logger.info("Invalid input. Please enter 'yes' or 'no'")
 
+    if key_profile is None:
+        key_profile = get_key_profile(DEFAULT_ROOT_CA_KEY_PROFILE)
+
     # Generate private key
-    logger.info("Generating private key")
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=4096,
-    )
+    logger.info(f"Generating {key_profile.name} private key")
+    with timings.span('keygen', root_ca_name):
+        private_key = generate_private_key(key_profile, key_pool)
 
     # Create and sign the root certificate
     logger.info("Creating and signing the root certificate")
@@ -115,41 +145,70 @@ def create_root_ca(country, state, locality, organization_name, root_ca_name, ro
         x509.NameAttribute(NameOID.COMMON_NAME, root_ca_name),
     ])
 
-    public_key = (
-        x509.CertificateBuilder()
-            .subject_name(subject)
-            .issuer_name(issuer)
-            .public_key(private_key.public_key())
-            .serial_number(x509.random_serial_number())
-            .not_valid_before(datetime.utcnow())
-            .not_valid_after(datetime.utcnow() + timedelta(days=3650))
-            .add_extension(
-            x509.BasicConstraints(ca=True, path_length=None), critical=True,
-        ).sign(private_key, hashes.SHA256())
-    )
-
-    # Write the key and certificate to files
-    logger.info("Writing the key and certificate to files")
-    with open(key_file, 'wb') as f:
-        f.write(private_key.private_bytes(
+    with timings.span('sign', root_ca_name):
+        public_key = (
+            x509.CertificateBuilder()
+                .subject_name(subject)
+                .issuer_name(issuer)
+                .public_key(private_key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(datetime.utcnow())
+                .not_valid_after(datetime.utcnow() + timedelta(days=3650))
+                .add_extension(
+                x509.BasicConstraints(ca=True, path_length=None), critical=True,
+            ).add_extension(
+                x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()), critical=False,
+            ).sign(private_key, signature_hash(private_key, key_profile))
+        )
+
+    with timings.span('serialize', root_ca_name):
+        key_pem = private_key.private_bytes(
             encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            format=private_key_format(private_key),
             encryption_algorithm=serialization.NoEncryption(),
-        ))
-    with open(crt_file, 'wb') as f:
-        f.write(public_key.public_bytes(serialization.Encoding.PEM))
+        )
+        crt_pem = public_key.public_bytes(serialization.Encoding.PEM)
+        pem = combine_keys_to_pem(private_key, public_key)
 
-    logger.info("Concatenating the public and private keys into a single PEM file")
-    pem = combine_keys_to_pem(private_key, public_key)
-    with open(os.path.join(root_cert_directory, f"{root_ca_name}.pem"), "wb") as f:
-        f.write(pem)
-    update_config_file('ROOT_CA_PEM', f"{root_ca_name}.pem")
+    # Write the key, the certificate and the two concatenated into a single PEM file. They are published together.
+    logger.info("Writing the key and certificate to files")
+    with timings.span('write', root_ca_name):
+        with (writer or ArtifactWriter()).begin(root_cert_directory, root_ca_name) as staged:
+            staged.add(os.path.basename(key_file), key_pem, private=True)
+            staged.add(os.path.basename(crt_file), crt_pem)
+            staged.add(os.path.basename(pem_file), pem, private=True)
 
     return private_key, public_key
 
 
+def build_subject_alt_names(dns_1: Optional[str], dns_2: Optional[str] = None, ip_1: Optional[IPv4Address] = None,
+                            ip_2: Optional[IPv4Address] = None) -> Optional[x509.SubjectAlternativeName]:
+    """Builds the subject alternative name extension shared by the CSR and the certificate.
+
+    Args:
+        dns_1 (str, optional): The primary DNS name of the server/client.
+        dns_2 (str, optional): The secondary DNS name of the server/client. Defaults to None.
+        ip_1 (IPv4Address, optional): The primary IP address of the server/client. Defaults to None.
+        ip_2 (IPv4Address, optional): The secondary IP address of the server/client. Defaults to None.
+
+    Returns:
+        x509.SubjectAlternativeName: The extension, or None if no names were given.
+    """
+    names = []
+    if dns_1:
+        names.append(x509.DNSName(dns_1))
+    if dns_2:
+        names.append(x509.DNSName(dns_2))
+    if ip_1:
+        names.append(x509.IPAddress(ip_1))
+    if ip_2:
+        names.append(x509.IPAddress(ip_2))
+
+    return x509.SubjectAlternativeName(names) if names else None
+
+
 def create_ssl_cert(
-        root_private_key: RSAPrivateKey,
+        root_private_key: PrivateKey,
         root_cert: Certificate,
         cert_directory: str,
         host_name: str,
@@ -163,12 +222,17 @@ def create_ssl_cert(
         dns_2: Optional[str] = None,
         ip_1: Optional[IPv4Address] = None,
         ip_2: Optional[IPv4Address] = None,
-        password: bool = False) \
-        -> None:
+        password: Union[bool, str] = False,
+        key_pool: Optional[KeyPool] = None,
+        key_profile: Optional[KeyProfile] = None,
+        write_csr: bool = False,
+        pkcs12_profile: Optional[Pkcs12Profile] = None,
+        writer: Optional[ArtifactWriter] = None) \
+        -> float:
     """Creates a new SSL/TLS certificate for a server/client using a root CA.
 
     Args:
-        root_private_key (RSAPrivateKey): The name of the root CA.
+        root_private_key (PrivateKey): The name of the root CA.
         root_cert (Certificate): The name of the directory where the root certificates are stored
         cert_directory (str): The directory where the SSL/TLS certificates and keys will be stored.
         host_name (str): The host_name of the server
@@ -182,277 +246,553 @@ def create_ssl_cert(
         dns_2 (str, optional): The secondary DNS name of the server/client. Defaults to None.
         ip_1 (IPv4Address, optional): The primary IP address of the server/client. Defaults to None.
         ip_2 (IPv4Address, optional): The secondary IP address of the server/client. Defaults to None.
-        password (bool): Indicates whether the user does or does not want to enter a PKCS password
+        password (bool or str): Either the PKCS#12 password to use or a bool indicating whether the user does or does
+                                not want to be prompted for a PKCS password
+        key_pool (KeyPool, optional): The pool to take the private key from. Defaults to None, which generates the key
+                                      inline.
+        key_profile (KeyProfile, optional): The key algorithm profile of the certificate. Defaults to
+                                            DEFAULT_KEY_PROFILE.
+        write_csr (bool): Whether to also write a CSR for the key. The certificate itself is always issued directly
+                          from the key. Defaults to False.
+        pkcs12_profile (Pkcs12Profile, optional): The encryption profile of the password protected PKCS#12 file.
+                                                  Defaults to None, which uses the best available encryption.
+        writer (ArtifactWriter, optional): The run's artifact writer. Defaults to None, which uses a writer of its
+                                           own that is never synced.
 
     Returns:
-        None
+        float: The time in seconds spent serializing the PKCS#12 file.
     """
 
     logger.info(f"Processing {dns_1}...")
+    name = host_name.replace('*.', '')
+
+    if key_profile is None:
+        key_profile = get_key_profile(None)
 
-    logger.info("Creating private key...")
+    logger.info(f"Creating {key_profile.name} private key...")
 
-    # Generate an RSA key
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-    )
+    # Take a key from the pool or generate one
+    with timings.span('keygen', name):
+        private_key = generate_private_key(key_profile, key_pool)
 
-    # Write the key to a file. We replace *. to take care of the wildcard for the certificate generation
-    with open(os.path.join(cert_directory, f"{host_name.replace('*.', '')}.key"), "wb") as f:
-        f.write(private_key.private_bytes(
+    with timings.span('serialize', name):
+        key_pem = private_key.private_bytes(
             encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            format=private_key_format(private_key),
             encryption_algorithm=serialization.NoEncryption(),
-        ))
-
-    logger.info("Created the private key")
+        )
 
-    logger.info("Creating CSR...")
+    # Every file of the certificate is staged and only published once all of them are complete. If anything fails
+    # the staging directory is left behind and removed by the next run. We replace *. to take care of the wildcard
+    # for the certificate generation
+    staged = (writer or ArtifactWriter()).begin(cert_directory, name)
+    with timings.span('write', name):
+        staged.add(f"{name}.key", key_pem, private=True)
 
-    # Create a new CSR object
-    csr_builder = x509.CertificateSigningRequestBuilder()
+    logger.info("Created the private key")
 
-    # Set the subject name of the CSR
-    logger.info("Setting CSR subject name...")
-    csr_builder = csr_builder.subject_name(x509.Name([
+    subject = x509.Name([
         x509.NameAttribute(x509.NameOID.COUNTRY_NAME, country),
         x509.NameAttribute(x509.NameOID.STATE_OR_PROVINCE_NAME, state),
         x509.NameAttribute(x509.NameOID.LOCALITY_NAME, locality),
         x509.NameAttribute(x509.NameOID.ORGANIZATION_NAME, organization_name),
         x509.NameAttribute(x509.NameOID.ORGANIZATIONAL_UNIT_NAME, organization_unit),
         x509.NameAttribute(x509.NameOID.COMMON_NAME, host_name)
-    ]))
+    ])
+    subject_alt_names = build_subject_alt_names(dns_1, dns_2, ip_1, ip_2)
 
-    # Set the extensions of the CSR
-    logger.info("Setting CSR extensions...")
-    names = []
-    if dns_1 is not None:
-        names.append(x509.DNSName(dns_1))
-    if dns_2 is not None:
-        names.append(x509.DNSName(dns_2))
-    if ip_1 is not None:
-        names.append(x509.IPAddress(ip_1))
-    if ip_2 is not None:
-        names.append(x509.IPAddress(ip_2))
-    if names:
-        csr_builder = csr_builder.add_extension(
-            x509.SubjectAlternativeName(names),
-            critical=False
-        )
+    if write_csr:
+        logger.info("Creating CSR...")
+        csr_builder = x509.CertificateSigningRequestBuilder().subject_name(subject)
+        if subject_alt_names is not None:
+            csr_builder = csr_builder.add_extension(subject_alt_names, critical=False)
 
-    # Sign the CSR using the private key
-    logger.info("Signing the CSR using the private key...")
-    csr = csr_builder.sign(private_key, hashes.SHA256(), default_backend())
+        # Sign the CSR using the private key
+        logger.info("Signing the CSR using the private key...")
+        with timings.span('csr', name):
+            csr = csr_builder.sign(private_key, signature_hash(private_key, key_profile), default_backend())
 
-    # Write the CSR to the file
-    logger.info("Writing the CSR to the file...")
-    # Replace *. to take care of the wildcard for the certificate generation
-    with open(os.path.join(cert_directory, f"{host_name.replace('*.', '')}.csr"), 'wb') as f:
-        f.write(csr.public_bytes(serialization.Encoding.PEM))
+        # Stage the CSR file. Replace *. to take care of the wildcard for the certificate generation
+        with timings.span('write', name):
+            staged.add(f"{name}.csr", csr.public_bytes(serialization.Encoding.PEM))
 
-    logger.info(f"Created CSR at {os.path.join(cert_directory, f'{host_name}.csr')}")
+        logger.info(f"Created CSR at {os.path.join(cert_directory, f'{host_name}.csr')}")
 
-    # Create the certificate by signing the CSR with the root certificate
-    logger.info("Creating the cert.conf file...")
+    # The key was generated locally so the certificate is issued straight from the key and subject. A CSR would only
+    # repeat the same information behind an extra signature.
+    logger.info("Creating the certificate...")
     builder = x509.CertificateBuilder()
-    builder = builder.subject_name(csr.subject)
+    builder = builder.subject_name(subject)
     builder = builder.issuer_name(root_cert.subject)
-    builder = builder.public_key(csr.public_key())
+    builder = builder.public_key(private_key.public_key())
     builder = builder.serial_number(x509.random_serial_number())
     builder = builder.not_valid_before(datetime.utcnow())
     builder = builder.not_valid_after(datetime.utcnow() + timedelta(days=days))
-    if dns_2 or ip_1 or ip_2:
-        san_list = [x509.DNSName(dns_1)]
-        if dns_2:
-            san_list.append(x509.DNSName(dns_2))
-        if ip_1:
-            san_list.append(x509.IPAddress(ip_1))
-        if ip_2:
-            san_list.append(x509.IPAddress(ip_2))
-        builder = builder.add_extension(
-            x509.SubjectAlternativeName(san_list),
-            critical=False,
-        )
+    if subject_alt_names is not None:
+        builder = builder.add_extension(subject_alt_names, critical=False)
+    # Key identifiers let import_keys.py find the issuer of a certificate with a single lookup
+    builder = builder.add_extension(x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()), critical=False)
+    builder = builder.add_extension(authority_key_identifier_for(root_cert), critical=False)
 
     # Sign the certificate using the root_key
-    public_key = builder.sign(root_private_key, hashes.SHA256(), default_backend())
+    with timings.span('sign', name):
+        public_key = builder.sign(root_private_key, signature_hash(root_private_key, key_profile), default_backend())
 
-    # Write the certificate to the file. Replace *. to take care of the wildcard for the certificate generation
-    with open(os.path.join(cert_directory, f"{host_name.replace('*.', '')}.crt"), "wb") as f:
-        f.write(public_key.public_bytes(serialization.Encoding.PEM))
+    with timings.span('serialize', name):
+        crt_pem = public_key.public_bytes(serialization.Encoding.PEM)
+        pem = combine_keys_to_pem(private_key, public_key)
 
-    # Concatenate the public and private keys into a single file. # Replace *. to take care of the wildcard for the
-    # certificate generation
-    pem = combine_keys_to_pem(private_key, public_key)
-    with open(os.path.join(cert_directory, f"{host_name.replace('*.', '')}.pem"), "wb") as f:
-        f.write(pem)
+    # Stage the certificate, then the public and private keys concatenated into a single file
+    with timings.span('write', name):
+        staged.add(f"{name}.crt", crt_pem)
+        staged.add(f"{name}.pem", pem, private=True)
 
     # Export to PKCS#12
-    if password:
+    if password is True:
+        PatchesLogger.flush()
         password = getpass(f"Enter the PKCS#12 password you want to use for the host {host_name}: ")
 
     logger.info("Writing the key to PKCS#12 because Firefox/Chrome do not support both cert/key in the same file"
                 " with PEM.")
-    pkcs12_cert = generate_pkcs12_certificate(f"{host_name.replace('*.', '')}", private_key, public_key, root_cert,
-                                              password)
-    with open(os.path.join(cert_directory, f"{host_name.replace('*.', '')}.p12"), "wb") as f:
-        f.write(pkcs12_cert)
-
-
-parser = argparse.ArgumentParser(description='Script for creating SSL/TLS certificates.')
-parser.add_argument('--cert-dir', dest='cert_dir', type=str, required=True, help='The directory where the SSL/TLS '
-                                                                                 'certificates and keys will be '
-                                                                                 'stored.')
-parser.add_argument('--root-cert-dir', dest='root_cert_dir', type=str, required=True, help='The directory where the '
-                                                                                           'root CA certificates and '
-                                                                                           'keys will be stored.')
-parser.add_argument('--ipv4-address', dest='ipv4_address', type=IPv4Address, required=True, help='IPv4 address on '
-                                                                                                 'which the nginx proxy'
-                                                                                                 ' will listen.')
-args = parser.parse_args()
-
-certs_directory = args.cert_dir
-root_certs_directory = args.root_cert_dir
-ipv4_address = args.ipv4_address
-
-yaml_data = None
-
-with open('config.yml', 'r') as stream:
-    try:
-        yaml_data = yaml.safe_load(stream)
-    except yaml.YAMLError as exc:
-        logger.error(exc)
-
-# Check if PATCHES_ADMINISTRATOR is present in clients
-logger.info("Checking to make sure PATCHES_ADMINISTRATOR is present in clients.")
-patches_administrator = yaml_data.get('PATCHES_ADMINISTRATOR')
-clients = yaml_data.get('clients')
-
-if patches_administrator not in clients:
-    logger.error(f"PATCHES_ADMINISTRATOR '{patches_administrator}' is not in the list of clients in config.yml."
-                 f" This is a fatal error. If you are generating certificates automatically, one of the clients "
-                 f"must be the PATCHES_ADMINISTRATOR. Please review config.yml and update clients accordingly.")
-    exit(1)
-
-logger.info("Creating the certificate directory.")
-if not os.path.exists(yaml_data['CERT_DIRECTORY']):
-    os.makedirs(yaml_data['CERT_DIRECTORY'])
-    logger.info(f"Created directory: {os.path.abspath(yaml_data['CERT_DIRECTORY'])}")
-else:
-    logger.info(f"Directory already exists: {os.path.abspath(yaml_data['CERT_DIRECTORY'])}")
-
-root_key, root_crt = create_root_ca(country=yaml_data['country'],
-                                    state=yaml_data['state'],
-                                    locality=yaml_data['locality'],
-                                    root_ca_name=f"{yaml_data['ROOT_CA_NAME']}.{yaml_data['ROOT_CA_DOMAIN']}",
-                                    organization_name=yaml_data['organization_name'],
-                                    root_cert_directory=os.path.join(certs_directory, root_certs_directory))
-
-logger.info(f"Creating the patches server certificate {yaml_data['SERVER_NAME']}.{yaml_data['SERVER_DOMAIN']}. This will be "
-            f"assigned to the nginx proxy...")
-
-create_ssl_cert(
-    root_private_key=root_key,
-    root_cert=root_crt,
-    cert_directory=certs_directory,
-    host_name=f"{yaml_data['SERVER_NAME']}.{yaml_data['SERVER_DOMAIN']}",
-    country=yaml_data['country'],
-    state=yaml_data['state'],
-    locality=yaml_data['locality'],
-    organization_name=yaml_data['organization_name'],
-    organization_unit=yaml_data['organization_unit'],
-    dns_1=f"{yaml_data['SERVER_NAME']}.{yaml_data['SERVER_DOMAIN']}",
-    dns_2=None,
-    ip_1=ipv4_address,
-    ip_2=None,
-    days=yaml_data['days'])
-
-logger.info("Updating config.yml with the new SERVER_NAME values...")
-
-update_config_file('SERVER_PEM', f"{yaml_data['SERVER_NAME']}.{yaml_data['SERVER_DOMAIN']}.pem")
-update_config_file('PKCS_FILE', f"{yaml_data['SERVER_NAME']}.{yaml_data['SERVER_DOMAIN']}.p12")
-
-logger.info("Creating the patches backend certificate...")
-
-create_ssl_cert(
-    root_private_key=root_key,
-    root_cert=root_crt,
-    cert_directory=certs_directory,
-    host_name=f"{yaml_data['BACKEND_CERT_NAME']}.{yaml_data['SERVER_DOMAIN']}",
-    country=yaml_data['country'],
-    state=yaml_data['state'],
-    locality=yaml_data['locality'],
-    organization_name=yaml_data['organization_name'],
-    organization_unit=yaml_data['organization_unit'],
-    dns_1=f"{yaml_data['BACKEND_CERT_NAME']}.{yaml_data['SERVER_DOMAIN']}",
-    dns_2=None,
-    ip_1=None,
-    ip_2=None,
-    days=yaml_data['days'])
-
-logger.info("Creating the patches frontend certificate...")
-
-create_ssl_cert(
-    root_private_key=root_key,
-    root_cert=root_crt,
-    cert_directory=certs_directory,
-    host_name=f"{yaml_data['FRONTEND_CERT_NAME']}.{yaml_data['SERVER_DOMAIN']}",
-    country=yaml_data['country'],
-    state=yaml_data['state'],
-    locality=yaml_data['locality'],
-    organization_name=yaml_data['organization_name'],
-    organization_unit=yaml_data['organization_unit'],
-    dns_1=f"{yaml_data['FRONTEND_CERT_NAME']}.{yaml_data['SERVER_DOMAIN']}",
-    dns_2=None,
-    ip_1=None,
-    ip_2=None,
-    days=yaml_data['days'])
-
-pkcs_password = None
-
-while pkcs_password is None:
-    response = patches_read("Do you want to add a password to the PKCS#12 certificates? The password will encrypt the "
-                            "PKCS#12 certificate. If you do not add a password, the certificate will work with Chrome "
-                            "and Chrome-like browsers, but does not work with Firefox. See "
-                            "https://bugzilla.mozilla.org/show_bug.cgi?id=773111. Type yes or no.")
-    if response.lower() == 'yes':
-        pkcs_password = True
-    elif response.lower() == 'no':
-        pkcs_password = False
-    else:
-        print("Invalid input. Please type 'yes' or 'no'.")
+    serialize_start = time.perf_counter()
+    pkcs12_cert = generate_pkcs12_certificate(name, private_key, public_key, root_cert, password, pkcs12_profile)
+    serialize_seconds = time.perf_counter() - serialize_start
+    timings.add('pkcs12', serialize_seconds, name)
+    if password:
+        logger.info(f"Serialized {name}.p12 with the "
+                    f"{pkcs12_profile.name if pkcs12_profile else 'default'} PKCS#12 profile in "
+                    f"{serialize_seconds * 1000:.1f} ms.")
+    with timings.span('write', name):
+        staged.add(f"{name}.p12", pkcs12_cert, private=True)
+        staged.publish()
+
+    return serialize_seconds
+
+
+def _init_client_worker(root_key_pem: Optional[bytes], root_cert_pem: bytes, log_queue, timings_enabled: bool) \
+        -> None:
+    """Loads the root CA key and certificate into a client certificate worker process.
+
+    Key and certificate objects cannot be pickled so the parent process hands them to each worker once, in PEM format,
+    when the worker starts.
+
+    Args:
+        root_key_pem (bytes, optional): The root CA private key in PEM format. None if the key is not available.
+        root_cert_pem (bytes): The root CA certificate in PEM format.
+        log_queue (multiprocessing.Queue): The parent process's log queue. See PatchesLogger.log_queue.
+        timings_enabled (bool): Whether to record phase timings.
+
+    Returns:
+        None
+    """
+    global _worker_root_key, _worker_root_cert, _worker_writer
+    PatchesLogger.configure_worker(log_queue)
+    timings.configure_worker(timings_enabled)
+    _worker_writer = ArtifactWriter()
+    _worker_root_key = serialization.load_pem_private_key(root_key_pem, password=None,
+                                                          backend=default_backend()) if root_key_pem else None
+    _worker_root_cert = x509.load_pem_x509_certificate(root_cert_pem, default_backend())
 
-for client in yaml_data['clients']:
-    ip_address_1 = None
-    ip_address_2 = None
-    if yaml_data['clients'][client]['ip_1'] is not None:
-        try:
-            ip_address_1 = IPv4Address(yaml_data['clients'][client]['ip_1'])
-        except ValueError as error:
-            logger.error(f"Invalid IP address format for {client} ip_1: {error}")
 
-    if yaml_data['clients'][client]['ip_2'] is not None:
+def _issue_client_cert(client_args: dict) -> Tuple[str, float, list, List[str]]:
+    """Creates a single client certificate inside a worker process.
+
+    Args:
+        client_args (dict): The keyword arguments for create_ssl_cert, minus the root CA key and certificate.
+
+    Returns:
+        tuple: The host name of the client the certificate was issued for, the seconds spent serializing its
+               PKCS#12 file, the phase timings recorded while issuing it and the paths of the files it published.
+    """
+    serialize_seconds = create_ssl_cert(root_private_key=_worker_root_key, root_cert=_worker_root_cert,
+                                        writer=_worker_writer, **client_args)
+    return client_args['host_name'], serialize_seconds, timings.drain(), _worker_writer.drain()
+
+
+def issue_client_certs(root_private_key: Optional[PrivateKey], root_cert: Certificate, client_jobs: List[dict],
+                       workers: int = 1, writer: Optional[ArtifactWriter] = None) -> List[Tuple[str, float]]:
+    """Creates the certificates for all clients, optionally on a process pool.
+
+    Any PKCS#12 passwords must already be present in client_jobs. Workers cannot prompt the user.
+
+    Args:
+        root_private_key (PrivateKey, optional): The root CA private key.
+        root_cert (Certificate): The root CA certificate.
+        client_jobs (list): One dict of create_ssl_cert keyword arguments per client, minus the root CA key and
+                            certificate.
+        workers (int): The number of worker processes to use. 1 issues the certificates in this process.
+        writer (ArtifactWriter, optional): Records every published file, including those published by the workers,
+                                           so they can be synced once at the end of the run.
+
+    Returns:
+        list: The host name and PKCS#12 serialization time in seconds of each issued certificate, in the same order as
+              client_jobs.
+    """
+    if workers <= 1 or len(client_jobs) <= 1:
+        return [(client_args['host_name'],
+                 create_ssl_cert(root_private_key=root_private_key, root_cert=root_cert, writer=writer, **client_args))
+                for client_args in client_jobs]
+
+    root_key_pem = None
+    if root_private_key is not None:
+        root_key_pem = root_private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+    root_cert_pem = root_cert.public_bytes(serialization.Encoding.PEM)
+
+    logger.info(f"Issuing {len(client_jobs)} client certificates with {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_client_worker,
+                             initargs=(root_key_pem, root_cert_pem, PatchesLogger.log_queue(),
+                                       timings.enabled)) as executor:
+        # map returns results in submission order regardless of which worker finishes first
+        issued = []
+        for host_name, serialize_seconds, samples, published in executor.map(_issue_client_cert, client_jobs):
+            timings.merge(samples)
+            if writer is not None:
+                writer.record(published)
+            issued.append((host_name, serialize_seconds))
+        return issued
+
+
+def _cert_files(cert_directory: str, host_name: str) -> List[str]:
+    """Returns the paths of the .key, .crt, .pem and .p12 files create_ssl_cert writes for a host."""
+    name = host_name.replace('*.', '')
+    return [os.path.join(cert_directory, f"{name}.{ext}") for ext in ('key', 'crt', 'pem', 'p12')]
+
+
+def plan_issuance(manifest: Optional[CertificateManifest], root_cert: Certificate, cert_jobs: List[dict],
+                  renew_days: int) -> List[dict]:
+    """Filters a list of certificate jobs down to the certificates that have to be issued.
+
+    Args:
+        manifest (CertificateManifest, optional): The manifest of previously issued certificates. If None, every
+                                                  certificate is issued.
+        root_cert (Certificate): The root CA certificate.
+        cert_jobs (list): One dict of create_ssl_cert keyword arguments per certificate, minus the root CA key and
+                          certificate.
+        renew_days (int): Certificates expiring within this many days are issued again.
+
+    Returns:
+        list: The jobs for the certificates that are new, changed, missing or close to expiry.
+    """
+    if manifest is None:
+        return cert_jobs
+
+    pending_jobs = []
+    for cert_args in cert_jobs:
+        name = cert_args['host_name'].replace('*.', '')
+        reason = manifest.needs_issue(name, manifest.input_hash(cert_args, root_cert), renew_days)
+        if reason is None:
+            logger.info(f"The certificate for {name} is up to date. Skipping...")
+        else:
+            logger.info(f"The certificate for {name} will be issued ({reason}).")
+            pending_jobs.append(cert_args)
+
+    return pending_jobs
+
+
+def record_issuance(manifest: Optional[CertificateManifest], root_cert: Certificate, cert_jobs: List[dict]) -> None:
+    """Records newly issued certificates in the manifest and saves it.
+
+    Args:
+        manifest (CertificateManifest, optional): The manifest of issued certificates. If None, nothing is recorded.
+        root_cert (Certificate): The root CA certificate.
+        cert_jobs (list): The create_ssl_cert keyword arguments of the issued certificates.
+
+    Returns:
+        None
+    """
+    if manifest is None:
+        return
+
+    for cert_args in cert_jobs:
+        files = _cert_files(cert_args['cert_directory'], cert_args['host_name'])
+        manifest.record(cert_args['host_name'].replace('*.', ''), manifest.input_hash(cert_args, root_cert), files[1],
+                        files)
+    manifest.save()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the command line parser for generate_certificates.
+
+    Returns:
+        ArgumentParser: The parser. patches_certs.py uses it for the matching subcommand.
+    """
+    parser = argparse.ArgumentParser(description='Script for creating SSL/TLS certificates.')
+    parser.add_argument('--cert-dir', dest='cert_dir', type=str, required=True, help='The directory where the SSL/TLS '
+                                                                                     'certificates and keys will be '
+                                                                                     'stored.')
+    parser.add_argument('--root-cert-dir', dest='root_cert_dir', type=str, required=True, help='The directory where the '
+                                                                                               'root CA certificates and '
+                                                                                               'keys will be stored.')
+    parser.add_argument('--ipv4-address', dest='ipv4_address', type=IPv4Address, required=True, help='IPv4 address on '
+                                                                                                     'which the nginx proxy'
+                                                                                                     ' will listen.')
+    parser.add_argument('--key-pool-dir', dest='key_pool_dir', type=str, default=None,
+                        help='Directory holding a pool of pre-generated keys. See key_pool.py. The pool passphrase is '
+                             'read from the KEY_POOL_PASSPHRASE environment variable.')
+    parser.add_argument('--write-csr', dest='write_csr', action='store_true', default=False,
+                        help='Also write a .csr file for every certificate. Certificates are always issued directly '
+                             'from their keys so the CSR is only needed if you want to have it signed elsewhere.')
+    parser.add_argument('--incremental', dest='incremental', action='store_true', default=False,
+                        help=f'Only issue certificates that are new, changed, missing or close to expiry. The '
+                             f'issued certificates are tracked in {MANIFEST_FILE_NAME} in the certificate directory.')
+    parser.add_argument('--renew-days', dest='renew_days', type=int, default=30,
+                        help='In incremental mode, certificates expiring within this many days are issued again. '
+                             'Defaults to 30.')
+    parser.add_argument('--non-interactive', dest='non_interactive', action='store_true', default=False,
+                        help='Never prompt. PKCS#12 passwords come from --pkcs-password-source (default none) and an '
+                             'existing root CA is handled according to --reuse-root-ca (default yes).')
+    parser.add_argument('--pkcs-password-source', dest='pkcs_password_source', type=str, default=None,
+                        choices=PKCS_PASSWORD_SOURCES,
+                        help='Where the client PKCS#12 passwords come from. prompt asks for each client, none uses no '
+                             'password, shared uses the PKCS_PASSWORD environment variable for every client, file '
+                             'reads --pkcs-password-file and env uses PKCS_PASSWORD_<CLIENT> per client. Defaults to '
+                             'prompt, or none with --non-interactive.')
+    parser.add_argument('--pkcs-password-file', dest='pkcs_password_file', type=str, default=None,
+                        help='A YAML file mapping client names to PKCS#12 passwords. Used with '
+                             '--pkcs-password-source file.')
+    parser.add_argument('--reuse-root-ca', dest='reuse_root_ca', type=str, default=None, choices=['prompt', 'yes', 'no'],
+                        help='Whether to reuse an existing root CA found in the root certificate directory. Defaults '
+                             'to prompt, or yes with --non-interactive.')
+    parser.add_argument('--workers', dest='workers', type=int, default=1, help='The number of worker processes used to '
+                                                                              'create the client certificates. '
+                                                                              'Defaults to 1.')
+    add_instrumentation_arguments(parser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Generates the root CA, server and client certificates described in config.yml.
+
+    Args:
+        argv (list, optional): The command line arguments without the program name. Defaults to sys.argv.
+
+    Returns:
+        int: The exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    with instrumented(args):
+        return generate(parser, args)
+
+
+def generate(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    """Runs generate_certificates with parsed command line arguments.
+
+    Args:
+        parser (ArgumentParser): The parser the arguments came from, used to report invalid combinations.
+        args (Namespace): The parsed arguments.
+
+    Returns:
+        int: The exit status.
+    """
+    pkcs_password_source = args.pkcs_password_source or ('none' if args.non_interactive else 'prompt')
+    reuse_root_ca_policy = args.reuse_root_ca or ('yes' if args.non_interactive else 'prompt')
+    if args.non_interactive and 'prompt' in (pkcs_password_source, reuse_root_ca_policy):
+        parser.error('--non-interactive cannot be combined with --pkcs-password-source prompt or --reuse-root-ca '
+                     'prompt.')
+
+    certs_directory = args.cert_dir
+    root_certs_directory = args.root_cert_dir
+    ipv4_address = args.ipv4_address
+    key_pool = key_pool_from_environment(args.key_pool_dir)
+
+    # Load and validate config.yml before anything else so a misconfiguration fails before any key is generated
+    try:
+        config = load_config('config.yml')
+    except ConfigError as e:
+        for problem in e.problems:
+            logger.error(f"config.yml: {problem}")
+        exit(1)
+
+    # Check if PATCHES_ADMINISTRATOR is present in clients
+    logger.info("Checking to make sure PATCHES_ADMINISTRATOR is present in clients.")
+    patches_administrator = config.patches_administrator
+    clients = config.client_names
+
+    if patches_administrator not in clients:
+        logger.error(f"PATCHES_ADMINISTRATOR '{patches_administrator}' is not in the list of clients in config.yml."
+                     f" This is a fatal error. If you are generating certificates automatically, one of the clients "
+                     f"must be the PATCHES_ADMINISTRATOR. Please review config.yml and update clients accordingly.")
+        exit(1)
+
+    # Load non-interactive passwords before any keys are generated so a missing secret fails fast
+    client_passwords = None
+    if pkcs_password_source != 'prompt':
+        logger.info(f"Loading the client PKCS#12 passwords from the {pkcs_password_source} password source.")
         try:
-            ip_address_2 = IPv4Address(yaml_data['clients'][client]['ip_2'])
-        except ValueError as error:
-            logger.error(f"Invalid IP address format for {client} ip_2: {error}")
-
-    create_ssl_cert(
-        root_private_key=root_key,
-        root_cert=root_crt,
-        cert_directory=certs_directory,
-        host_name=client,
-        country=yaml_data['clients'][client]['country'],
-        state=yaml_data['clients'][client]['state'],
-        locality=yaml_data['clients'][client]['locality'],
-        organization_name=yaml_data['clients'][client]['organization_name'],
-        organization_unit=yaml_data['clients'][client]['organization_unit'],
-        dns_1=yaml_data['clients'][client]['dns_1'],
-        dns_2=yaml_data['clients'][client]['dns_2'],
-        ip_1=ip_address_1,
-        ip_2=ip_address_2,
-        days=yaml_data['clients'][client]['days'],
-        password=pkcs_password)
-
-logger.info("Finished generating certificates...")
+            client_passwords = load_pkcs_passwords(pkcs_password_source, clients, args.pkcs_password_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Unable to load the PKCS#12 passwords: {e}")
+            exit(1)
+
+    logger.info("Creating the certificate directory.")
+    if not os.path.exists(config.cert_directory):
+        os.makedirs(config.cert_directory)
+        logger.info(f"Created directory: {os.path.abspath(config.cert_directory)}")
+    else:
+        logger.info(f"Directory already exists: {os.path.abspath(config.cert_directory)}")
+
+    manifest = CertificateManifest(certs_directory, passwords_prompted=pkcs_password_source == 'prompt') \
+        if args.incremental else None
+
+    # Every certificate file is published through one writer so the whole run is synced to disk once, at the end
+    writer = ArtifactWriter()
+    remove_stale_staging(certs_directory)
+    remove_stale_staging(os.path.join(certs_directory, root_certs_directory))
+
+    root_ca_args = dict(country=config.country,
+                        state=config.state,
+                        locality=config.locality,
+                        root_ca_name=f"{config.root_ca_name}.{config.root_ca_domain}",
+                        organization_name=config.organization_name,
+                        root_cert_directory=os.path.join(certs_directory, root_certs_directory),
+                        key_profile=config.root_ca_key_profile)
+
+    # In incremental mode an unchanged root CA is reused without asking
+    reuse_root_ca = {'prompt': None, 'yes': True, 'no': False}[reuse_root_ca_policy]
+    if manifest is not None:
+        root_ca_hash = manifest.input_hash(root_ca_args)
+        if reuse_root_ca is None and \
+                manifest.needs_issue(root_ca_args['root_ca_name'], root_ca_hash, args.renew_days) is None:
+            logger.info("The root CA is up to date. Reusing it...")
+            reuse_root_ca = True
+
+    root_key, root_crt = create_root_ca(**root_ca_args, key_pool=key_pool, reuse_existing=reuse_root_ca,
+                                       writer=writer)
+
+    if manifest is not None and root_key is not None:
+        root_ca_files = [os.path.join(root_ca_args['root_cert_directory'], f"{root_ca_args['root_ca_name']}.{ext}")
+                         for ext in ('key', 'crt', 'pem')]
+        manifest.record(root_ca_args['root_ca_name'], root_ca_hash, root_ca_files[1], root_ca_files)
+        manifest.save()
+
+    server_jobs = []
+    for cert_name, ip_1 in ((config.server_name, ipv4_address),
+                            (config.backend_cert_name, None),
+                            (config.frontend_cert_name, None)):
+        server_jobs.append(dict(
+            cert_directory=certs_directory,
+            host_name=f"{cert_name}.{config.server_domain}",
+            country=config.country,
+            state=config.state,
+            locality=config.locality,
+            organization_name=config.organization_name,
+            organization_unit=config.organization_unit,
+            dns_1=f"{cert_name}.{config.server_domain}",
+            dns_2=None,
+            ip_1=ip_1,
+            ip_2=None,
+            days=config.days,
+            key_pool=key_pool,
+            key_profile=config.server_key_profile,
+            write_csr=args.write_csr))
+
+    logger.info(f"Creating the patches server certificate {config.server_name}.{config.server_domain} "
+                f"(assigned to the nginx proxy) and the patches backend and frontend certificates...")
+
+    pending_server_jobs = plan_issuance(manifest, root_crt, server_jobs, args.renew_days)
+    for server_args in pending_server_jobs:
+        create_ssl_cert(root_private_key=root_key, root_cert=root_crt, writer=writer, **server_args)
+    record_issuance(manifest, root_crt, pending_server_jobs)
+
+    # A full chain left by an earlier import belongs to the imported key, not to the generated one
+    fullchain_file = os.path.join(certs_directory, f"{config.server_name}.{config.server_domain}.fullchain.crt")
+    if os.path.exists(fullchain_file):
+        os.remove(fullchain_file)
+        logger.info(f"Removed {fullchain_file}, which was written by an earlier import.")
+
+    logger.info("Updating config.yml with the new SERVER_NAME values...")
+
+    # Every config.yml field a generate run sets is written in this one transaction
+    config_updates = {'SERVER_PEM': f"{config.server_name}.{config.server_domain}.pem",
+                      'PKCS_FILE': f"{config.server_name}.{config.server_domain}.p12",
+                      'SERVER_FULLCHAIN': ''}
+    if root_key is not None:
+        config_updates['ROOT_CA_PEM'] = f"{root_ca_args['root_ca_name']}.pem"
+    update_config_fields(config_updates)
+
+    client_jobs = []
+    for client in config.clients:
+        client_jobs.append(dict(
+            cert_directory=certs_directory,
+            host_name=client.name,
+            country=client.country,
+            state=client.state,
+            locality=client.locality,
+            organization_name=client.organization_name,
+            organization_unit=client.organization_unit,
+            dns_1=client.dns_1,
+            dns_2=client.dns_2,
+            ip_1=client.ip_1,
+            ip_2=client.ip_2,
+            days=client.days,
+            key_pool=key_pool,
+            key_profile=client.key_profile,
+            write_csr=args.write_csr,
+            pkcs12_profile=client.pkcs12_profile,
+            password=client_passwords[client.name] if client_passwords is not None else None))
+
+    if manifest is not None:
+        # Entries for clients removed from config.yml are dropped when the client certificates are recorded below
+        manifest.prune([root_ca_args['root_ca_name']] +
+                       [cert_args['host_name'].replace('*.', '') for cert_args in server_jobs + client_jobs])
+
+    client_jobs = plan_issuance(manifest, root_crt, client_jobs, args.renew_days)
+
+    pkcs_password = None if client_jobs and pkcs_password_source == 'prompt' else False
+
+    while pkcs_password is None:
+        response = patches_read("Do you want to add a password to the PKCS#12 certificates? The password will encrypt the "
+                                "PKCS#12 certificate. If you do not add a password, the certificate will work with Chrome "
+                                "and Chrome-like browsers, but does not work with Firefox. See "
+                                "https://bugzilla.mozilla.org/show_bug.cgi?id=773111. Type yes or no.")
+        if response.lower() == 'yes':
+            pkcs_password = True
+        elif response.lower() == 'no':
+            pkcs_password = False
+        else:
+            print("Invalid input. Please type 'yes' or 'no'.")
+
+    # Prompt for all the PKCS#12 passwords up front. Worker processes cannot prompt the user.
+    if pkcs_password:
+        for client_args in client_jobs:
+            PatchesLogger.flush()
+            client_args['password'] = getpass(f"Enter the PKCS#12 password you want to use for the host "
+                                              f"{client_args['host_name']}: ")
+
+    issued_clients = issue_client_certs(root_key, root_crt, client_jobs, workers=args.workers, writer=writer)
+    record_issuance(manifest, root_crt, client_jobs)
+
+    for host_name, serialize_seconds in issued_clients:
+        logger.info(f"Created the client certificate for {host_name} at "
+                    f"{os.path.join(certs_directory, host_name.replace('*.', '') + '.p12')} (PKCS#12 serialized in "
+                    f"{serialize_seconds * 1000:.1f} ms)")
+
+    if issued_clients:
+        total_serialize_seconds = sum(serialize_seconds for _, serialize_seconds in issued_clients)
+        logger.info(f"Serialized {len(issued_clients)} client PKCS#12 files in {total_serialize_seconds:.2f} s "
+                    f"({total_serialize_seconds * 1000 / len(issued_clients):.1f} ms per file).")
+
+    with timings.span('sync'):
+        writer.sync()
+
+    if key_pool is not None:
+        # A background refill started during the run is killed when the container exits, so top the pool up here. The
+        # root CA key is left out because a new root CA is rarely issued.
+        key_profiles = {config.server_key_profile, *(client.key_profile for client in config.clients)}
+        with timings.span('key_pool_refill'):
+            for key_profile in sorted(key_profiles, key=lambda profile: profile.name):
+                generated = key_pool.fill(key_profile, wait=True)
+                if generated:
+                    logger.info(f"Added {generated} keys to the {key_profile.name} key pool.")
+
+    logger.info("Finished generating certificates...")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
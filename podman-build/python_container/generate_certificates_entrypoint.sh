@@ -3,5 +3,47 @@
 export ROOT_CERT_DIRECTORY=${ROOT_CERT_DIRECTORY}
 export CERT_DIRECTORY=${CERT_DIRECTORY}
 export IPV4_ADDRESS=${IPV4_ADDRESS}
+export CERT_WORKERS=${CERT_WORKERS:-1}
 
-python generate_certificates.py --root-cert-dir "${ROOT_CERT_DIRECTORY}" --cert-dir "${CERT_DIRECTORY}" --ipv4-address ${IPV4_ADDRESS}
+set -- --root-cert-dir "${ROOT_CERT_DIRECTORY}" --cert-dir "${CERT_DIRECTORY}" --ipv4-address "${IPV4_ADDRESS}" \
+  --workers "${CERT_WORKERS}"
+
+# KEY_POOL_DIRECTORY is optional. If it is set, KEY_POOL_PASSPHRASE must be set as well. See key_pool.py.
+if [ -n "${KEY_POOL_DIRECTORY}" ]; then
+  set -- "$@" --key-pool-dir "${KEY_POOL_DIRECTORY}"
+fi
+
+# Only issue certificates that are new, changed, missing or close to expiry
+if [ "${CERT_INCREMENTAL}" = true ]; then
+  set -- "$@" --incremental
+fi
+
+# Run unattended, for example in CI. PKCS#12 passwords come from PKCS_PASSWORD_SOURCE (none, shared, file or env) and
+# an existing root CA is reused unless REUSE_ROOT_CA is set to no. The shared source reads PKCS_PASSWORD, the env source
+# reads PKCS_PASSWORD_<CLIENT> and the file source reads the YAML file in PKCS_PASSWORD_FILE.
+if [ "${CERT_NON_INTERACTIVE}" = true ]; then
+  set -- "$@" --non-interactive
+fi
+
+if [ -n "${PKCS_PASSWORD_SOURCE}" ]; then
+  set -- "$@" --pkcs-password-source "${PKCS_PASSWORD_SOURCE}"
+fi
+
+if [ -n "${PKCS_PASSWORD_FILE}" ]; then
+  set -- "$@" --pkcs-password-file "${PKCS_PASSWORD_FILE}"
+fi
+
+if [ -n "${REUSE_ROOT_CA}" ]; then
+  set -- "$@" --reuse-root-ca "${REUSE_ROOT_CA}"
+fi
+
+# Log a per phase timing summary and optionally write the timings to a JSON metrics file. See timings.py.
+if [ "${CERT_TIMINGS}" = true ]; then
+  set -- "$@" --timings
+fi
+
+if [ -n "${CERT_METRICS_FILE}" ]; then
+  set -- "$@" --metrics-file "${CERT_METRICS_FILE}"
+fi
+
+python patches_certs.py generate "$@"
@@ -1,155 +1,291 @@
-import logging
+import binascii
+import fcntl
+import hashlib
 import os
-import textwrap
-import time
-from typing import Optional
+import re
+from typing import Dict, List, NamedTuple, Optional, Union
 
-import yaml
-from cryptography.hazmat.backends import default_backend
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
 from cryptography.hazmat.primitives.serialization import pkcs12
-from cryptography.x509 import Certificate
-from cryptography.x509 import load_pem_x509_certificate
+from cryptography.x509 import Certificate, load_der_x509_certificate
 
+from artifact_writer import ArtifactWriter
+from patches_logging import PatchesLogger, patches_read
 
-class PatchesLogHandler(logging.Handler):
-    """Custom log handler for Patches scripts.
+# The private key types a key profile can produce
+PrivateKey = Union[rsa.RSAPrivateKey, ec.EllipticCurvePrivateKey, ed25519.Ed25519PrivateKey]
 
-    This log handler customizes the log message formatting and output to match
-    the text style of the `patches_echo` function in Bash, including colored
-    output, timestamp, and 80-character separators.
+
+class KeyProfile(NamedTuple):
+    """A key algorithm profile for a certificate.
 
     Attributes:
-        None
+        name (str): The name of the profile as used in config.yml.
+        algorithm (str): One of "rsa", "ecdsa" or "ed25519".
+        key_size (int, optional): The RSA key size in bits.
+        curve (str, optional): The name of the ECDSA curve.
+        hash_name (str, optional): The signature hash. None for Ed25519, which has a fixed hash.
     """
+    name: str
+    algorithm: str
+    key_size: Optional[int] = None
+    curve: Optional[str] = None
+    hash_name: Optional[str] = 'sha256'
+
+
+# The key profiles that can be given as key_profile in config.yml
+KEY_PROFILES = {
+    'rsa-2048': KeyProfile('rsa-2048', 'rsa', key_size=2048),
+    'rsa-3072': KeyProfile('rsa-3072', 'rsa', key_size=3072),
+    'rsa-4096': KeyProfile('rsa-4096', 'rsa', key_size=4096),
+    'ecdsa-p256': KeyProfile('ecdsa-p256', 'ecdsa', curve='secp256r1'),
+    'ecdsa-p384': KeyProfile('ecdsa-p384', 'ecdsa', curve='secp384r1', hash_name='sha384'),
+    'ed25519': KeyProfile('ed25519', 'ed25519', hash_name=None),
+}
+
+# The profiles used when config.yml does not set key_profile
+DEFAULT_ROOT_CA_KEY_PROFILE = 'rsa-4096'
+DEFAULT_KEY_PROFILE = 'rsa-2048'
+
+_EC_CURVES = {
+    'secp256r1': ec.SECP256R1,
+    'secp384r1': ec.SECP384R1,
+}
+
+_HASHES = {
+    'sha1': hashes.SHA1,
+    'sha256': hashes.SHA256,
+    'sha384': hashes.SHA384,
+    'sha512': hashes.SHA512,
+}
+
+
+class Pkcs12Profile(NamedTuple):
+    """An encryption profile for password protected PKCS#12 files.
 
-    def emit(self, record):
-        """Emit a log record.
+    Attributes:
+        name (str): The name of the profile as used in config.yml.
+        cipher (str, optional): "aes-256-cbc" (PBES2) or "3des" (PBES1, for older browsers and operating systems). None
+                                lets the cryptography library pick the best available encryption.
+        mac (str, optional): The hash used for the PKCS#12 MAC. One of "sha1", "sha256", "sha384" or "sha512".
+        kdf_rounds (int, optional): The number of key derivation rounds. This is the main cost of writing and opening
+                                    the file.
+    """
+    name: str
+    cipher: Optional[str] = None
+    mac: Optional[str] = None
+    kdf_rounds: Optional[int] = None
 
-        This method overrides the `emit` method of the `logging.Handler` class
-        to customize the log message formatting and output.
 
-        Args:
-            record (logging.LogRecord): The log record to be emitted.
+# The PKCS#12 encryption profiles that can be given as pkcs12_profile in config.yml. More can be defined in config.yml
+# under pkcs12_profiles.
+PKCS12_PROFILES = {
+    'default': Pkcs12Profile('default'),
+    'legacy': Pkcs12Profile('legacy', cipher='3des', mac='sha1', kdf_rounds=2048),
+    'modern': Pkcs12Profile('modern', cipher='aes-256-cbc', mac='sha256', kdf_rounds=20000),
+    'modern-fast': Pkcs12Profile('modern-fast', cipher='aes-256-cbc', mac='sha256', kdf_rounds=2048),
+}
 
-        Returns:
-            None
-        """
-        message = self.format(record)
-        level = record.levelname.lower()
-        if level == 'error' or level == 'warning':
-            color = '\033[1;31m'  # Red color
-        else:
-            color = '\033[1;33m'  # Yellow color
-        reset_color = '\033[0m'  # Reset color
+DEFAULT_PKCS12_PROFILE = 'default'
 
-        # Print first line of 80 #
-        print('#' * 80)
+_PKCS12_CIPHERS = {
+    'aes-256-cbc': pkcs12.PBES.PBESv2SHA256AndAES256CBC,
+    '3des': pkcs12.PBES.PBESv1SHA1And3KeyTripleDESCBC,
+}
 
-        # Format the timestamp
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
+# Where PKCS#12 passwords come from. "prompt" asks the user, every other source works without a terminal.
+PKCS_PASSWORD_SOURCES = ('prompt', 'none', 'shared', 'file', 'env')
 
-        # Determine the available width for the log message (80 - length of timestamp)
-        available_width = 80 - len(timestamp) - 3  # Subtract 3 for timestamp formatting (space, dash, space)
+# The environment variable holding the shared PKCS#12 password. This is the same variable import_keys uses.
+SHARED_PKCS_PASSWORD_ENV = 'PKCS_PASSWORD'
 
-        # Wrap the log message to available width at the nearest word boundary
-        wrapped_message = textwrap.fill(message, width=available_width, break_long_words=False)
 
-        # Print timestamp and modified message in the desired color
-        print(f'{timestamp} - {color}{wrapped_message}{reset_color}')
+def get_key_profile(name: Optional[str], default: str = DEFAULT_KEY_PROFILE) -> KeyProfile:
+    """
+    Looks up a key profile by the name used in config.yml.
 
-        # Print last line of 80 #
-        print('#' * 80)
+    Args:
+        name (str, optional): The name of the profile. If empty, the default profile is used.
+        default (str): The name of the profile to use when name is empty. Defaults to DEFAULT_KEY_PROFILE.
 
+    Raises:
+        ValueError: If the profile does not exist.
 
-class PatchesLogger:
-    """Singleton class for the custom Patches logger.
+    Returns:
+        KeyProfile: The key profile.
+    """
+    name = name or default
+    if name not in KEY_PROFILES:
+        raise ValueError(f"Unknown key_profile '{name}'. Valid profiles are: {', '.join(KEY_PROFILES)}")
+    return KEY_PROFILES[name]
 
-    This class provides a singleton instance of the logger with a custom log handler
-    for Patches scripts. The logger can be accessed using the `get_logger` method.
 
-    Attributes:
-        _logger (logging.Logger): The logger instance.
+def generate_key(key_profile: KeyProfile) -> PrivateKey:
     """
+    Generates a new private key for the given key profile.
 
-    _logger = None
+    Args:
+        key_profile (KeyProfile): The key profile.
 
-    @staticmethod
-    def get_logger():
-        """Get the custom Patches logger instance.
+    Returns:
+        PrivateKey: The new private key.
+    """
+    if key_profile.algorithm == 'rsa':
+        return rsa.generate_private_key(public_exponent=65537, key_size=key_profile.key_size)
+    elif key_profile.algorithm == 'ecdsa':
+        return ec.generate_private_key(_EC_CURVES[key_profile.curve]())
+    elif key_profile.algorithm == 'ed25519':
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unsupported key algorithm '{key_profile.algorithm}'.")
 
-        If the logger instance doesn't exist, it will be created with the custom log handler
-        and returned. If the logger instance already exists, it will be directly returned.
 
-        Returns:
-            logging.Logger: The custom Patches logger instance.
-        """
-        if PatchesLogger._logger is None:
-            logging.basicConfig(level=logging.INFO)
-            logger = logging.getLogger()
-            logger.handlers.clear()
-            handler = PatchesLogHandler()
-            handler.setFormatter(logging.Formatter('%(message)s'))
-            logger.addHandler(handler)
-            PatchesLogger._logger = logger
+def signature_hash(signing_key: PrivateKey, key_profile: KeyProfile) -> Optional[hashes.HashAlgorithm]:
+    """
+    Returns the hash algorithm to pass to a builder's sign method.
 
-        return PatchesLogger._logger
+    Ed25519 keys sign with a fixed hash so None is returned for them regardless of the profile. Otherwise the profile's
+    hash is used, falling back to SHA256 when the profile does not have one.
+
+    Args:
+        signing_key (PrivateKey): The key that will produce the signature.
+        key_profile (KeyProfile): The key profile of the certificate being signed.
+
+    Returns:
+        hashes.HashAlgorithm: The hash algorithm or None.
+    """
+    if isinstance(signing_key, ed25519.Ed25519PrivateKey):
+        return None
+    return _HASHES[key_profile.hash_name or 'sha256']()
 
 
-def patches_read(prompt):
-    """Custom read command for Patches scripts.
+def private_key_format(private_key: PrivateKey) -> serialization.PrivateFormat:
+    """
+    Returns the PEM format to write a private key in.
 
-    Prompts the user for input and sets the text color to a bold blue.
+    RSA and ECDSA keys keep the traditional OpenSSL format. Ed25519 keys can only be written as PKCS8.
 
     Args:
-        prompt (str): The prompt message to display to the user.
+        private_key (PrivateKey): The private key.
 
     Returns:
-        str: The user input.
-    """
-    color = '\033[1;34m'  # Bold blue color
-    reset_color = '\033[0m'  # Reset color
-
-    # Print first line of 80 #
-    print('#' * 80)
-
-    # Wrap the prompt at 80 characters
-    wrapped_prompt = ""
-    line_length = 0
-    words = prompt.split()
-    for word in words:
-        if line_length + len(word) > 80:
-            wrapped_prompt += '\n' + word
-            line_length = len(word)
+        serialization.PrivateFormat: The private key format.
+    """
+    if isinstance(private_key, (rsa.RSAPrivateKey, ec.EllipticCurvePrivateKey)):
+        return serialization.PrivateFormat.TraditionalOpenSSL
+    return serialization.PrivateFormat.PKCS8
+
+
+def verify_certificate_signature(issuer_public_key, certificate: Certificate) -> None:
+    """
+    Verifies that a certificate was signed by the given issuer public key.
+
+    RSA issuers are checked with PKCS1v15 padding, ECDSA issuers with ECDSA and Ed25519 issuers directly.
+
+    Args:
+        issuer_public_key: The public key of the candidate issuer.
+        certificate (Certificate): The certificate to check.
+
+    Raises:
+        InvalidSignature: If the certificate was not signed by the issuer key, including when the key type does not
+                          match the signature algorithm.
+
+    Returns:
+        None
+    """
+    try:
+        if isinstance(issuer_public_key, rsa.RSAPublicKey):
+            issuer_public_key.verify(certificate.signature, certificate.tbs_certificate_bytes, padding.PKCS1v15(),
+                                     certificate.signature_hash_algorithm)
+        elif isinstance(issuer_public_key, ec.EllipticCurvePublicKey):
+            issuer_public_key.verify(certificate.signature, certificate.tbs_certificate_bytes,
+                                     ec.ECDSA(certificate.signature_hash_algorithm))
+        elif isinstance(issuer_public_key, ed25519.Ed25519PublicKey):
+            issuer_public_key.verify(certificate.signature, certificate.tbs_certificate_bytes)
         else:
-            if line_length > 0:
-                wrapped_prompt += ' ' + word
-                line_length += len(word) + 1
-            else:
-                wrapped_prompt += word
-                line_length = len(word)
+            raise InvalidSignature(f"Unsupported issuer key type {type(issuer_public_key).__name__}")
+    except (TypeError, ValueError) as e:
+        # Raised when the issuer key type does not match the certificate's signature algorithm
+        raise InvalidSignature(str(e))
+
+
+def get_pkcs12_profile(name: Optional[str], custom_profiles: Optional[dict] = None) -> Pkcs12Profile:
+    """
+    Looks up a PKCS#12 encryption profile by the name used in config.yml.
+
+    Args:
+        name (str, optional): The name of the profile. If empty, DEFAULT_PKCS12_PROFILE is used.
+        custom_profiles (dict, optional): The pkcs12_profiles section of config.yml. Each entry maps a profile name to
+                                          its cipher, mac and kdf_rounds. Custom profiles override built in profiles
+                                          of the same name. Defaults to None.
+
+    Raises:
+        ValueError: If the profile does not exist or a custom profile is invalid.
 
-    # Print prompt message
-    print(f'{color}{wrapped_prompt}{reset_color}')
+    Returns:
+        Pkcs12Profile: The PKCS#12 encryption profile.
+    """
+    name = name or DEFAULT_PKCS12_PROFILE
+
+    if custom_profiles and name in custom_profiles:
+        settings = custom_profiles[name] or {}
+        unknown = set(settings) - {'cipher', 'mac', 'kdf_rounds'}
+        if unknown:
+            raise ValueError(f"Unknown settings in pkcs12_profiles.{name}: {', '.join(sorted(unknown))}")
+        profile = Pkcs12Profile(name, settings.get('cipher'), settings.get('mac'), settings.get('kdf_rounds'))
+        if profile.cipher is not None and profile.cipher not in _PKCS12_CIPHERS:
+            raise ValueError(f"Unknown cipher '{profile.cipher}' in pkcs12_profiles.{name}. Valid ciphers are: "
+                             f"{', '.join(_PKCS12_CIPHERS)}")
+        if profile.mac is not None and profile.mac not in _HASHES:
+            raise ValueError(f"Unknown mac '{profile.mac}' in pkcs12_profiles.{name}. Valid macs are: "
+                             f"{', '.join(_HASHES)}")
+        if profile.kdf_rounds is not None and (not isinstance(profile.kdf_rounds, int) or profile.kdf_rounds < 1):
+            raise ValueError(f"kdf_rounds in pkcs12_profiles.{name} must be a positive integer.")
+        return profile
+
+    if name not in PKCS12_PROFILES:
+        valid_names = list(PKCS12_PROFILES) + list(custom_profiles or {})
+        raise ValueError(f"Unknown pkcs12_profile '{name}'. Valid profiles are: {', '.join(valid_names)}")
+    return PKCS12_PROFILES[name]
+
+
+def pkcs12_encryption(password: Optional[str], pkcs12_profile: Optional[Pkcs12Profile] = None) \
+        -> serialization.KeySerializationEncryption:
+    """
+    Builds the encryption for a PKCS#12 file from a password and an encryption profile.
+
+    Args:
+        password (str, optional): The password. If empty, the file is not encrypted.
+        pkcs12_profile (Pkcs12Profile, optional): The encryption profile. Defaults to DEFAULT_PKCS12_PROFILE.
+
+    Returns:
+        serialization.KeySerializationEncryption: The encryption to pass to pkcs12.serialize_key_and_certificates.
+    """
+    if not password:
+        return serialization.NoEncryption()
 
-    # Print last line of 80 #
-    print('#' * 80)
+    if pkcs12_profile is None or not (pkcs12_profile.cipher or pkcs12_profile.mac or pkcs12_profile.kdf_rounds):
+        return serialization.BestAvailableEncryption(password.encode('utf-8'))
 
-    # Read user input
-    user_input = input()
+    builder = serialization.PrivateFormat.PKCS12.encryption_builder()
+    if pkcs12_profile.kdf_rounds:
+        builder = builder.kdf_rounds(pkcs12_profile.kdf_rounds)
+    if pkcs12_profile.cipher:
+        builder = builder.key_cert_algorithm(_PKCS12_CIPHERS[pkcs12_profile.cipher])
+    if pkcs12_profile.mac:
+        builder = builder.hmac_hash(_HASHES[pkcs12_profile.mac]())
 
-    return user_input
+    return builder.build(password.encode('utf-8'))
 
 
-def combine_keys_to_pem(private_key: rsa.RSAPrivateKey, certificate: Certificate) -> bytes:
+def combine_keys_to_pem(private_key: PrivateKey, certificate: Certificate) -> bytes:
     """
     Combines a private key and public certificate into a single PEM file.
 
     Args:
-        private_key (rsa.RSAPrivateKey): The private key in cryptography.hazmat.primitives.asymmetric.rsa.RSAPrivateKey
-                                         format.
+        private_key (PrivateKey): The RSA, ECDSA or Ed25519 private key.
         certificate (Certificate): The public certificate in Certificate format.
 
     Returns:
@@ -157,7 +293,7 @@ def combine_keys_to_pem(private_key: rsa.RSAPrivateKey, certificate: Certificate
     """
     private_bytes = private_key.private_bytes(
         encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        format=private_key_format(private_key),
         encryption_algorithm=serialization.NoEncryption()
     )
 
@@ -170,17 +306,20 @@ def combine_keys_to_pem(private_key: rsa.RSAPrivateKey, certificate: Certificate
     return pem
 
 
-def generate_pkcs12_certificate(name: str, private_key: rsa.RSAPrivateKey, certificate: Certificate,
-                                root_certificate: Certificate, password: Optional[str] = None) -> bytes:
+def generate_pkcs12_certificate(name: str, private_key: PrivateKey, certificate: Certificate,
+                                root_certificate: Certificate, password: Optional[str] = None,
+                                pkcs12_profile: Optional[Pkcs12Profile] = None) -> bytes:
     """
-    Converts the provided RSA private key, X.509 certificate, and root certificate to PKCS#12 format.
+    Converts the provided private key, X.509 certificate, and root certificate to PKCS#12 format.
 
     Args:
         name (str): The human-readable name for the certificate.
-        private_key (rsa.RSAPrivateKey): The RSA private key.
+        private_key (PrivateKey): The RSA, ECDSA or Ed25519 private key.
         certificate (Certificate): The X.509 certificate.
         root_certificate (Certificate): The root certificate.
         password (str, optional): The password for the PKCS#12 certificate. Default is None.
+        pkcs12_profile (Pkcs12Profile, optional): The encryption profile used when a password is given. Default is
+                                                  None, which uses the best available encryption.
 
     Returns:
         bytes: The PKCS#12 certificate.
@@ -191,60 +330,114 @@ def generate_pkcs12_certificate(name: str, private_key: rsa.RSAPrivateKey, certi
         key=private_key,
         cert=certificate,
         cas=[root_certificate],
-        encryption_algorithm=serialization.BestAvailableEncryption(
-            password.encode('utf-8')) if password else serialization.NoEncryption(),
+        encryption_algorithm=pkcs12_encryption(password, pkcs12_profile),
     )
 
     return pkcs12_data
 
 
-def convert_pem_files(pem_path):
+def pem_block_der(block: bytes) -> bytes:
+    """Decodes the base64 body of one PEM block.
+
+    Args:
+        block (bytes): A PEM block as returned by artifact_cache.pem_blocks.
+
+    Raises:
+        ValueError: If the body of the block is not valid base64.
+
+    Returns:
+        bytes: The DER encoded contents of the block.
     """
-    Converts PEM files to separate files containing the private key and the public certificate.
+    body = block[block.index(b'\n') + 1:block.rindex(b'-----END')]
+    try:
+        return binascii.a2b_base64(body)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid PEM block: {e}") from e
+
+
+def convert_pem_files(pem_path, artifacts=None, writer=None):
+    """
+    Converts PEM files to separate files containing the private key and the public certificates.
+
+    The PEM file is walked once, block by block, and a large file is memory-mapped. Every certificate in the file is
+    parsed and written to the .crt file in the order it appears, skipping duplicates, so importing a CA bundle keeps
+    all of its CAs. Only one certificate is held in memory at a time, so memory use does not grow with the size of the
+    bundle. Nothing is published if any certificate block does not parse, because nginx refuses to start with a broken
+    certificate bundle.
 
     Args:
         pem_path (str): The path to the PEM file.
+        artifacts (ArtifactCache, optional): The run's artifact cache. When given, the file contents and the private
+                                             key it already loaded are reused instead of reading the file again.
+        writer (ArtifactWriter, optional): The writer the files are published with. Pass the run's writer to sync
+                                           them together with its other files.
 
     Raises:
-        ValueError: If the provided PEM file doesn't exist or is not a valid PEM file.
+        ValueError: If the provided PEM file doesn't exist, is not a valid PEM file, holds a certificate block that
+                    does not parse or holds an OpenSSL TRUSTED CERTIFICATE block.
 
     Returns:
         str: The path to the public certificate file.
     """
+    # artifact_cache imports this module, so it can only be imported once this module has loaded
+    from artifact_cache import ArtifactCache, pem_blocks
+
     if not os.path.exists(pem_path):
         raise ValueError(f"The PEM file '{pem_path}' does not exist.")
 
     pem_dir = os.path.dirname(pem_path)
-
-    # Read the contents of the PEM file
-    with open(pem_path, 'rb') as pem_file:
-        pem_data = pem_file.read()
-
-    # Load the PEM data as an X509 certificate
-    cert = load_pem_x509_certificate(pem_data, default_backend())
-
-    # Write the public certificate to a file
-    cert_file_path = os.path.join(pem_dir, f"{os.path.splitext(os.path.basename(pem_path))[0]}.crt")
-    with open(cert_file_path, 'wb') as cert_file:
-        cert_file.write(cert.public_bytes(encoding=serialization.Encoding.PEM))
-
-    private_key = None
-    try:
-        private_key = load_pem_private_key(pem_data, password=None, backend=default_backend())
-    except (ValueError, TypeError):
-        pass
-
-    # Write the private key to a file if available
-    if private_key is not None:
-        key_file_path = os.path.join(pem_dir, f"{os.path.splitext(os.path.basename(pem_path))[0]}.key")
-        with open(key_file_path, 'wb') as key_file:
-            key_file.write(private_key.private_bytes(
+    name = os.path.splitext(os.path.basename(pem_path))[0]
+    if artifacts is None:
+        artifacts = ArtifactCache()
+
+    certificate_count = 0
+    duplicate_count = 0
+    has_private_key = False
+    seen = set()
+    with (writer or ArtifactWriter()).begin(pem_dir, name) as staged:
+        # Write the public certificates to a file as the blocks are found
+        with staged.open(f"{name}.crt") as cert_file:
+            for label, block in pem_blocks(artifacts.read(pem_path)):
+                if label.endswith('PRIVATE KEY'):
+                    has_private_key = True
+                    continue
+                if label == 'TRUSTED CERTIFICATE':
+                    raise ValueError(f"The PEM file '{pem_path}' holds an OpenSSL TRUSTED CERTIFICATE block. Convert "
+                                     f"it to a plain certificate with 'openssl x509 -in <file> -out <file>'.")
+                if label != 'CERTIFICATE':
+                    continue
+                der = pem_block_der(block)
+                try:
+                    certificate = load_der_x509_certificate(der)
+                except ValueError as e:
+                    raise ValueError(f"Certificate {certificate_count + duplicate_count + 1} in '{pem_path}' is "
+                                     f"not a valid certificate: {e}") from e
+                digest = hashlib.sha256(der).digest()
+                if digest in seen:
+                    duplicate_count += 1
+                    continue
+                seen.add(digest)
+                cert_file.write(certificate.public_bytes(serialization.Encoding.PEM))
+                certificate_count += 1
+
+        if certificate_count == 0:
+            raise ValueError(f"The PEM file '{pem_path}' does not contain a certificate.")
+
+        # Write the private key to a file if available
+        private_key = artifacts.private_key(pem_path) if has_private_key else None
+        if private_key is not None:
+            staged.add(f"{name}.key", private_key.private_bytes(
                 encoding=serialization.Encoding.PEM,
                 format=serialization.PrivateFormat.PKCS8,
                 encryption_algorithm=serialization.NoEncryption()
-            ))
+            ), private=True)
+
+    if certificate_count > 1 or duplicate_count:
+        logger = PatchesLogger.get_logger()
+        logger.info(f"Wrote {certificate_count} certificates from {pem_path} to {name}.crt, skipping "
+                    f"{duplicate_count} duplicates.")
 
-    return cert_file_path
+    return os.path.join(pem_dir, f"{name}.crt")
 
 
 def ask_yes_no(prompt):
@@ -272,39 +465,234 @@ def ask_yes_no(prompt):
             logger.error("Invalid input. Please enter either 'yes' or 'no'.")
 
 
-def update_config_file(field_name, file_name):
+def client_password_env_name(client: str) -> str:
     """
-    Updates the specified field in the config.yml file with the given absolute file path.
+    Returns the name of the environment variable holding the PKCS#12 password of a client.
 
     Args:
-        field_name (str): Name of the field to update.
-        file_name (str): The name of the certificate.
+        client (str): The client name from config.yml.
+
+    Returns:
+        str: The environment variable name, for example PKCS_PASSWORD_GELANTE for the client gelante.
+    """
+    return f"{SHARED_PKCS_PASSWORD_ENV}_{re.sub(r'[^A-Za-z0-9]', '_', client).upper()}"
+
+
+def load_pkcs_passwords(source: str, clients: List[str], password_file: Optional[str] = None) \
+        -> Dict[str, Optional[str]]:
+    """
+    Loads the PKCS#12 password of every client without prompting.
+
+    The sources are:
+        none: No client gets a password.
+        shared: Every client uses the password in the PKCS_PASSWORD environment variable.
+        file: Passwords are read from a YAML file mapping client names to passwords.
+        env: Each client uses the PKCS_PASSWORD_<CLIENT> environment variable, falling back to PKCS_PASSWORD.
+
+    Args:
+        source (str): One of the PKCS_PASSWORD_SOURCES other than "prompt".
+        clients (list): The client names from config.yml.
+        password_file (str, optional): The path of the secrets file for the "file" source. Defaults to None.
 
     Raises:
-        ValueError: If an invalid field name is provided.
+        ValueError: If the source is unknown or a client does not have a password.
+
+    Returns:
+        dict: The password for each client, or None for clients without a password.
+    """
+    if source == 'none':
+        return {client: None for client in clients}
+
+    if source == 'shared':
+        shared_password = os.environ.get(SHARED_PKCS_PASSWORD_ENV)
+        if not shared_password:
+            raise ValueError(f"The shared PKCS#12 password source requires {SHARED_PKCS_PASSWORD_ENV} to be set.")
+        return {client: shared_password for client in clients}
+
+    if source == 'file':
+        if not password_file:
+            raise ValueError("The file PKCS#12 password source requires a password file.")
+        import yaml  # Only the file password source needs PyYAML
+        with open(password_file, 'r') as f:
+            secrets = yaml.safe_load(f) or {}
+        if not isinstance(secrets, dict):
+            raise ValueError(f"{password_file} must map client names to passwords.")
+        missing = [client for client in clients if not secrets.get(client)]
+        if missing:
+            raise ValueError(f"{password_file} has no password for: {', '.join(missing)}")
+        return {client: str(secrets[client]) for client in clients}
+
+    if source == 'env':
+        passwords = {}
+        missing = []
+        for client in clients:
+            password = os.environ.get(client_password_env_name(client)) or os.environ.get(SHARED_PKCS_PASSWORD_ENV)
+            if not password:
+                missing.append(client_password_env_name(client))
+            passwords[client] = password
+        if missing:
+            raise ValueError(f"No PKCS#12 password set in {', '.join(missing)} or {SHARED_PKCS_PASSWORD_ENV}.")
+        return passwords
+
+    raise ValueError(f"Unknown PKCS#12 password source '{source}'. Valid sources are: "
+                     f"{', '.join(PKCS_PASSWORD_SOURCES)}")
+
+
+class ConfigTransaction:
+    """Batches any number of field updates to config.yml into one locked read and one atomic write.
+
+    config.yml is edited line by line instead of through the YAML library so its comments are kept. The file itself is
+    locked with flock for the whole transaction, which locks out other writers on the same host, including those in
+    other containers that bind mount the same file. The new contents are written to a temporary file, fsynced and
+    renamed over config.yml, so readers see either the old or the new file and never a partial one. If config.yml is a
+    symbolic link, as it is inside the containers, the file it points to is replaced. The directory holding it must be
+    writable. If the rename fails, config.yml is left untouched and the error is raised; it is never rewritten in
+    place.
+
+    Use it as a context manager. The changes are written when the block exits without an exception:
+
+        with ConfigTransaction() as config:
+            config.set('SERVER_PEM', 'patches.lan.pem')
+            config.set('PKCS_FILE', 'patches.lan.p12')
+
+    Attributes:
+        path (str): The path of the config file.
+    """
+
+    def __init__(self, path: str = 'config.yml'):
+        self.path = path
+        self._file = None
+        self._lines = []
+        self._changed = False
+
+    def __enter__(self) -> 'ConfigTransaction':
+        while True:
+            self._file = open(self.path, 'r+')
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            # Another writer may have renamed a new config.yml into place while we waited for the lock
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            self._file.close()
+
+        self._lines = self._file.readlines()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self._file.close()
+
+    def set(self, field_name: str, value) -> None:
+        """Sets a top level field.
+
+        Args:
+            field_name (str): The name of the field.
+            value: The new value. It is written as is.
+
+        Raises:
+            KeyError: If config.yml has no such field.
+
+        Returns:
+            None
+        """
+        field_found = False
+        for i, line in enumerate(self._lines):
+            if line.startswith(f"{field_name}:"):
+                self._lines[i] = f"{field_name}: {value}\n"
+                field_found = True
+
+        if not field_found:
+            raise KeyError(field_name)
+        self._changed = True
+
+    def commit(self) -> None:
+        """Writes the changes to disk if there are any.
+
+        Raises:
+            OSError: If the new contents cannot be written next to config.yml or renamed over it, for example because
+                     config.yml is a file bind mount or its directory is read only. config.yml is left unchanged.
+
+        Returns:
+            None
+        """
+        if not self._changed:
+            return
+
+        logger = PatchesLogger.get_logger()
+
+        data = ''.join(self._lines)
+        path = os.path.realpath(self.path)
+        directory = os.path.dirname(path)
+        temp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+        try:
+            with open(temp_path, 'w') as temp_file:
+                temp_file.write(data)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.chmod(temp_path, os.fstat(self._file.fileno()).st_mode & 0o7777)
+            os.replace(temp_path, path)
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError as e:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            logger.error(f"Unable to replace {path}: {e}. Its directory must be writable and {path} must not be a "
+                         f"file bind mount. Mount the directory that holds it instead. {path} was not changed.")
+            raise
+
+        self._changed = False
+
+
+def update_config_fields(updates: Dict[str, str], config_file_path: str = 'config.yml') -> None:
+    """
+    Updates several fields in config.yml in a single transaction.
+
+    Args:
+        updates (dict): The new value of each field, keyed by field name.
+        config_file_path (str): The path of the config file. Defaults to config.yml.
 
     Returns:
         None
     """
-    config_file_path = 'config.yml'
     logger = PatchesLogger.get_logger()
 
-    with open(config_file_path, 'r') as config_file:
-        lines = config_file.readlines()
+    try:
+        with ConfigTransaction(config_file_path) as config:
+            for field_name, value in updates.items():
+                try:
+                    config.set(field_name, value)
+                except KeyError:
+                    logger.error(f"Field name '{field_name}' not found in config.yml")
+                    exit(1)
+                logger.info(f"Replaced {field_name} with {value}")
+    except OSError as e:
+        logger.error(f"{config_file_path} was not updated: {e}")
+        exit(1)
 
-    # Find and update the fields. We are using this instead of the YAML library to avoid deleting all the comments
-    field_found = False
-    for i, line in enumerate(lines):
-        if line.startswith(f"{field_name}:"):
-            lines[i] = f"{field_name}: {file_name}\n"
-            logger.info(f"Replaced {field_name} with {file_name}")
-            field_found = True
 
-    if not field_found:
-        logger.error(f"Field name '{field_name}' not found in config.yml")
-        exit(1)
+def update_config_file(field_name, file_name):
+    """
+    Updates the specified field in the config.yml file with the given absolute file path.
+
+    Args:
+        field_name (str): Name of the field to update.
+        file_name (str): The name of the certificate.
+
+    Raises:
+        ValueError: If an invalid field name is provided.
 
-    # Write back modified data to config.yml
-    with open(config_file_path, 'w') as config_file:
-        config_file.writelines(lines)
+    Returns:
+        None
+    """
+    update_config_fields({field_name: file_name})
 
@@ -1,21 +1,34 @@
 import argparse
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from sys import exit
+from typing import List, Optional
 
-import yaml
 from cryptography import x509
-from cryptography.exceptions import InvalidSignature
-from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.serialization import pkcs12
 
-from helper_functions import PatchesLogger, ask_yes_no, convert_pem_files, update_config_file
+from artifact_cache import ArtifactCache, pem_blocks
+from artifact_writer import ArtifactWriter
+from helper_functions import ConfigTransaction, PatchesLogger, ask_yes_no, convert_pem_files, update_config_fields
+from patches_config import ConfigError, load_config
+from timings import add_instrumentation_arguments, instrumented, timings
+from trust_store import TrustStore, is_self_signed
 
 logger = PatchesLogger.get_logger()
 
+# The extensions of the files checked by --validate-dir
+CANDIDATE_EXTENSIONS = ('.p12', '.pfx', '.pem', '.crt')
 
-def verify_pem_files(server_pem_file, root_ca_pem_files):
+# Set in each --validate-dir worker process by _init_validate_worker
+_worker_trust_store = None
+_worker_config_data = None
+_worker_password = None
+
+
+def verify_pem_files(server_pem_file, root_ca_pem_files, artifacts=None):
     """Verify if the given files are valid PEM certificate files.
 
     This function checks if the provided files are valid PEM certificate files.
@@ -24,24 +37,27 @@ def verify_pem_files(server_pem_file, root_ca_pem_files):
     Args:
         server_pem_file (str): The path to the server PEM certificate file.
         root_ca_pem_files (list): A list of paths to the ROOT_CA PEM certificate files.
+        artifacts (ArtifactCache, optional): The run's artifact cache. The parsed
+            certificates are kept in it for the later stages.
 
     Returns:
         bool: True if all files are valid PEM certificate files, False otherwise.
     """
+    if artifacts is None:
+        artifacts = ArtifactCache()
+
     try:
         # Verify server PEM file
         if not os.path.isfile(server_pem_file):
             logger.error(f"File not found: {server_pem_file}")
             return False
 
-        with open(server_pem_file, 'rb') as file:
-            pem_data = file.read()
-            try:
-                x509.load_pem_x509_certificate(pem_data, default_backend())
-                # Additional checks or validations can be performed on the certificate object if needed
-            except Exception as e:
-                logger.error(f"Invalid server PEM file: {server_pem_file} - {str(e)}")
-                return False
+        try:
+            artifacts.certificate(server_pem_file)
+            # Additional checks or validations can be performed on the certificate object if needed
+        except Exception as e:
+            logger.error(f"Invalid server PEM file: {server_pem_file} - {str(e)}")
+            return False
 
         # Verify root CA PEM files
         for root_ca_pem_file in root_ca_pem_files:
@@ -49,14 +65,12 @@ def verify_pem_files(server_pem_file, root_ca_pem_files):
                 logger.error(f"File not found: {root_ca_pem_file}")
                 return False
 
-            with open(root_ca_pem_file, 'rb') as file:
-                pem_data = file.read()
-                try:
-                    x509.load_pem_x509_certificate(pem_data, default_backend())
-                    # Additional checks or validations can be performed on the certificate object if needed
-                except Exception as e:
-                    logger.error(f"Invalid ROOT_CA PEM file: {root_ca_pem_file} - {str(e)}")
-                    return False
+            try:
+                artifacts.certificate(root_ca_pem_file)
+                # Additional checks or validations can be performed on the certificate object if needed
+            except Exception as e:
+                logger.error(f"Invalid ROOT_CA PEM file: {root_ca_pem_file} - {str(e)}")
+                return False
 
         return True
 
@@ -65,47 +79,50 @@ def verify_pem_files(server_pem_file, root_ca_pem_files):
         exit(1)
 
 
-def validate_server_cert(server_cert_file, root_ca_cert_files):
+def validate_server_cert(server_cert_file, root_ca_cert_files, trust_store=None, intermediate_cert_files=None,
+                         artifacts=None):
     """Validate server's PEM file against the root CA certs.
 
     This function validates if the server certificate in the provided PEM file
-    has been signed by any one of the root CA certificates.
+    chains up to any one of the root CA certificates, either directly or through
+    the provided intermediate CA certificates. RSA, ECDSA and Ed25519 CA keys are
+    supported. The CA certs are indexed by subject and key identifier so only the
+    signature of the matching CA is verified at each step of the chain.
 
     Args:
         server_cert_file (str): Path to the server's PEM certificate file.
         root_ca_cert_files (list): List of paths to root CA PEM certificate files.
+        trust_store (TrustStore, optional): An index of the CA certs built
+            once per run. If None, one is built from root_ca_cert_files and
+            intermediate_cert_files.
+        intermediate_cert_files (list, optional): List of paths to intermediate
+            CA PEM certificate files. Only used when trust_store is None.
+        artifacts (ArtifactCache, optional): The run's artifact cache. Defaults
+            to the trust store's cache.
 
     Returns:
-        str: File path of the root CA certificate that signed the server certificate,
-             or an empty string if no match is found.
+        str: File path of the root CA certificate the server certificate chains to,
+             or an empty string if no chain is found.
     """
     try:
-        # Load server certificate
-        with open(server_cert_file, 'rb') as file:
-            server_cert_data = file.read()
-            server_cert = x509.load_pem_x509_certificate(server_cert_data, default_backend())
+        if trust_store is None:
+            trust_store = TrustStore.from_files(root_ca_cert_files, intermediate_files=intermediate_cert_files,
+                                                artifacts=artifacts)
+        if artifacts is None:
+            artifacts = trust_store.artifacts
 
-        for root_ca_cert_file in root_ca_cert_files:
-            # Load root CA certificate
-            with open(root_ca_cert_file, 'rb') as file:
-                root_ca_cert_data = file.read()
-                root_ca_cert = x509.load_pem_x509_certificate(root_ca_cert_data, default_backend())
-
-            # Validate server certificate against the root CA certificate
-            try:
-                root_ca_cert.public_key().verify(
-                    server_cert.signature,
-                    server_cert.tbs_certificate_bytes,
-                    padding.PKCS1v15(),
-                    server_cert.signature_hash_algorithm,
-                )
-            except InvalidSignature:
-                continue  # Try the next root CA cert
-
-            logger.info(f"The server's PEM file is signed by the root CA cert: {root_ca_cert_file}")
+        # Load server certificate
+        server_cert = artifacts.certificate(server_cert_file)
+
+        chain = trust_store.build_chain(server_cert)
+        if chain is not None:
+            for intermediate_file, _ in chain[:-1]:
+                logger.info(f"The chain passes through the intermediate CA cert: {intermediate_file}")
+            root_ca_cert_file = chain[-1][0]
+            logger.info(f"The server's PEM file chains to the root CA cert: {root_ca_cert_file}")
             return root_ca_cert_file
 
-        logger.error("The server's PEM file is not signed by any of the provided root CA certs.")
+        logger.error("The server's PEM file does not chain to any of the provided root CA certs.")
         return ""
 
     except FileNotFoundError as e:
@@ -116,7 +133,61 @@ def validate_server_cert(server_cert_file, root_ca_cert_files):
         exit(1)
 
 
-def verify_certificate_common_name(certificate_file, config_field_name, certificate_type):
+def write_fullchain(server_cert_file, trust_store, fullchain_file, writer):
+    """Write the server certificate followed by its intermediate CA certificates.
+
+    The certificates are written leaf first, in chain order, which is the order
+    nginx expects in ssl_certificate. The root CA certificate is left out because
+    clients must already trust it. The chain links verified by validate_server_cert
+    are cached in the trust store, so no signature is verified again here.
+
+    Args:
+        server_cert_file (str): Path to the server's PEM certificate file.
+        trust_store (TrustStore): The trust store used to validate the server cert.
+        fullchain_file (str): Path of the full chain file to write.
+        writer (ArtifactWriter): The run's writer. The file is staged and published through it so that it is
+            replaced atomically and synced with the other imported files.
+
+    Returns:
+        int: The number of intermediate CA certificates written after the server certificate.
+    """
+    server_cert = trust_store.artifacts.certificate(server_cert_file)
+
+    chain = trust_store.build_chain(server_cert)
+    if chain is None:
+        logger.error(f"Unable to build the certificate chain for {server_cert_file}.")
+        exit(1)
+
+    intermediates = [certificate for path, certificate in chain if not trust_store.is_trusted(path)]
+    chain_pem = b''.join(certificate.public_bytes(encoding=serialization.Encoding.PEM)
+                         for certificate in [server_cert] + intermediates)
+    with writer.begin(os.path.dirname(fullchain_file) or '.', os.path.basename(fullchain_file)) as staged:
+        staged.add(os.path.basename(fullchain_file), chain_pem)
+
+    return len(intermediates)
+
+
+def common_name_matches(common_name, config_data, config_field_name, domain_key):
+    """Check a certificate's common name against a name field in config.yml.
+
+    The common name matches if it equals the field's value on its own or followed
+    by the domain in domain_key. An empty field matches any common name.
+
+    Args:
+        common_name (str): The common name from the certificate.
+        config_data (PatchesConfig): The config.yml snapshot, or any mapping with get.
+        config_field_name (str): The name field, for example SERVER_NAME.
+        domain_key (str): The domain field, for example SERVER_DOMAIN.
+
+    Returns:
+        bool: True if the common name matches, False otherwise.
+    """
+    config_value = config_data.get(config_field_name)
+    domain = config_data.get(domain_key, "") or ""
+    return not config_value or common_name in (config_value, f"{config_value}.{domain}")
+
+
+def verify_certificate_common_name(certificate_file, config_field_name, certificate_type, artifacts=None):
     """Verify the common name field in a certificate.
 
     This function opens the certificate file, verifies that the common name field
@@ -127,23 +198,26 @@ def verify_certificate_common_name(certificate_file, config_field_name, certific
         certificate_file (str): The path to the certificate file.
         config_field_name (str): The name of the field in `config.yml` to compare.
         certificate_type (str): Either "SERVER" or "CA".
+        artifacts (ArtifactCache, optional): The run's artifact cache. The certificate
+            is only parsed if it has not parsed it already. config.yml is read through
+            the shared config snapshot, which is recompiled only when the file changes.
 
     Returns:
         bool: True if the common name matches and the corresponding field is updated,
               False otherwise.
     """
+    if artifacts is None:
+        artifacts = ArtifactCache()
+
     try:
         # Load the certificate
-        with open(certificate_file, "rb") as file:
-            cert_data = file.read()
-            cert = x509.load_pem_x509_certificate(cert_data, default_backend())
+        cert = artifacts.certificate(certificate_file)
 
         # Get the common name from the certificate
         common_name = cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value
 
         # Load config.yml
-        with open("config.yml", "r") as file:
-            config_data = yaml.safe_load(file)
+        config_data = load_config("config.yml")
 
         config_value = config_data.get(config_field_name)
         if certificate_type not in ["SERVER", "ROOT_CA"]:
@@ -155,13 +229,15 @@ def verify_certificate_common_name(certificate_file, config_field_name, certific
         if domain is None:
             domain = ""
 
-        if config_value and common_name not in (config_value, f"{config_value}.{domain}"):
+        if not common_name_matches(common_name, config_data, config_field_name, domain_key):
             # Prompt the user to update the corresponding field in config.yml
             prompt = f"The common name in the certificate ({common_name}) does not match the expected value " \
                      f"({config_value + '.' + domain}).\nDo you want to update {config_field_name} in config.yml to " \
                      f"match the certificate? If you do not, this is a fatal error and the program will exit. You " \
                      f"will need to fix the field manually."
             if ask_yes_no(prompt):
+                # The domain and name updates are written to config.yml together in one transaction
+                updates = {}
                 # Check if the field name contains a DNS suffix and drop it
                 if '.' in common_name:
                     logger.info(f"Confirming the DNS suffix in the common name {common_name} matches the value"
@@ -175,15 +251,16 @@ def verify_certificate_common_name(certificate_file, config_field_name, certific
                             parts = common_name.split(".")
                             # Get just the DNS suffix portion (everything after the name)
                             dns_suffix = ".".join(parts[1:])
-                            update_config_field(domain_key, dns_suffix)
+                            updates[domain_key] = dns_suffix
                         else:
                             logger.error("Terminating.")
                             exit(1)
                     else:
                         logger.info(f"{domain_key} value is correct. Continuing...")
                 else:
-                    update_config_field(domain_key, "")
-                return update_config_field(config_field_name, common_name.split('.')[0])
+                    updates[domain_key] = ""
+                updates[config_field_name] = common_name.split('.')[0]
+                return apply_config_updates(updates)
             else:
                 logger.error("No changes made to the corresponding field.")
                 return False
@@ -193,6 +270,10 @@ def verify_certificate_common_name(certificate_file, config_field_name, certific
     except FileNotFoundError:
         logger.error("Certificate file or config.yml file not found.")
         exit(1)
+    except ConfigError as e:
+        for problem in e.problems:
+            logger.error(f"config.yml: {problem}")
+        exit(1)
     except Exception as e:
         logger.error(f"Error occurred: {str(e)}")
         exit(1)
@@ -211,44 +292,97 @@ def update_config_field(config_field_name, new_value):
     Returns:
         bool: True if the field is updated successfully, False otherwise.
     """
-    try:
-        with open("config.yml", "r") as file:
-            lines = file.readlines()
+    return apply_config_updates({config_field_name: new_value})
 
-        with open("config.yml", "w") as file:
-            for line in lines:
-                if line.strip().startswith(config_field_name + ":"):
-                    file.write(f"{config_field_name}: {new_value}\n")
-                else:
-                    file.write(line)
 
-        logger.info(f"{config_field_name} field updated in config.yml.")
+def apply_config_updates(updates):
+    """Update several fields in config.yml in one atomic transaction.
+
+    Args:
+        updates (dict): The new value of each field, keyed by field name.
+
+    Returns:
+        bool: True if the fields are updated successfully, False otherwise.
+    """
+    try:
+        with ConfigTransaction("config.yml") as config:
+            for config_field_name, new_value in updates.items():
+                config.set(config_field_name, new_value)
+
+        for config_field_name in updates:
+            logger.info(f"{config_field_name} field updated in config.yml.")
         return True
     except FileNotFoundError:
         logger.error("config.yml file not found.")
         return False
+    except KeyError as e:
+        logger.error(f"Field {e.args[0]} not found in config.yml.")
+        return False
     except Exception as e:
         logger.error(f"Error occurred while updating config.yml: {str(e)}")
         return False
 
 
-def convert_pkcs_to_pem(pkcs_file, server_pem_folder, root_ca_pem_folder, password=None):
+def split_ca_certificates(ca_certs):
+    """Split the CA certificates from a bundle into root CAs and intermediate CAs.
+
+    A CA certificate is treated as a root unless another certificate in the bundle
+    issued it. Self-signed roots are therefore always roots, and if a bundle stops
+    at an intermediate, the topmost intermediate becomes the trust anchor, which
+    matches how the bundle was treated before intermediates were supported.
+
+    Args:
+        ca_certs (list): The CA certificates from the bundle.
+
+    Returns:
+        tuple: A tuple containing the list of root CA certificates and the list of
+               intermediate CA certificates.
+    """
+    subjects = {}
+    for ca_cert in ca_certs:
+        subjects.setdefault(ca_cert.subject, []).append(ca_cert)
+
+    root_certs = []
+    intermediate_certs = []
+    for ca_cert in ca_certs:
+        issuers = [other for other in subjects.get(ca_cert.issuer, []) if other is not ca_cert]
+        if issuers and not is_self_signed(ca_cert):
+            intermediate_certs.append(ca_cert)
+        else:
+            root_certs.append(ca_cert)
+            if not is_self_signed(ca_cert):
+                common_name = ca_cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value
+                logger.warning(f"The bundle does not include the root CA that issued {common_name}. {common_name} "
+                               f"will be used as the root CA.")
+
+    return root_certs, intermediate_certs
+
+
+def convert_pkcs_to_pem(pkcs_file, server_pem_folder, root_ca_pem_folder, password=None, writer=None):
     """Convert a PKCS file to separate PEM files.
 
-    This function takes a PKCS file and converts it into two separate PEM files:
-    one containing the server's private and public certificate, and the other
-    containing the root CA's public certificate. The PEM files are saved in the
-    provided server PEM folder and root CA PEM folder, respectively, using the
-    common names as file names.
+    This function takes a PKCS file and converts it into separate PEM files:
+    one containing the server's private and public certificate, one for each
+    root CA's public certificate and one for each intermediate CA's public
+    certificate. The server and intermediate PEM files are saved in the provided
+    server PEM folder and the root CA PEM files in the root CA PEM folder, using
+    the common names as file names.
+
+    The files are staged and published through the writer. The server PEM file
+    holds the unencrypted private key, so it is created with owner only
+    permissions.
 
     Args:
         pkcs_file (str): The path to the PKCS file.
-        server_pem_folder (str): The folder path to save the server PEM file.
-        root_ca_pem_folder (str): The folder path to save the root CA PEM file.
+        server_pem_folder (str): The folder path to save the server and intermediate CA PEM files.
+        root_ca_pem_folder (str): The folder path to save the root CA PEM files.
         password (str, optional): The password for the PKCS file. Defaults to None.
+        writer (ArtifactWriter, optional): The run's writer, which syncs the files at the end of the import.
+            Defaults to a writer of its own.
 
     Returns:
-        tuple: A tuple containing the paths to the server PEM file and the root CA PEM file.
+        tuple: A tuple containing the path to the server PEM file, the list of root CA PEM files and the list of
+               intermediate CA PEM files.
     """
     with open(pkcs_file, "rb") as file:
         pkcs_data = file.read()
@@ -265,9 +399,6 @@ def convert_pkcs_to_pem(pkcs_file, server_pem_folder, root_ca_pem_folder, passwo
     common_name_server = pkcs12_data[1].subject.get_attributes_for_oid(
         pkcs12.x509.NameOID.COMMON_NAME)[0].value
 
-    # Generate file paths with common names
-    server_pem_file = os.path.join(server_pem_folder, f"{common_name_server}.pem")
-
     # Export server's certificate (private and public) to PEM
     logger.info("Exporting server certificate to PEM format...")
     server_pem = pkcs12_data[0].private_bytes(
@@ -276,31 +407,244 @@ def convert_pkcs_to_pem(pkcs_file, server_pem_folder, root_ca_pem_folder, passwo
         encryption_algorithm=serialization.NoEncryption(),
     ) + pkcs12_data[1].public_bytes(encoding=serialization.Encoding.PEM)
 
-    # Write server's PEM file
-    with open(server_pem_file, "wb") as file:
-        file.write(server_pem)
+    root_certs, intermediate_certs = split_ca_certificates(pkcs12_data[2])
+    logger.info(f"The bundle contains {len(root_certs)} root CA certs and {len(intermediate_certs)} intermediate CA "
+                f"certs.")
 
-    # Write root CA PEM files
-    root_ca_pem_files = []
-    for i, ca_cert in enumerate(pkcs12_data[2]):
-        common_name_root_ca = ca_cert.subject.get_attributes_for_oid(
-            pkcs12.x509.NameOID.COMMON_NAME)[0].value
-        root_ca_pem_file = os.path.join(root_ca_pem_folder, f"{common_name_root_ca}.pem")
-        root_ca_pem_files.append(root_ca_pem_file)
-        root_ca_pem = ca_cert.public_bytes(encoding=serialization.Encoding.PEM)
-        with open(root_ca_pem_file, "wb") as file:
-            file.write(root_ca_pem)
+    def ca_pem_files(ca_certs):
+        # Keyed by file name so a CA that appears twice in the bundle is written once
+        files = {}
+        for ca_cert in ca_certs:
+            common_name_ca = ca_cert.subject.get_attributes_for_oid(pkcs12.x509.NameOID.COMMON_NAME)[0].value
+            files[f"{common_name_ca}.pem"] = ca_cert.public_bytes(encoding=serialization.Encoding.PEM)
+        return files
 
-    return server_pem_file, root_ca_pem_files
+    writer = writer or ArtifactWriter()
 
+    # Write the server's PEM file and the intermediate CA PEM files
+    intermediate_files = ca_pem_files(intermediate_certs)
+    intermediate_files.pop(f"{common_name_server}.pem", None)
+    with writer.begin(server_pem_folder, common_name_server) as staged:
+        server_pem_file = staged.add(f"{common_name_server}.pem", server_pem, private=True)
+        intermediate_pem_files = [staged.add(file_name, data) for file_name, data in intermediate_files.items()]
 
-if __name__ == '__main__':
+    # Write the root CA PEM files
+    with writer.begin(root_ca_pem_folder, common_name_server) as staged:
+        root_ca_pem_files = [staged.add(file_name, data) for file_name, data in ca_pem_files(root_certs).items()]
+
+    return server_pem_file, root_ca_pem_files, intermediate_pem_files
 
+
+def load_candidate(candidate_file, artifacts, password=None):
+    """Decode a candidate server certificate file without writing anything.
+
+    PKCS#12 files are decoded the same way as convert_pkcs_to_pem. PEM files
+    may hold the private key, the server certificate and any intermediate CA
+    certificates after it.
+
+    Args:
+        candidate_file (str): The path to a .p12, .pfx, .pem or .crt file.
+        artifacts (ArtifactCache): The cache to read the file through.
+        password (str, optional): The password for PKCS#12 files. Defaults to None.
+
+    Returns:
+        tuple: The server certificate, its private key (or None) and a list of
+               (name, certificate) tuples for the CA certificates in the file.
+    """
+    if candidate_file.lower().endswith(('.p12', '.pfx')):
+        private_key, certificate, ca_certs = pkcs12.load_key_and_certificates(
+            bytes(artifacts.read(candidate_file)), password.encode('utf-8') if password is not None else None)
+        if certificate is None:
+            raise ValueError("The PKCS#12 file does not contain a certificate.")
+        return certificate, private_key, [(f"{candidate_file}#{i}", ca_cert) for i, ca_cert in enumerate(ca_certs)]
+
+    certificates = artifacts.certificates(candidate_file)
+    if not certificates:
+        raise ValueError("The file does not contain a PEM certificate.")
+    return certificates[0], artifacts.private_key(candidate_file), \
+        [(f"{candidate_file}#{i}", ca_cert) for i, ca_cert in enumerate(certificates[1:], 1)]
+
+
+def validate_candidate(candidate_file, trust_store, config_data, password=None):
+    """Run every import check on one candidate file and report the result.
+
+    The checks run in the same order as a normal import: decoding, PEM
+    validation (including whether the private key matches the certificate),
+    the signature chain to a trusted root CA and the common name check against
+    config.yml. Files that hold only certificates, such as a plain .crt, skip
+    the private key check and are reported with "certificate_only". A file
+    that holds a private key which cannot be loaded, for example because it is
+    encrypted, still fails. Nothing is written to disk and the user is never
+    prompted.
+
+    Args:
+        candidate_file (str): The path to the candidate file.
+        trust_store (TrustStore): The trusted root CAs and any shared intermediates.
+        config_data (PatchesConfig): The config.yml snapshot. An empty dict skips the
+            common name check.
+        password (str, optional): The password for PKCS#12 files. Defaults to None.
+
+    Returns:
+        dict: One report entry. "ok" says whether every check passed. On failure,
+              "stage" names the check that failed and "reason" says why.
+    """
+    started = stage_started = time.perf_counter()
+    result = {'file': candidate_file, 'ok': False, 'stage': None, 'reason': None}
+    stage = 'decode'
+
+    def next_stage(next_stage_name):
+        # Record how long the finished stage took before moving on
+        nonlocal stage, stage_started
+        now = time.perf_counter()
+        timings.add(stage, now - stage_started, candidate_file)
+        stage, stage_started = next_stage_name, now
+
+    try:
+        certificate, private_key, ca_certs = load_candidate(candidate_file, trust_store.artifacts, password)
+        common_names = certificate.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+        result['common_name'] = common_names[0].value if common_names else None
+        result['serial'] = format(certificate.serial_number, 'x')
+        result['not_valid_after'] = certificate.not_valid_after_utc.isoformat()
+
+        next_stage('pem')
+        if private_key is None:
+            # A PKCS#12 file is already decrypted here, so a missing key means it has none
+            is_pkcs12 = candidate_file.lower().endswith(('.p12', '.pfx'))
+            if not is_pkcs12 and any(label.endswith('PRIVATE KEY')
+                                     for label, _ in pem_blocks(trust_store.artifacts.read(candidate_file))):
+                raise ValueError("The file does not contain an unencrypted private key.")
+            result['certificate_only'] = True
+        else:
+            public_key_format = (serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+            if private_key.public_key().public_bytes(*public_key_format) != \
+                    certificate.public_key().public_bytes(*public_key_format):
+                raise ValueError("The private key does not match the certificate.")
+
+        next_stage('signature')
+        chain = trust_store.extended(ca_certs).build_chain(certificate)
+        if chain is None:
+            raise ValueError("The certificate does not chain to any of the trusted root CA certs.")
+        result['chain'] = [ca_cert.subject.rfc4514_string() for _, ca_cert in chain]
+
+        next_stage('common_name')
+        if result['common_name'] is None:
+            raise ValueError("The certificate has no common name.")
+        if not common_name_matches(result['common_name'], config_data, "SERVER_NAME", "SERVER_DOMAIN"):
+            raise ValueError(f"The common name {result['common_name']} does not match SERVER_NAME in config.yml.")
+
+        result['ok'] = True
+    except Exception as e:
+        result['stage'] = stage
+        result['reason'] = str(e) or type(e).__name__
+
+    timings.add(stage, time.perf_counter() - stage_started, candidate_file)
+    result['seconds'] = round(time.perf_counter() - started, 6)
+    return result
+
+
+def find_candidates(directory):
+    """List the certificate files under a directory, recursively, in sorted order."""
+    candidates = []
+    for root, _, files in os.walk(directory):
+        candidates.extend(os.path.join(root, name) for name in files if name.lower().endswith(CANDIDATE_EXTENSIONS))
+    return sorted(candidates)
+
+
+def _init_validate_worker(root_ca_files, intermediate_files, config_data, password, log_queue, timings_enabled):
+    """Builds the trust store once in each --validate-dir worker process.
+
+    Args:
+        root_ca_files (list): The paths of the trusted root CA PEM files.
+        intermediate_files (list): The paths of shared intermediate CA PEM files.
+        config_data (PatchesConfig): The config.yml snapshot.
+        password (str, optional): The password for PKCS#12 files.
+        log_queue (multiprocessing.Queue): The parent process's log queue. See PatchesLogger.log_queue.
+        timings_enabled (bool): Whether to record stage timings.
+
+    Returns:
+        None
+    """
+    global _worker_trust_store, _worker_config_data, _worker_password
+    PatchesLogger.configure_worker(log_queue)
+    timings.configure_worker(timings_enabled)
+    _worker_trust_store = TrustStore.from_files(root_ca_files, intermediate_files=intermediate_files)
+    _worker_config_data = config_data
+    _worker_password = password
+
+
+def _validate_candidate_in_worker(candidate_file):
+    """Validates one candidate file inside a worker process. Returns the report entry and the stage timings."""
+    result = validate_candidate(candidate_file, _worker_trust_store, _worker_config_data, _worker_password)
+    return result, timings.drain()
+
+
+def validate_directory(directory, root_ca_files, intermediate_files, report_file, config_data, password=None,
+                       workers=1):
+    """Validate every certificate file under a directory and write a JSONL report.
+
+    Each file gets the same checks as an import (see validate_candidate). The
+    files are spread across a pool of worker processes, and each result is
+    written to the report as soon as it is ready, so the report is not in file
+    order when workers > 1. Nothing is written to CERT_DIRECTORY.
+
+    Args:
+        directory (str): The directory holding the candidate files.
+        root_ca_files (list): The paths of the trusted root CA PEM files.
+        intermediate_files (list): The paths of intermediate CA PEM files shared by all candidates.
+        report_file (str): The path of the JSONL report to write.
+        config_data (PatchesConfig): The config.yml snapshot used for the common name check.
+        password (str, optional): The password for PKCS#12 files. Defaults to None.
+        workers (int): The number of worker processes. 1 validates in this process.
+
+    Returns:
+        tuple: The number of files that passed and the number that failed.
+    """
+    candidates = find_candidates(directory)
+    logger.info(f"Validating {len(candidates)} certificate files in {directory} with {workers} workers...")
+
+    passed = failed = 0
+    with open(report_file, 'w') as report:
+        def write_result(result):
+            nonlocal passed, failed
+            report.write(json.dumps(result, sort_keys=True) + "\n")
+            report.flush()
+            if result['ok']:
+                passed += 1
+            else:
+                failed += 1
+
+        if workers <= 1 or len(candidates) <= 1:
+            trust_store = TrustStore.from_files(root_ca_files, intermediate_files=intermediate_files)
+            for candidate_file in candidates:
+                write_result(validate_candidate(candidate_file, trust_store, config_data, password))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_validate_worker,
+                                     initargs=(root_ca_files, intermediate_files, config_data, password,
+                                               PatchesLogger.log_queue(), timings.enabled)) as executor:
+                futures = [executor.submit(_validate_candidate_in_worker, candidate_file)
+                           for candidate_file in candidates]
+                for future in as_completed(futures):
+                    result, samples = future.result()
+                    timings.merge(samples)
+                    write_result(result)
+
+    return passed, failed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the command line parser for import_keys.
+
+    Returns:
+        ArgumentParser: The parser. patches_certs.py uses it for the matching subcommand.
+    """
     parser = argparse.ArgumentParser(description='Import certificates into Patches.')
     parser.add_argument('--server-pem-file', dest='server_pem_file', type=str,
                         help='Path to the server PEM certificate file')
     parser.add_argument('--root-ca-pem-file', dest='root_ca_pem_file', type=str,
                         help='Path to the ROOT_CA PEM certificate file')
+    parser.add_argument('--intermediate-pem-file', dest='intermediate_pem_files', type=str, action='append',
+                        default=[], help='Path to an intermediate CA PEM certificate file between the server cert and '
+                                         'the root CA cert. May be given more than once.')
     parser.add_argument('--pkcs-file', type=str,
                         help='Path to the PEM certificate file containing server cert and trust chain')
     parser.add_argument('--root-cert-directory', dest='root_cert_directory', type=str,
@@ -309,56 +653,145 @@ if __name__ == '__main__':
                         help='Directory path holding the regular server certificates')
     parser.add_argument('--pkcs-password', dest='pkcs_password', type=str,
                         help='Password for the PKCS file')
+    parser.add_argument('--trust-store-cache', dest='trust_store_cache', type=str, default=None,
+                        help='JSON file caching the subject and key identifier of each root CA file by file hash so '
+                             'unchanged root CA files are not parsed again on the next run.')
     parser.add_argument('--validate', dest='validate', action='store_true', default=False,
                         help='Run validation only. Do not copy files.')
+    parser.add_argument('--validate-dir', dest='validate_dir', type=str, default=None,
+                        help='Validate every .p12, .pfx, .pem and .crt file under this directory against the root CA '
+                             'certs in --root-ca-pem-file or --root-cert-directory and write a JSONL report. Nothing '
+                             'is written to --cert-directory.')
+    parser.add_argument('--report', dest='report', type=str, default='validation_report.jsonl',
+                        help='The JSONL report written by --validate-dir. Defaults to validation_report.jsonl.')
+    parser.add_argument('--workers', dest='workers', type=int, default=os.cpu_count() or 1,
+                        help='The number of worker processes used by --validate-dir. Defaults to the CPU count.')
+    add_instrumentation_arguments(parser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Imports or validates existing certificates for Patches.
+
+    Args:
+        argv (list, optional): The command line arguments without the program name. Defaults to sys.argv.
+
+    Returns:
+        int: The exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    with instrumented(args):
+        return import_certificates(parser, args)
+
 
-    # Parse command-line arguments
-    args = parser.parse_args()
+def import_certificates(parser, args):
+    """Runs import_keys with parsed command line arguments.
+
+    Args:
+        parser (ArgumentParser): The parser the arguments came from, used to report invalid combinations.
+        args (Namespace): The parsed arguments.
+
+    Returns:
+        int: The exit status.
+    """
+
+    if args.validate_dir:
+        if args.root_ca_pem_file:
+            bulk_root_ca_files = [args.root_ca_pem_file]
+        elif args.root_cert_directory and os.path.isdir(args.root_cert_directory):
+            bulk_root_ca_files = sorted(os.path.join(args.root_cert_directory, name)
+                                        for name in os.listdir(args.root_cert_directory)
+                                        if name.endswith(('.pem', '.crt')))
+        else:
+            bulk_root_ca_files = []
+        if not bulk_root_ca_files:
+            parser.error('--validate-dir needs the trusted root CA certs in --root-ca-pem-file or '
+                         '--root-cert-directory.')
+
+        try:
+            bulk_config_data = load_config("config.yml") if os.path.isfile("config.yml") else {}
+        except ConfigError as e:
+            for problem in e.problems:
+                logger.error(f"config.yml: {problem}")
+            exit(1)
+        passed, failed = validate_directory(args.validate_dir, bulk_root_ca_files, args.intermediate_pem_files,
+                                            args.report, bulk_config_data, args.pkcs_password, args.workers)
+        logger.info(f"{passed} files passed and {failed} files failed validation. See {args.report} for details.")
+        return 0 if failed == 0 else 1
 
     if (args.pkcs_file is None and (args.server_pem_file is None or args.root_ca_pem_file is None)) or \
             (args.pkcs_file is not None and (args.server_pem_file is not None or args.root_ca_pem_file is not None)):
         parser.error('Either provide --pkcs-file or both --server-pem-file and --root-ca-pem-file arguments.')
         exit(1)
 
+    # --validate checks PEM files in place. A PKCS#12 file has to be decoded and written out first, which --validate
+    # must not do, so bundles are checked with --validate-dir instead.
+    if args.pkcs_file is not None and args.validate:
+        parser.error('--validate cannot be used with --pkcs-file. To check a PKCS#12 file without importing it, pass '
+                     'the directory holding it to --validate-dir.')
+
     root_cert_directory = args.root_cert_directory
     cert_directory = args.cert_directory
     server_pem_file = args.server_pem_file
     root_ca_pem_files = [args.root_ca_pem_file]
+    intermediate_pem_files = args.intermediate_pem_files
     pkcs_password = args.pkcs_password
     validate = args.validate
 
+    # Every file the import writes is published through one writer so the import is synced to disk once, at the end
+    writer = ArtifactWriter()
+
     if args.pkcs_file and not validate:
-        server_pem_file, root_ca_pem_files = convert_pkcs_to_pem(args.pkcs_file, cert_directory, root_cert_directory,
-                                                                 pkcs_password)
+        with timings.span('decode', os.path.basename(args.pkcs_file)):
+            server_pem_file, root_ca_pem_files, bundle_intermediate_files = convert_pkcs_to_pem(
+                args.pkcs_file, cert_directory, root_cert_directory, pkcs_password, writer)
+        intermediate_pem_files = intermediate_pem_files + bundle_intermediate_files
+
+    # The phase timings of the import are recorded against the server certificate
+    item = os.path.basename(server_pem_file)
 
     # Verify the PEM files
     logger.info("Verify both files are in PEM format...")
 
-    result = verify_pem_files(server_pem_file, root_ca_pem_files)
+    # Every stage below reads the certificates and config.yml through this cache so each file is parsed once
+    artifacts = ArtifactCache()
+
+    with timings.span('pem', item):
+        result = verify_pem_files(server_pem_file, root_ca_pem_files + intermediate_pem_files, artifacts)
     if result:
         logger.info("Both PEM files are valid.")
     else:
         logger.error("The PEM files did not validate correctly.")
         exit(1)
 
-    logger.info("Validate that the server cert is signed by the root CA cert...")
+    logger.info("Validate that the server cert chains to the root CA cert...")
 
-    root_ca_pem_file = validate_server_cert(server_pem_file, root_ca_pem_files)
+    with timings.span('trust_store', item):
+        trust_store = TrustStore.from_files(root_ca_pem_files, args.trust_store_cache, intermediate_pem_files,
+                                            artifacts)
+    with timings.span('signature', item):
+        root_ca_pem_file = validate_server_cert(server_pem_file, root_ca_pem_files, trust_store, artifacts=artifacts)
+    trust_store.save_cache()
 
     if not root_ca_pem_file:
-        logger.error("Error: The server's PEM file is not signed by any of the provided root CA certs. Make sure you "
-                     "have the correct root CA cert.")
+        logger.error("Error: The server's PEM file does not chain to any of the provided root CA certs. Make sure you "
+                     "have the correct root CA cert and any intermediate CA certs.")
         exit(1)
 
     logger.info("Ensure that the common name in the root CA file matches ROOT_CA_NAME in config.yml...")
 
-    if verify_certificate_common_name(root_ca_pem_file, "ROOT_CA_NAME", "ROOT_CA"):
+    with timings.span('common_name', item):
+        root_ca_name_ok = verify_certificate_common_name(root_ca_pem_file, "ROOT_CA_NAME", "ROOT_CA", artifacts)
+    if root_ca_name_ok:
         logger.info("Root CA certificate common name verification successful.")
     else:
         logger.error("Root CA certificate common name verification failed.")
         exit(1)
 
-    if verify_certificate_common_name(server_pem_file, "SERVER_NAME", "SERVER"):
+    with timings.span('common_name', item):
+        server_name_ok = verify_certificate_common_name(server_pem_file, "SERVER_NAME", "SERVER", artifacts)
+    if server_name_ok:
         logger.info("Server certificate common name verification successful.")
     else:
         logger.error("Server certificate common name verification failed.")
@@ -367,13 +800,36 @@ if __name__ == '__main__':
     logger.info("Converting files to .crt/.key...")
 
     if not validate:
-        for pem_file in root_ca_pem_files:
-            convert_pem_files(pem_file)
+        with timings.span('convert', item):
+            try:
+                for pem_file in root_ca_pem_files:
+                    convert_pem_files(pem_file, artifacts, writer)
+
+                convert_pem_files(server_pem_file, artifacts, writer)
+            except ValueError as e:
+                logger.error(f"Unable to convert the PEM files: {e}")
+                exit(1)
+
+        # nginx serves this file so clients receive the intermediates along with the server cert
+        fullchain_file = os.path.join(cert_directory, f"{os.path.splitext(os.path.basename(server_pem_file))[0]}"
+                                                      f".fullchain.crt")
+        with timings.span('fullchain', item):
+            intermediate_count = write_fullchain(server_pem_file, trust_store, fullchain_file, writer)
+        logger.info(f"Wrote {fullchain_file} with {intermediate_count} intermediate CA certs.")
+
+        with timings.span('sync', item):
+            writer.sync()
+
+        # Record the imported files in config.yml in a single transaction
+        config_updates = {'ROOT_CA_PEM': os.path.basename(root_ca_pem_file),
+                          'SERVER_PEM': os.path.basename(server_pem_file),
+                          'SERVER_FULLCHAIN': os.path.basename(fullchain_file)}
+        if args.pkcs_file:
+            config_updates['PKCS_FILE'] = os.path.basename(args.pkcs_file)
+        with timings.span('config_update', item):
+            update_config_fields(config_updates)
+    return 0
 
-        convert_pem_files(server_pem_file)
 
-        # Call update_config_file for each field
-        update_config_file('ROOT_CA_PEM', os.path.basename(root_ca_pem_file))
-        update_config_file('SERVER_PEM', os.path.basename(server_pem_file))
-        if args.pkcs_file:
-            update_config_file('PKCS_FILE', os.path.basename(args.pkcs_file))
+if __name__ == '__main__':
+    exit(main())
@@ -4,20 +4,39 @@ export ROOT_CERT_DIRECTORY=${ROOT_CERT_DIRECTORY}
 export CERT_DIRECTORY=${CERT_DIRECTORY}
 export server_pem_file=${server_pem_file}
 export root_ca_pem_file=${root_ca_pem_file}
+export intermediate_pem_files=${intermediate_pem_files}
 export pkcs_file=${pkcs_file}
 export PKCS_PASSWORD=${PKCS_PASSWORD}
 export VALIDATE=${VALIDATE}
+export VALIDATE_DIR=${VALIDATE_DIR}
+export VALIDATE_REPORT=${VALIDATE_REPORT}
+export VALIDATE_WORKERS=${VALIDATE_WORKERS}
 
-if [ -n "$server_pem_file" ] && [ -n "$root_ca_pem_file" ]; then
+if [ -n "$VALIDATE_DIR" ]; then
+  # Bulk validation of every certificate file in VALIDATE_DIR. Nothing is written to CERT_DIRECTORY.
+  import_keys_args=(--validate-dir "${VALIDATE_DIR}" --root-cert-directory "${ROOT_CERT_DIRECTORY}" \
+    --report "${VALIDATE_REPORT:-validation_report.jsonl}")
+
+  [ -n "$PKCS_PASSWORD" ] && import_keys_args+=(--pkcs-password "$PKCS_PASSWORD")
+  [ -n "$VALIDATE_WORKERS" ] && import_keys_args+=(--workers "$VALIDATE_WORKERS")
+
+  python patches_certs.py validate "${import_keys_args[@]}"
+elif [ -n "$server_pem_file" ] && [ -n "$root_ca_pem_file" ]; then
   import_keys_args=(--root-cert-directory "${ROOT_CERT_DIRECTORY}" --cert-directory "${CERT_DIRECTORY}" \
     --server-pem-file "${server_pem_file}" --root-ca-pem-file "${root_ca_pem_file}")
-  
+
+  # Add an --intermediate-pem-file argument for each file in the colon separated intermediate_pem_files
+  IFS=':' read -r -a intermediate_files <<< "${intermediate_pem_files}"
+  for intermediate_file in "${intermediate_files[@]}"; do
+    [ -n "$intermediate_file" ] && import_keys_args+=(--intermediate-pem-file "$intermediate_file")
+  done
+
   # Add --validate argument if VALIDATE is set to true
   if [ "$VALIDATE" = true ]; then
     import_keys_args+=(--validate)
   fi
 
-  python import_keys.py "${import_keys_args[@]}"
+  python patches_certs.py import "${import_keys_args[@]}"
 elif [ -n "$pkcs_file" ]; then
   # Array to store import_keys.py arguments
   import_keys_args=(--root-cert-directory "${ROOT_CERT_DIRECTORY}" --cert-directory "${CERT_DIRECTORY}" \
@@ -31,8 +50,8 @@ elif [ -n "$pkcs_file" ]; then
     import_keys_args+=(--validate)
   fi
 
-  # Execute import_keys.py with the constructed arguments
-  python import_keys.py "${import_keys_args[@]}"
+  # Run the import through the patches-certs CLI with the constructed arguments
+  python patches_certs.py import "${import_keys_args[@]}"
 else
   echo "Either provide both server_pem_file and root_ca_pem_file arguments or provide pkcs_file argument."
   exit 1
@@ -0,0 +1,446 @@
+"""
+An inventory of the certificates in CERT_DIRECTORY and ROOT_CERT_DIRECTORY.
+
+Every .crt, .pem, .p12 and .pfx file under the scanned directories is parsed once. For each certificate in it the
+subject, SANs, issuer, serial number, SHA256 fingerprint, key type and validity are stored in a SQLite index. Files are
+keyed by path, mtime and size, so a later scan only parses the files that were added or changed and drops the ones that
+were removed. Queries such as "expiring within 30 days" or "issued by rootCA.lan" are then answered from the index.
+
+PKCS#12 files are opened with --pkcs-password, or with the password of the client the file is named after when
+--pkcs-password-source is given, the same sources generate_certificates.py takes. Files that could not be opened are
+retried on every scan that is given a password, so rerunning with the right one picks them up without touching them.
+
+    patches-certs inventory --cert-dir certs
+    patches-certs inventory --cert-dir certs --expiring-within 30
+    patches-certs inventory --cert-dir certs --issued-by rootCA.lan --format json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from sys import exit
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509 import Certificate
+from cryptography.x509.oid import NameOID
+
+from artifact_cache import ArtifactCache, pem_blocks
+from helper_functions import PKCS_PASSWORD_SOURCES, PatchesLogger, load_pkcs_passwords
+
+logger = PatchesLogger.get_logger()
+
+# The files that are scanned. Hidden files and directories, such as staging directories and caches, are skipped.
+INVENTORY_EXTENSIONS = ('.crt', '.pem', '.p12', '.pfx')
+
+# The name of the index file kept in CERT_DIRECTORY unless --index is given
+INDEX_FILE_NAME = '.inventory.sqlite'
+
+# Bump this if the layout of the index changes. An index with a different version is rebuilt.
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE certificates (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    common_name TEXT,
+    sans TEXT NOT NULL,
+    issuer TEXT NOT NULL,
+    issuer_common_name TEXT,
+    serial TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    key_type TEXT NOT NULL,
+    has_private_key INTEGER NOT NULL,
+    not_before INTEGER NOT NULL,
+    not_after INTEGER NOT NULL,
+    PRIMARY KEY (path, position)
+);
+CREATE INDEX certificates_not_after ON certificates (not_after);
+CREATE INDEX certificates_issuer ON certificates (issuer_common_name COLLATE NOCASE);
+CREATE INDEX certificates_fingerprint ON certificates (fingerprint);
+"""
+
+# The columns of a query result, in order
+COLUMNS = ('path', 'position', 'subject', 'common_name', 'sans', 'issuer', 'issuer_common_name', 'serial',
+           'fingerprint', 'key_type', 'has_private_key', 'not_before', 'not_after')
+
+
+def common_name(name: x509.Name) -> Optional[str]:
+    """Returns the first common name of a subject or issuer, or None if it has none."""
+    attributes = name.get_attributes_for_oid(NameOID.COMMON_NAME)
+    return attributes[0].value if attributes else None
+
+
+def key_type(certificate: Certificate) -> str:
+    """Describes the public key of a certificate, for example "RSA 4096" or "ECDSA secp256r1"."""
+    public_key = certificate.public_key()
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return f"RSA {public_key.key_size}"
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return f"ECDSA {public_key.curve.name}"
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return "Ed25519"
+    return type(public_key).__name__
+
+
+def subject_alt_names(certificate: Certificate) -> List[str]:
+    """Returns the DNS names and IP addresses in a certificate's subject alternative names."""
+    try:
+        extension = certificate.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+    except x509.ExtensionNotFound:
+        return []
+    return [str(name) for name in extension.value.get_values_for_type(x509.DNSName)] + \
+        [str(address) for address in extension.value.get_values_for_type(x509.IPAddress)]
+
+
+def certificate_row(path: str, position: int, certificate: Certificate, has_private_key: bool) -> tuple:
+    """Extracts the indexed fields of one certificate.
+
+    Args:
+        path (str): The file the certificate was found in.
+        position (int): The position of the certificate in the file, starting at 0.
+        certificate (Certificate): The certificate.
+        has_private_key (bool): Whether the file holds a private key.
+
+    Returns:
+        tuple: The values for the certificates table, in the order of COLUMNS.
+    """
+    return (path, position, certificate.subject.rfc4514_string(), common_name(certificate.subject),
+            json.dumps(subject_alt_names(certificate)), certificate.issuer.rfc4514_string(),
+            common_name(certificate.issuer), format(certificate.serial_number, 'x'),
+            certificate.fingerprint(hashes.SHA256()).hex(), key_type(certificate), int(has_private_key),
+            int(certificate.not_valid_before_utc.timestamp()), int(certificate.not_valid_after_utc.timestamp()))
+
+
+def load_file(path: str, artifacts: ArtifactCache, password: Optional[str] = None) \
+        -> Tuple[List[Certificate], bool]:
+    """Loads every certificate in one file.
+
+    Args:
+        path (str): The path of a PEM or PKCS#12 file.
+        artifacts (ArtifactCache): The cache to read the file through.
+        password (str, optional): The password for PKCS#12 files.
+
+    Raises:
+        ValueError: If the file cannot be decoded.
+
+    Returns:
+        tuple: The certificates in the file, the end entity certificate first for PKCS#12 files, and whether the file
+               holds a private key.
+    """
+    if is_pkcs12(path):
+        private_key, certificate, ca_certs = pkcs12.load_key_and_certificates(
+            bytes(artifacts.read(path)), password.encode('utf-8') if password is not None else None)
+        return ([certificate] if certificate is not None else []) + list(ca_certs), private_key is not None
+
+    # Only look for a private key block. The key itself is not needed, so it is not parsed.
+    has_private_key = any(label.endswith('PRIVATE KEY') for label, _ in pem_blocks(artifacts.read(path)))
+    return artifacts.certificates(path), has_private_key
+
+
+def is_pkcs12(path: str) -> bool:
+    """Returns whether a file is a PKCS#12 file, going by its extension."""
+    return path.lower().endswith(('.p12', '.pfx'))
+
+
+def load_client_passwords(source: str, directories: List[str], password_file: Optional[str] = None) \
+        -> Dict[str, Optional[str]]:
+    """Loads the password of every PKCS#12 file under the given directories from a password source.
+
+    generate_certificates.py names each client's PKCS#12 file after the client, so the file name without its extension
+    is looked up as the client name. Clients the source has no password for are logged and left out, so their files
+    fall back to --pkcs-password.
+
+    Args:
+        source (str): One of the PKCS_PASSWORD_SOURCES other than "prompt".
+        directories (list): The directories that are scanned.
+        password_file (str, optional): The path of the secrets file for the "file" source. Defaults to None.
+
+    Returns:
+        dict: The password of each client that has one, keyed by client name.
+    """
+    passwords = {}
+    clients = sorted({os.path.splitext(os.path.basename(path))[0] for path in find_files(directories)
+                      if is_pkcs12(path)})
+    for client in clients:
+        try:
+            passwords.update(load_pkcs_passwords(source, [client], password_file))
+        except (OSError, ValueError) as e:
+            logger.warning(f"No PKCS#12 password for {client} from the {source} password source: {e}")
+    return passwords
+
+
+def find_files(directories: List[str]) -> Iterator[str]:
+    """Yields the absolute path of every file with one of the INVENTORY_EXTENSIONS under the given directories, once
+    each."""
+    seen = set()
+    for directory in directories:
+        for dir_path, dir_names, file_names in os.walk(directory):
+            dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+            for file_name in sorted(file_names):
+                if file_name.startswith('.') or not file_name.lower().endswith(INVENTORY_EXTENSIONS):
+                    continue
+                path = os.path.abspath(os.path.join(dir_path, file_name))
+                if path not in seen:
+                    seen.add(path)
+                    yield path
+
+
+class CertificateInventory:
+    """A SQLite index of the certificates found in a set of directories.
+
+    Attributes:
+        path (str): The path of the index file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != INDEX_VERSION:
+            if version != 0:
+                logger.warning(f"Rebuilding {path} because it was written by a different version of the inventory.")
+            with self._connection:
+                self._connection.execute('DROP TABLE IF EXISTS certificates')
+                self._connection.execute('DROP TABLE IF EXISTS files')
+                self._connection.executescript(SCHEMA)
+                self._connection.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+
+    def close(self) -> None:
+        """Closes the index file."""
+        self._connection.close()
+
+    def scan(self, directories: List[str], password: Optional[str] = None,
+             client_passwords: Optional[Dict[str, Optional[str]]] = None) -> dict:
+        """Brings the index up to date with the files under the given directories.
+
+        Only files whose mtime or size changed since the last scan are parsed. Files that are no longer there are
+        removed from the index. Files that cannot be decoded are recorded with their error and retried once they
+        change, or on any scan that is given a password, since a missing or wrong password is the usual reason a
+        PKCS#12 file cannot be read.
+
+        Args:
+            directories (list): The directories to scan.
+            password (str, optional): The password for PKCS#12 files without a client password.
+            client_passwords (dict, optional): The password of each client's PKCS#12 file, keyed by the file name
+                                               without its extension. See load_client_passwords.
+
+        Returns:
+            dict: The number of files scanned, parsed, removed and that failed to parse.
+        """
+        client_passwords = client_passwords or {}
+        retry_errors = password is not None or bool(client_passwords)
+        indexed = {path: (mtime_ns, size, error) for path, mtime_ns, size, error in
+                   self._connection.execute('SELECT path, mtime_ns, size, error FROM files')}
+        stats = {'scanned': 0, 'parsed': 0, 'removed': 0, 'errors': 0}
+        artifacts = ArtifactCache()
+
+        with self._connection:
+            for path in find_files(directories):
+                stats['scanned'] += 1
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                previous = indexed.pop(path, None)
+                if previous is not None and previous[:2] == (status.st_mtime_ns, status.st_size) and \
+                        (previous[2] is None or not retry_errors):
+                    continue
+
+                stats['parsed'] += 1
+                rows, error = [], None
+                file_password = password
+                if is_pkcs12(path):
+                    file_password = client_passwords.get(os.path.splitext(os.path.basename(path))[0], password)
+                try:
+                    certificates, has_private_key = load_file(path, artifacts, file_password)
+                    rows = [certificate_row(path, position, certificate, has_private_key)
+                            for position, certificate in enumerate(certificates)]
+                except (OSError, ValueError, TypeError) as e:
+                    stats['errors'] += 1
+                    error = str(e) or type(e).__name__
+                    logger.warning(f"Unable to read {path}: {error}")
+                artifacts.invalidate(path)
+
+                self._connection.execute('DELETE FROM files WHERE path = ?', (path,))
+                self._connection.execute('INSERT INTO files VALUES (?, ?, ?, ?)',
+                                         (path, status.st_mtime_ns, status.st_size, error))
+                self._connection.executemany(f"INSERT INTO certificates VALUES ({', '.join('?' * len(COLUMNS))})",
+                                             rows)
+
+            # Whatever is left was indexed before but is gone now
+            scanned_roots = tuple(os.path.abspath(directory) + os.sep for directory in directories)
+            removed = [(path,) for path in indexed if path.startswith(scanned_roots)]
+            self._connection.executemany('DELETE FROM files WHERE path = ?', removed)
+            stats['removed'] = len(removed)
+
+        return stats
+
+    def query(self, expiring_within: Optional[int] = None, issued_by: Optional[str] = None,
+              name: Optional[str] = None) -> List[dict]:
+        """Returns the indexed certificates that match every given filter.
+
+        Args:
+            expiring_within (int, optional): Only certificates that expire within this many days, including those that
+                                             already expired.
+            issued_by (str, optional): Only certificates whose issuer has this common name or distinguished name. The
+                                       comparison ignores case.
+            name (str, optional): Only certificates with this common name or SAN. The comparison ignores case.
+
+        Returns:
+            list: One dict per certificate holding the COLUMNS, ordered by expiry. sans is a list and not_before and
+                  not_after are ISO 8601 timestamps.
+        """
+        conditions, parameters = [], []
+        if expiring_within is not None:
+            deadline = datetime.now(timezone.utc) + timedelta(days=expiring_within)
+            conditions.append('not_after <= ?')
+            parameters.append(int(deadline.timestamp()))
+        if issued_by is not None:
+            conditions.append('(issuer_common_name = ? COLLATE NOCASE OR issuer = ? COLLATE NOCASE)')
+            parameters += [issued_by, issued_by]
+        if name is not None:
+            conditions.append('(common_name = ? COLLATE NOCASE OR '
+                              'EXISTS (SELECT 1 FROM json_each(sans) WHERE value = ? COLLATE NOCASE))')
+            parameters += [name, name]
+
+        sql = f"SELECT {', '.join(COLUMNS)} FROM certificates"
+        if conditions:
+            sql += f" WHERE {' AND '.join(conditions)}"
+        sql += ' ORDER BY not_after, path, position'
+
+        results = []
+        for row in self._connection.execute(sql, parameters):
+            result = dict(zip(COLUMNS, row))
+            result['sans'] = json.loads(result['sans'])
+            result['has_private_key'] = bool(result['has_private_key'])
+            for field in ('not_before', 'not_after'):
+                result[field] = datetime.fromtimestamp(result[field], timezone.utc).isoformat()
+            results.append(result)
+        return results
+
+    def errors(self) -> List[Tuple[str, str]]:
+        """Returns the path and error of every file the last scans could not decode."""
+        return list(self._connection.execute('SELECT path, error FROM files WHERE error IS NOT NULL ORDER BY path'))
+
+
+def print_table(results: List[dict]) -> None:
+    """Prints query results as a table with one line per certificate."""
+    headers = ('EXPIRES', 'COMMON NAME', 'ISSUER', 'KEY', 'SERIAL', 'PATH')
+    rows = [(result['not_after'][:10], result['common_name'] or result['subject'],
+             result['issuer_common_name'] or result['issuer'], result['key_type'], result['serial'][:16],
+             result['path'] if result['position'] == 0 else f"{result['path']}#{result['position']}")
+            for result in results]
+    widths = [max([len(header)] + [len(row[i]) for row in rows]) for i, header in enumerate(headers)]
+    for row in [headers] + rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the command line parser for the inventory."""
+    parser = argparse.ArgumentParser(description='List and query the certificates in the certificate directories.')
+    parser.add_argument('--cert-dir', dest='cert_dir', type=str, default=os.getenv('CERT_DIRECTORY'),
+                        help='The certificate directory to scan. Defaults to $CERT_DIRECTORY.')
+    parser.add_argument('--root-cert-dir', dest='root_cert_dir', type=str, default=os.getenv('ROOT_CERT_DIRECTORY'),
+                        help='The root certificate directory to scan. Relative paths are relative to --cert-dir. '
+                             'Defaults to $ROOT_CERT_DIRECTORY. Not needed if it is inside --cert-dir.')
+    parser.add_argument('--index', dest='index', type=str, default=None,
+                        help=f'The SQLite index file. Defaults to {INDEX_FILE_NAME} in --cert-dir.')
+    parser.add_argument('--pkcs-password', dest='pkcs_password', type=str, default=os.getenv('PKCS_PASSWORD'),
+                        help='The password for PKCS#12 files. Defaults to $PKCS_PASSWORD.')
+    parser.add_argument('--pkcs-password-source', dest='pkcs_password_source', type=str,
+                        default=os.getenv('PKCS_PASSWORD_SOURCE') or None,
+                        choices=[source for source in PKCS_PASSWORD_SOURCES if source != 'prompt'],
+                        help='Open each client\'s PKCS#12 file with that client\'s password from this source, as '
+                             'generate does: shared uses PKCS_PASSWORD, env PKCS_PASSWORD_<CLIENT> and file the YAML '
+                             'file in --pkcs-password-file. Files without a client password use --pkcs-password. '
+                             'Defaults to $PKCS_PASSWORD_SOURCE.')
+    parser.add_argument('--pkcs-password-file', dest='pkcs_password_file', type=str,
+                        default=os.getenv('PKCS_PASSWORD_FILE'),
+                        help='A YAML file mapping client names to PKCS#12 passwords. Used with --pkcs-password-source '
+                             'file. Defaults to $PKCS_PASSWORD_FILE.')
+    parser.add_argument('--no-scan', dest='scan', action='store_false', default=True,
+                        help='Answer the query from the index as it is, without checking for changed files.')
+    parser.add_argument('--expiring-within', dest='expiring_within', type=int, default=None, metavar='DAYS',
+                        help='Only list certificates that expire within this many days, including expired ones.')
+    parser.add_argument('--issued-by', dest='issued_by', type=str, default=None,
+                        help='Only list certificates issued by the CA with this common name or distinguished name.')
+    parser.add_argument('--name', dest='name', type=str, default=None,
+                        help='Only list certificates with this common name or subject alternative name.')
+    parser.add_argument('--format', dest='format', choices=('table', 'json'), default='table',
+                        help='Print a table or one JSON object per line. Defaults to table.')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Scans the certificate directories and prints the certificates matching the query.
+
+    Args:
+        argv (list, optional): The command line arguments without the program name. Defaults to sys.argv.
+
+    Returns:
+        int: The exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if not args.cert_dir:
+        parser.error('--cert-dir is required when CERT_DIRECTORY is not set.')
+    if not os.path.isdir(args.cert_dir):
+        logger.error(f"The certificate directory {args.cert_dir} does not exist.")
+        exit(1)
+
+    directories = [args.cert_dir]
+    if args.root_cert_dir:
+        root_cert_dir = os.path.join(args.cert_dir, args.root_cert_dir)
+        if not os.path.isdir(root_cert_dir):
+            logger.error(f"The root certificate directory {root_cert_dir} does not exist.")
+            exit(1)
+        directories.append(root_cert_dir)
+
+    inventory = CertificateInventory(args.index or os.path.join(args.cert_dir, INDEX_FILE_NAME))
+    try:
+        if args.scan:
+            started = time.perf_counter()
+            client_passwords = None
+            # The prompt source only applies to generate, so the inventory falls back to --pkcs-password for it
+            if args.pkcs_password_source not in (None, 'prompt'):
+                client_passwords = load_client_passwords(args.pkcs_password_source, directories,
+                                                         args.pkcs_password_file)
+            stats = inventory.scan(directories, args.pkcs_password, client_passwords)
+            logger.info(f"Scanned {stats['scanned']} files in {time.perf_counter() - started:.2f} s: parsed "
+                        f"{stats['parsed']}, removed {stats['removed']}, {stats['errors']} could not be read.")
+
+        results = inventory.query(args.expiring_within, args.issued_by, args.name)
+        errors = inventory.errors()
+    finally:
+        inventory.close()
+
+    PatchesLogger.flush()
+    if args.format == 'json':
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print_table(results)
+
+    for path, error in errors:
+        logger.warning(f"{path} is not in the inventory because it could not be read: {error}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,304 @@
+"""
+This script maintains a reservoir of pre-generated private keys on disk so that certificate generation does not have to
+wait on key generation. Keys are grouped by key profile (algorithm and size), encrypted with the passphrase in the
+KEY_POOL_PASSPHRASE environment variable and handed out exactly once. generate_certificates.py tops the pool up at the
+end of every run. Run it with the `fill` command to top up the pool by hand:
+
+    python key_pool.py fill --pool-dir server_certs/key_pool --profile rsa-2048 --target 100
+"""
+
+import argparse
+import fcntl
+import os
+import subprocess
+import sys
+import uuid
+from typing import Optional
+
+from cryptography.hazmat.primitives import serialization
+
+from helper_functions import KEY_PROFILES, KeyProfile, PatchesLogger, PrivateKey, generate_key, get_key_profile
+
+logger = PatchesLogger.get_logger()
+
+# The environment variable holding the passphrase used to encrypt the keys in the pool
+PASSPHRASE_ENV = 'KEY_POOL_PASSPHRASE'
+
+# The file in each group directory that refills hold an flock on. The kernel releases the lock when the refill process
+# exits, however it exits, so a refill that died never blocks the next one.
+REFILL_LOCK_NAME = '.refill.lock'
+
+
+class KeyPool:
+    """An encrypted on-disk reservoir of pre-generated private keys.
+
+    Each key is stored in its own file under `<directory>/<key profile name>/`. A key is claimed by renaming its file,
+    which only one process can do successfully, so a key is never handed out twice even when several worker processes
+    share the pool. The object itself only holds settings so it can be passed to worker processes.
+
+    Attributes:
+        directory (str): The directory holding the pool.
+        passphrase (bytes): The passphrase used to encrypt the keys.
+        low_water (int): When fewer keys than this remain in a group, a background refill is started.
+        target (int): The number of keys a refill tops the group up to.
+    """
+
+    def __init__(self, directory: str, passphrase: str, low_water: int = 10, target: int = 50):
+        self.directory = directory
+        self.passphrase = passphrase.encode('utf-8')
+        self.low_water = low_water
+        self.target = target
+
+    def _group_directory(self, key_profile: KeyProfile) -> str:
+        """Returns the directory holding the keys for the given key profile."""
+        return os.path.join(self.directory, key_profile.name)
+
+    def count(self, key_profile: KeyProfile) -> int:
+        """Counts the keys available in a group.
+
+        Args:
+            key_profile (KeyProfile): The key profile of the group.
+
+        Returns:
+            int: The number of unclaimed keys in the group.
+        """
+        try:
+            return sum(1 for name in os.listdir(self._group_directory(key_profile)) if name.endswith('.key'))
+        except FileNotFoundError:
+            return 0
+
+    def add(self, key_profile: KeyProfile, private_key: PrivateKey) -> str:
+        """Encrypts a private key and adds it to the pool.
+
+        The key is written to a temporary file with owner only permissions and then renamed into place so a reader
+        never sees a partially written key.
+
+        Args:
+            key_profile (KeyProfile): The key profile of the group.
+            private_key (PrivateKey): The key to add.
+
+        Returns:
+            str: The path of the new key file.
+        """
+        group_directory = self._group_directory(key_profile)
+        os.makedirs(group_directory, mode=0o700, exist_ok=True)
+
+        name = uuid.uuid4().hex
+        temp_path = os.path.join(group_directory, f".{name}.tmp")
+        key_path = os.path.join(group_directory, f"{name}.key")
+
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.BestAvailableEncryption(self.passphrase),
+            ))
+        os.replace(temp_path, key_path)
+
+        return key_path
+
+    def take(self, key_profile: KeyProfile) -> Optional[PrivateKey]:
+        """Removes a key from the pool and returns it.
+
+        Keys that cannot be decrypted, usually because they were written under a different passphrase, are renamed to
+        <name>.key.bad so later calls do not pick them up again, and the next key is tried. If the number of remaining
+        keys drops below the low-water mark a background refill is started.
+
+        Args:
+            key_profile (KeyProfile): The key profile of the group.
+
+        Returns:
+            PrivateKey: The key, or None if the pool has no key that can be decrypted.
+        """
+        group_directory = self._group_directory(key_profile)
+        try:
+            names = sorted(name for name in os.listdir(group_directory) if name.endswith('.key'))
+        except FileNotFoundError:
+            names = []
+
+        private_key = None
+        taken = 0
+        for name in names:
+            key_path = os.path.join(group_directory, name)
+            claimed_path = f"{key_path}.claimed"
+            try:
+                os.rename(key_path, claimed_path)
+            except FileNotFoundError:
+                # Another process claimed this key first
+                continue
+
+            taken += 1
+            with open(claimed_path, 'rb') as f:
+                key_data = f.read()
+            try:
+                private_key = serialization.load_pem_private_key(key_data, password=self.passphrase)
+            except (ValueError, TypeError) as e:
+                # Set the key aside rather than putting it back, or every later call would fail on it again
+                os.rename(claimed_path, f"{key_path}.bad")
+                logger.warning(f"Unable to decrypt pooled key {key_path}: {e}. Moved it to {key_path}.bad and trying "
+                               f"the next key.")
+                continue
+
+            os.remove(claimed_path)
+            break
+
+        if len(names) - taken < self.low_water:
+            self.refill_in_background(key_profile)
+
+        return private_key
+
+    def refill_running(self, key_profile: KeyProfile) -> bool:
+        """Checks whether a refill of a group is in progress.
+
+        Args:
+            key_profile (KeyProfile): The key profile of the group.
+
+        Returns:
+            bool: True if a live process holds the group's refill lock.
+        """
+        try:
+            fd = os.open(os.path.join(self._group_directory(key_profile), REFILL_LOCK_NAME), os.O_WRONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            # Closing the descriptor releases the lock if we took it
+            os.close(fd)
+        return False
+
+    def refill_in_background(self, key_profile: KeyProfile) -> None:
+        """Starts a detached `key_pool.py fill` process for a group unless one is already running.
+
+        The process does not outlive the container it runs in, so generate_certificates.py still tops the pool up
+        itself before it exits.
+
+        Args:
+            key_profile (KeyProfile): The key profile of the group.
+
+        Returns:
+            None
+        """
+        if self.refill_running(key_profile):
+            return
+
+        logger.info(f"The {key_profile.name} key pool is below {self.low_water} keys. Starting a background "
+                    f"refill...")
+        env = dict(os.environ)
+        env[PASSPHRASE_ENV] = self.passphrase.decode('utf-8')
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'fill', '--pool-dir', self.directory,
+                          '--profile', key_profile.name, '--target', str(self.target)],
+                         env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+    def fill(self, key_profile: KeyProfile, wait: bool = False) -> int:
+        """Generates keys until the group holds `target` keys.
+
+        An flock on the group's lock file keeps concurrent refills from overfilling the pool. The lock file itself is
+        left in place; only the lock matters.
+
+        Args:
+            key_profile (KeyProfile): The key profile of the group.
+            wait (bool): Whether to wait for a refill that is already running to finish and then top up whatever it
+                left, instead of returning straight away. Defaults to False.
+
+        Returns:
+            int: The number of keys generated.
+        """
+        group_directory = self._group_directory(key_profile)
+        os.makedirs(group_directory, mode=0o700, exist_ok=True)
+        fd = os.open(os.path.join(group_directory, REFILL_LOCK_NAME), os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info(f"A refill of the {key_profile.name} key pool is already running.")
+                return 0
+
+            generated = 0
+            while self.count(key_profile) < self.target:
+                self.add(key_profile, generate_key(key_profile))
+                generated += 1
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+        return generated
+
+
+def generate_private_key(key_profile: KeyProfile, key_pool: Optional[KeyPool] = None) -> PrivateKey:
+    """Gets a private key from the key pool, or generates one inline if the pool is unavailable or empty.
+
+    Args:
+        key_profile (KeyProfile): The key profile of the key.
+        key_pool (KeyPool, optional): The pool to take the key from. Defaults to None.
+
+    Returns:
+        PrivateKey: The private key.
+    """
+    if key_pool is not None:
+        private_key = key_pool.take(key_profile)
+        if private_key is not None:
+            logger.info(f"Took a pre-generated {key_profile.name} key from the key pool.")
+            return private_key
+        logger.info(f"The {key_profile.name} key pool is empty. Generating the key inline...")
+
+    return generate_key(key_profile)
+
+
+def key_pool_from_environment(directory: Optional[str], low_water: int = 10, target: int = 50) -> Optional[KeyPool]:
+    """Creates a KeyPool for the given directory using the passphrase in the KEY_POOL_PASSPHRASE environment variable.
+
+    Args:
+        directory (str, optional): The directory holding the pool. If None, no pool is used.
+        low_water (int): The low-water mark for background refills. Defaults to 10.
+        target (int): The number of keys a refill tops a group up to. Defaults to 50.
+
+    Returns:
+        KeyPool: The key pool, or None if no directory was given.
+    """
+    if not directory:
+        return None
+
+    passphrase = os.environ.get(PASSPHRASE_ENV)
+    if not passphrase:
+        logger.error(f"A key pool directory was given but {PASSPHRASE_ENV} is not set. The pool must be encrypted.")
+        exit(1)
+
+    return KeyPool(directory, passphrase, low_water=low_water, target=target)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Maintains the pool of pre-generated private keys.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fill_parser = subparsers.add_parser('fill', help='Generate keys until the pool reaches the target size.')
+    fill_parser.add_argument('--pool-dir', dest='pool_dir', type=str, required=True,
+                             help='The directory holding the key pool.')
+    fill_parser.add_argument('--profile', dest='profile', type=str, default='rsa-2048', choices=list(KEY_PROFILES),
+                             help='The key profile to generate keys for. Defaults to rsa-2048.')
+    fill_parser.add_argument('--target', dest='target', type=int, default=50,
+                             help='The number of keys to top the pool up to. Defaults to 50.')
+
+    status_parser = subparsers.add_parser('status', help='Show the number of keys available in each group.')
+    status_parser.add_argument('--pool-dir', dest='pool_dir', type=str, required=True,
+                               help='The directory holding the key pool.')
+
+    args = parser.parse_args()
+
+    if args.command == 'fill':
+        pool = key_pool_from_environment(args.pool_dir, target=args.target)
+        count = pool.fill(get_key_profile(args.profile))
+        logger.info(f"Added {count} keys to the {args.profile} key pool.")
+    elif args.command == 'status':
+        if not os.path.isdir(args.pool_dir):
+            logger.info(f"No key pool found at {args.pool_dir}.")
+        else:
+            for group in sorted(os.listdir(args.pool_dir)):
+                group_directory = os.path.join(args.pool_dir, group)
+                if os.path.isdir(group_directory):
+                    available = sum(1 for name in os.listdir(group_directory) if name.endswith('.key'))
+                    logger.info(f"{group}: {available} keys available")
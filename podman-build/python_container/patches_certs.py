@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+One command line for the Patches certificate tooling.
+
+    patches-certs generate ...       generate_certificates.py
+    patches-certs import ...         import_keys.py
+    patches-certs validate ...       import_keys.py --validate, or bulk validation with --validate-dir
+    patches-certs render-nginx ...   configure_nginx.py
+    patches-certs inventory ...      inventory.py
+    patches-certs pipeline STEP...   runs several of the above in one process
+
+Each subcommand takes the same arguments as the script it runs. The scripts are only imported when their subcommand
+runs, so render-nginx never loads cryptography and generate never loads jinja2. A pipeline runs every step in the same
+interpreter, so the imports, the parsed config.yml snapshot and the logger are paid for once, for example:
+
+    patches-certs pipeline "generate --cert-dir certs --root-cert-dir ca --ipv4-address 10.0.0.5 --non-interactive" \\
+        "render-nginx --server-name patches --server-domain lan ..."
+
+The time from start up to the first subcommand being ready to run is logged so cold start regressions are visible.
+"""
+
+import time
+
+# Taken before anything else is imported so the cold start report includes our own imports
+_STARTED = time.perf_counter()
+
+import argparse  # noqa: E402
+import importlib  # noqa: E402
+import shlex  # noqa: E402
+from typing import List, Optional, Tuple  # noqa: E402
+
+from patches_logging import PatchesLogger  # noqa: E402
+
+logger = PatchesLogger.get_logger()
+
+# Set once the first subcommand has been imported. Only that one is a cold start.
+_cold_start_reported = False
+
+# Each subcommand maps to the module whose main() runs it and the arguments put in front of the user's arguments
+SUBCOMMANDS = {
+    'generate': ('generate_certificates', []),
+    'import': ('import_keys', []),
+    'validate': ('import_keys', ['--validate']),
+    'render-nginx': ('configure_nginx', []),
+    'inventory': ('inventory', []),
+}
+
+
+def _exit_status(e: SystemExit) -> int:
+    """Turns the code of a SystemExit into an exit status the way the interpreter does."""
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    return 1
+
+
+def run_subcommand(name: str, argv: List[str]) -> Tuple[int, float]:
+    """Imports the module for a subcommand if needed and runs its main function.
+
+    Args:
+        name (str): One of the SUBCOMMANDS.
+        argv (list): The arguments for the subcommand.
+
+    Returns:
+        tuple: The exit status and the seconds spent importing the module. The import time is 0 when an earlier step
+               already imported it.
+    """
+    global _cold_start_reported
+
+    module_name, prefix = SUBCOMMANDS[name]
+    import_started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_seconds = time.perf_counter() - import_started
+
+    if not _cold_start_reported:
+        logger.info(f"patches-certs cold start: {name} was ready to run {(time.perf_counter() - _STARTED) * 1000:.0f} "
+                    f"ms after start up, {import_seconds * 1000:.0f} ms of which was spent importing its modules.")
+        _cold_start_reported = True
+
+    # validate with --validate-dir is bulk validation, which does not take --validate
+    if name == 'validate' and '--validate-dir' in argv:
+        prefix = []
+
+    try:
+        status = module.main(prefix + argv)
+    except SystemExit as e:
+        status = _exit_status(e)
+    return status or 0, import_seconds
+
+
+def run_pipeline(steps: List[str]) -> int:
+    """Runs several subcommands one after another in this process.
+
+    Args:
+        steps (list): One string per step holding the subcommand and its arguments, split like a shell would.
+
+    Returns:
+        int: 0 if every step succeeded, otherwise the exit status of the first step that failed. Later steps are not
+             run once a step fails.
+    """
+    parsed_steps = []
+    for step in steps:
+        words = shlex.split(step)
+        if not words or words[0] not in SUBCOMMANDS:
+            logger.error(f"Invalid pipeline step '{step}'. Each step must start with one of: "
+                         f"{', '.join(SUBCOMMANDS)}.")
+            return 2
+        parsed_steps.append((words[0], words[1:]))
+
+    for number, (name, argv) in enumerate(parsed_steps, start=1):
+        step_started = time.perf_counter()
+        status, import_seconds = run_subcommand(name, argv)
+        logger.info(f"Pipeline step {number}/{len(parsed_steps)} ({name}) finished with status {status} in "
+                    f"{time.perf_counter() - step_started:.2f} s (imports {import_seconds * 1000:.0f} ms).")
+        if status != 0:
+            logger.error(f"Stopping the pipeline because step {number} ({name}) failed.")
+            return status
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Runs one subcommand or a pipeline of subcommands.
+
+    Args:
+        argv (list, optional): The command line arguments without the program name. Defaults to sys.argv.
+
+    Returns:
+        int: The exit status.
+    """
+    parser = argparse.ArgumentParser(prog='patches-certs', description='Generate, import, validate, serve and '
+                                                                       'list the Patches certificates.')
+    parser.add_argument('subcommand', choices=list(SUBCOMMANDS) + ['pipeline'],
+                        help='What to run. Run a subcommand with --help to see its arguments.')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER,
+                        help='The arguments for the subcommand. For pipeline, one quoted string per step.')
+    args = parser.parse_args(argv)
+
+    if args.subcommand == 'pipeline':
+        if not args.arguments:
+            parser.error('pipeline needs at least one step.')
+        return run_pipeline(args.arguments)
+
+    status, _ = run_subcommand(args.subcommand, args.arguments)
+    return status
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,373 @@
+import hashlib
+import json
+import os
+from ipaddress import IPv4Address
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from helper_functions import DEFAULT_ROOT_CA_KEY_PROFILE, KeyProfile, PatchesLogger, Pkcs12Profile, \
+    get_key_profile, get_pkcs12_profile
+
+logger = PatchesLogger.get_logger()
+
+# An optional JSON file the compiled config is cached in, keyed by the SHA256 of config.yml. Processes that share it
+# skip YAML parsing entirely while config.yml is unchanged.
+CONFIG_CACHE_ENV = 'PATCHES_CONFIG_CACHE'
+
+# Bump this if the layout of the cached snapshot changes. Snapshots with a different version are ignored.
+SNAPSHOT_VERSION = 1
+
+# The top level settings that must be present and non-empty, besides country which is checked on its own
+_REQUIRED_SETTINGS = ('ROOT_CA_NAME', 'SERVER_NAME', 'BACKEND_CERT_NAME', 'FRONTEND_CERT_NAME', 'CERT_DIRECTORY',
+                      'ROOT_CERT_DIRECTORY', 'state', 'locality', 'organization_name', 'organization_unit')
+
+# The settings every client must have, besides country
+_REQUIRED_CLIENT_SETTINGS = ('state', 'locality', 'organization_name', 'organization_unit', 'dns_1')
+
+# Compiled snapshots of the config files this process has loaded, keyed by absolute path. Each entry holds the
+# (mtime_ns, size, inode) the snapshot was compiled from and the snapshot itself.
+_snapshots: Dict[str, Tuple[Tuple[int, int, int], 'PatchesConfig']] = {}
+
+
+class ConfigError(ValueError):
+    """Raised when config.yml is missing settings or has invalid values.
+
+    Attributes:
+        problems (list): A description of every problem found.
+    """
+
+    def __init__(self, problems: List[str]):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+class ClientConfig(NamedTuple):
+    """The validated settings of one client in config.yml."""
+    name: str
+    country: str
+    state: str
+    locality: str
+    organization_name: str
+    organization_unit: str
+    dns_1: str
+    dns_2: Optional[str]
+    ip_1: Optional[IPv4Address]
+    ip_2: Optional[IPv4Address]
+    days: int
+    key_profile: KeyProfile
+    pkcs12_profile: Pkcs12Profile
+
+
+class PatchesConfig(NamedTuple):
+    """An immutable, validated snapshot of config.yml.
+
+    The certificate settings are typed and validated. Every other top level scalar setting is available through get
+    under its config.yml name.
+
+    Attributes:
+        path (str): The path config.yml was loaded from.
+        sha256 (str): The hex encoded SHA256 of the file the snapshot was compiled from.
+    """
+    path: str
+    sha256: str
+    patches_administrator: Optional[str]
+    root_ca_name: str
+    root_ca_domain: str
+    server_name: str
+    server_domain: str
+    backend_cert_name: str
+    frontend_cert_name: str
+    cert_directory: str
+    root_cert_directory: str
+    country: str
+    state: str
+    locality: str
+    organization_name: str
+    organization_unit: str
+    days: int
+    root_ca_key_profile: KeyProfile
+    server_key_profile: KeyProfile
+    clients: Tuple[ClientConfig, ...]
+    settings: Tuple[Tuple[str, Any], ...]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Returns a top level scalar setting by its name in config.yml, like dict.get.
+
+        Args:
+            key (str): The name of the setting, for example SERVER_NAME.
+            default: The value returned if the setting is missing. Defaults to None.
+
+        Returns:
+            The value of the setting.
+        """
+        for name, value in self.settings:
+            if name == key:
+                return value
+        return default
+
+    def client(self, name: str) -> ClientConfig:
+        """Returns the settings of a client.
+
+        Raises:
+            KeyError: If there is no such client.
+        """
+        for client in self.clients:
+            if client.name == name:
+                return client
+        raise KeyError(name)
+
+    @property
+    def client_names(self) -> List[str]:
+        """The names of the clients in the order they appear in config.yml."""
+        return [client.name for client in self.clients]
+
+
+def _text(data: dict, key: str, problems: List[str], prefix: str = '', required: bool = True) -> Optional[str]:
+    """Reads a string setting, recording a problem if a required one is missing."""
+    value = data.get(key)
+    if value is None or value == '':
+        if required:
+            problems.append(f"{prefix}{key} is required.")
+        return None if required else ''
+    return str(value)
+
+
+def _days(data: dict, problems: List[str], prefix: str = '') -> int:
+    """Reads and checks the days setting."""
+    value = data.get('days')
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        problems.append(f"{prefix}days must be a positive whole number of days, not {value!r}.")
+        return 0
+    return value
+
+
+def _country(data: dict, problems: List[str], prefix: str = '') -> Optional[str]:
+    """Reads and checks the country setting. X.509 country names are two letter codes."""
+    value = _text(data, 'country', problems, prefix)
+    if value is not None and len(value) != 2:
+        problems.append(f"{prefix}country must be a two letter country code such as US, not {value!r}.")
+    return value
+
+
+def _ip_address(data: dict, key: str, problems: List[str], prefix: str) -> Optional[IPv4Address]:
+    """Reads and checks an optional IPv4 address setting."""
+    value = data.get(key)
+    if value is None or value == '':
+        return None
+    try:
+        return IPv4Address(str(value))
+    except ValueError as e:
+        problems.append(f"{prefix}{key} is not a valid IPv4 address: {e}")
+        return None
+
+
+def compile_config(data: dict, path: str = 'config.yml', sha256: str = '') -> PatchesConfig:
+    """Validates parsed config.yml data and compiles it into a PatchesConfig.
+
+    Every problem is collected before raising so a broken config.yml can be fixed in one pass.
+
+    Args:
+        data (dict): The parsed config.yml.
+        path (str): The path config.yml was loaded from. Defaults to config.yml.
+        sha256 (str): The hex encoded SHA256 of the file. Defaults to an empty string.
+
+    Raises:
+        ConfigError: If any setting is missing or invalid.
+
+    Returns:
+        PatchesConfig: The compiled config.
+    """
+    if not isinstance(data, dict):
+        raise ConfigError([f"{path} must contain a mapping of settings."])
+
+    problems = []
+    settings = {key: _text(data, key, problems) for key in _REQUIRED_SETTINGS}
+    country = _country(data, problems)
+    days = _days(data, problems)
+
+    if settings['SERVER_NAME'] and ' ' in settings['SERVER_NAME']:
+        problems.append("SERVER_NAME cannot contain spaces.")
+    names = [settings[key] for key in ('ROOT_CA_NAME', 'SERVER_NAME', 'BACKEND_CERT_NAME', 'FRONTEND_CERT_NAME')]
+    duplicates = sorted({name for name in names if name and names.count(name) > 1})
+    if duplicates:
+        problems.append(f"ROOT_CA_NAME, SERVER_NAME, BACKEND_CERT_NAME and FRONTEND_CERT_NAME must all be different. "
+                        f"Used more than once: {', '.join(duplicates)}")
+
+    root_ca_key_profile = server_key_profile = None
+    try:
+        root_ca_key_profile = get_key_profile(data.get('key_profile'), DEFAULT_ROOT_CA_KEY_PROFILE)
+        server_key_profile = get_key_profile(data.get('key_profile'))
+    except ValueError as e:
+        problems.append(str(e))
+
+    custom_pkcs12_profiles = data.get('pkcs12_profiles')
+    if custom_pkcs12_profiles is not None and not isinstance(custom_pkcs12_profiles, dict):
+        problems.append("pkcs12_profiles must be a mapping of profile names to settings.")
+        custom_pkcs12_profiles = None
+
+    clients_data = data.get('clients') or {}
+    if not isinstance(clients_data, dict):
+        problems.append("clients must be a mapping of client names to settings.")
+        clients_data = {}
+
+    clients = []
+    for name, client_data in clients_data.items():
+        prefix = f"clients.{name}."
+        name = str(name)
+        if ' ' in name:
+            problems.append(f"The client name '{name}' cannot contain spaces.")
+        if not isinstance(client_data, dict):
+            problems.append(f"clients.{name} must be a mapping of settings.")
+            continue
+
+        key_profile = pkcs12_profile = None
+        try:
+            key_profile = get_key_profile(client_data.get('key_profile') or data.get('key_profile'))
+        except ValueError as e:
+            problems.append(f"{prefix}key_profile: {e}")
+        try:
+            pkcs12_profile = get_pkcs12_profile(client_data.get('pkcs12_profile') or data.get('pkcs12_profile'),
+                                                custom_pkcs12_profiles)
+        except ValueError as e:
+            problems.append(f"{prefix}pkcs12_profile: {e}")
+
+        required = {key: _text(client_data, key, problems, prefix) for key in _REQUIRED_CLIENT_SETTINGS}
+        required['country'] = _country(client_data, problems, prefix)
+        clients.append(ClientConfig(
+            name=name,
+            dns_2=_text(client_data, 'dns_2', problems, prefix, required=False) or None,
+            ip_1=_ip_address(client_data, 'ip_1', problems, prefix),
+            ip_2=_ip_address(client_data, 'ip_2', problems, prefix),
+            days=_days(client_data, problems, prefix),
+            key_profile=key_profile,
+            pkcs12_profile=pkcs12_profile,
+            **required))
+
+    if problems:
+        raise ConfigError(problems)
+
+    return PatchesConfig(
+        path=path,
+        sha256=sha256,
+        patches_administrator=_text(data, 'PATCHES_ADMINISTRATOR', problems, required=False) or None,
+        root_ca_name=settings['ROOT_CA_NAME'],
+        root_ca_domain=_text(data, 'ROOT_CA_DOMAIN', problems, required=False),
+        server_name=settings['SERVER_NAME'],
+        server_domain=_text(data, 'SERVER_DOMAIN', problems, required=False),
+        backend_cert_name=settings['BACKEND_CERT_NAME'],
+        frontend_cert_name=settings['FRONTEND_CERT_NAME'],
+        cert_directory=settings['CERT_DIRECTORY'],
+        root_cert_directory=settings['ROOT_CERT_DIRECTORY'],
+        country=country,
+        state=settings['state'],
+        locality=settings['locality'],
+        organization_name=settings['organization_name'],
+        organization_unit=settings['organization_unit'],
+        days=days,
+        root_ca_key_profile=root_ca_key_profile,
+        server_key_profile=server_key_profile,
+        clients=tuple(clients),
+        settings=tuple((str(key), value) for key, value in data.items()
+                       if value is None or isinstance(value, (str, int, float, bool))),
+    )
+
+
+def _snapshot_to_json(config: PatchesConfig) -> dict:
+    """Converts a PatchesConfig to JSON compatible data for the snapshot cache."""
+    def client_to_json(client: ClientConfig) -> dict:
+        return dict(client._asdict(),
+                    ip_1=str(client.ip_1) if client.ip_1 else None,
+                    ip_2=str(client.ip_2) if client.ip_2 else None,
+                    key_profile=client.key_profile.name,
+                    pkcs12_profile=list(client.pkcs12_profile))
+
+    return dict(config._asdict(),
+                root_ca_key_profile=config.root_ca_key_profile.name,
+                server_key_profile=config.server_key_profile.name,
+                clients=[client_to_json(client) for client in config.clients],
+                settings=[list(setting) for setting in config.settings])
+
+
+def _snapshot_from_json(data: dict) -> PatchesConfig:
+    """Rebuilds a PatchesConfig from the data written by _snapshot_to_json."""
+    def client_from_json(client: dict) -> ClientConfig:
+        return ClientConfig(**dict(client,
+                                   ip_1=IPv4Address(client['ip_1']) if client['ip_1'] else None,
+                                   ip_2=IPv4Address(client['ip_2']) if client['ip_2'] else None,
+                                   key_profile=get_key_profile(client['key_profile']),
+                                   pkcs12_profile=Pkcs12Profile(*client['pkcs12_profile'])))
+
+    return PatchesConfig(**dict(data,
+                                root_ca_key_profile=get_key_profile(data['root_ca_key_profile']),
+                                server_key_profile=get_key_profile(data['server_key_profile']),
+                                clients=tuple(client_from_json(client) for client in data['clients']),
+                                settings=tuple(tuple(setting) for setting in data['settings'])))
+
+
+def load_config(path: str = 'config.yml', cache_file: Optional[str] = None) -> PatchesConfig:
+    """Loads, validates and compiles config.yml, reusing an earlier snapshot when the file has not changed.
+
+    Within a process, a snapshot is reused while the file's mtime, size and inode are unchanged, without even reading
+    the file. Otherwise the file is read and hashed, and a snapshot with the same hash is reused, from this process or
+    from the JSON cache file. YAML is only parsed when neither has a snapshot of the current contents.
+
+    Args:
+        path (str): The path of config.yml. Defaults to config.yml.
+        cache_file (str, optional): The JSON snapshot cache to use. Defaults to the file named by the
+                                    PATCHES_CONFIG_CACHE environment variable, or no cache if it is not set.
+
+    Raises:
+        ConfigError: If config.yml is not valid YAML or any setting is missing or invalid.
+        OSError: If config.yml cannot be read.
+
+    Returns:
+        PatchesConfig: The compiled config. The same object is returned to every caller while the file is unchanged.
+    """
+    absolute_path = os.path.abspath(path)
+    stat = os.stat(absolute_path)
+    stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    snapshot = _snapshots.get(absolute_path)
+    if snapshot is not None and snapshot[0] == stat_key:
+        return snapshot[1]
+
+    with open(absolute_path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    config = None
+    if snapshot is not None and snapshot[1].sha256 == digest:
+        config = snapshot[1]
+
+    cache_file = cache_file or os.environ.get(CONFIG_CACHE_ENV)
+    if config is None and cache_file:
+        try:
+            with open(cache_file, 'r') as f:
+                cached = json.load(f)
+            if cached.get('version') == SNAPSHOT_VERSION and cached.get('sha256') == digest:
+                config = _snapshot_from_json(cached['config'])._replace(path=path)
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable config snapshot cache {cache_file}: {e}")
+
+    if config is None:
+        # PyYAML is only imported when the snapshot caches miss
+        import yaml
+        try:
+            parsed = yaml.safe_load(data)
+        except yaml.YAMLError as e:
+            raise ConfigError([f"{path} is not valid YAML: {e}"])
+        config = compile_config(parsed, path, digest)
+
+        if cache_file:
+            temp_path = f"{cache_file}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump({'version': SNAPSHOT_VERSION, 'sha256': digest, 'config': _snapshot_to_json(config)}, f)
+                os.replace(temp_path, cache_file)
+            except OSError as e:
+                # The cache only saves time. A read-only mount must not stop the run.
+                logger.warning(f"Unable to write the config snapshot cache {cache_file}: {e}")
+
+    _snapshots[absolute_path] = (stat_key, config)
+    return config
@@ -0,0 +1,277 @@
+"""
+Logging and prompting helpers shared by the Patches scripts.
+
+This module only depends on the standard library so that scripts which do not touch certificates, such as
+configure_nginx.py, can log without importing cryptography.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import textwrap
+import time
+from typing import Optional
+
+# Overrides the log format. banner is the boxed and colored style of patches_echo, compact is one plain line per record
+# and json is one JSON object per line. Defaults to banner when stdout is a terminal and compact otherwise.
+LOG_FORMAT_ENV = 'PATCHES_LOG_FORMAT'
+LOG_FORMATS = ('banner', 'compact', 'json')
+
+
+def default_log_format() -> str:
+    """Returns the log format from PATCHES_LOG_FORMAT, or the default for the current stdout."""
+    log_format = os.environ.get(LOG_FORMAT_ENV, '').lower()
+    if log_format in LOG_FORMATS:
+        return log_format
+    return 'banner' if sys.stdout.isatty() else 'compact'
+
+
+class PatchesLogHandler(logging.Handler):
+    """Custom log handler for Patches scripts.
+
+    In the banner format this log handler customizes the log message formatting and output to match
+    the text style of the `patches_echo` function in Bash, including colored
+    output, timestamp, and 80-character separators. Colors are only used when stdout is a terminal. The compact
+    and json formats write one line per record, which keeps CI logs small and easy to parse.
+
+    Each record is written to stdout with a single write so records never interleave with each other.
+
+    Attributes:
+        log_format (str): One of LOG_FORMATS.
+        color (bool): Whether to use ANSI colors.
+    """
+
+    def __init__(self, log_format: Optional[str] = None, color: Optional[bool] = None):
+        super().__init__()
+        self.log_format = log_format or default_log_format()
+        self.color = sys.stdout.isatty() if color is None else color
+
+    def render(self, record):
+        """Formats a record as the text written to stdout, including the trailing newline.
+
+        Args:
+            record (logging.LogRecord): The log record to render.
+
+        Returns:
+            str: The rendered record.
+        """
+        message = self.format(record)
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
+
+        if self.log_format == 'json':
+            return json.dumps({'time': timestamp, 'level': record.levelname.lower(), 'process': record.process,
+                               'message': message}) + '\n'
+
+        if self.log_format == 'compact':
+            return f'{timestamp} {record.levelname:<7} {message}\n'
+
+        level = record.levelname.lower()
+        if not self.color:
+            color = reset_color = ''
+        elif level == 'error' or level == 'warning':
+            color = '\033[1;31m'  # Red color
+            reset_color = '\033[0m'  # Reset color
+        else:
+            color = '\033[1;33m'  # Yellow color
+            reset_color = '\033[0m'  # Reset color
+
+        # Determine the available width for the log message (80 - length of timestamp)
+        available_width = 80 - len(timestamp) - 3  # Subtract 3 for timestamp formatting (space, dash, space)
+
+        # Wrap the log message to available width at the nearest word boundary
+        wrapped_message = textwrap.fill(message, width=available_width, break_long_words=False)
+
+        # Timestamp and message in the desired color between two lines of 80 #
+        return f"{'#' * 80}\n{timestamp} - {color}{wrapped_message}{reset_color}\n{'#' * 80}\n"
+
+    def emit(self, record):
+        """Emit a log record.
+
+        This method overrides the `emit` method of the `logging.Handler` class
+        to customize the log message formatting and output.
+
+        Args:
+            record (logging.LogRecord): The log record to be emitted.
+
+        Returns:
+            None
+        """
+        try:
+            sys.stdout.write(self.render(record))
+            sys.stdout.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class PatchesLogger:
+    """Singleton class for the custom Patches logger.
+
+    This class provides a singleton instance of the logger for Patches scripts. The logger can be accessed using the
+    `get_logger` method. Logging calls only put the record on a queue. A background listener thread in the process
+    that created the logger drains the queue into a PatchesLogHandler, so slow terminals never block the caller.
+
+    Process pools pass `log_queue` to their initializer, which calls `configure_worker` with it. That switches the
+    queue to a multiprocessing queue and the records of every worker go to the main process's listener, so the output
+    of a pool is one ordered stream. multiprocessing is only imported at that point because importing it is a large
+    part of the start up time of the scripts that never start a pool.
+
+    Attributes:
+        _logger (logging.Logger): The logger instance.
+        _handler (PatchesLogHandler): The handler the listener writes records with.
+        _queue (queue.Queue or multiprocessing.Queue): The queue records are sent through.
+        _listener (logging.handlers.QueueListener): The listener, only set in the process that owns the output.
+        _listener_pid (int): The process the listener runs in.
+    """
+
+    _logger = None
+    _handler = None
+    _queue = None
+    _listener = None
+    _listener_pid = None
+
+    @staticmethod
+    def get_logger():
+        """Get the custom Patches logger instance.
+
+        If the logger instance doesn't exist, it will be created along with its queue and listener and
+        returned. If the logger instance already exists, it will be directly returned. In a forked worker process
+        the inherited logger is returned as is.
+
+        Returns:
+            logging.Logger: The custom Patches logger instance.
+        """
+        if PatchesLogger._logger is None:
+            PatchesLogger._handler = PatchesLogHandler()
+            PatchesLogger._handler.setFormatter(logging.Formatter('%(message)s'))
+            PatchesLogger._listen(queue.SimpleQueue())
+            atexit.register(PatchesLogger.flush, restart=False)
+
+        return PatchesLogger._logger
+
+    @staticmethod
+    def _listen(log_queue):
+        """Starts a listener on a queue and points the root logger at it."""
+        PatchesLogger._queue = log_queue
+        PatchesLogger._listener = logging.handlers.QueueListener(log_queue, PatchesLogger._handler)
+        PatchesLogger._listener.start()
+        PatchesLogger._listener_pid = os.getpid()
+        PatchesLogger._logger = PatchesLogger._attach(log_queue)
+
+    @staticmethod
+    def _attach(log_queue):
+        """Points the root logger at a queue and returns it."""
+        logger = logging.getLogger()
+        logger.setLevel(logging.INFO)
+        logger.handlers.clear()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        return logger
+
+    @staticmethod
+    def log_queue():
+        """Returns the queue worker processes should send their records to. Pass it to `configure_worker`.
+
+        The first call replaces the in-process queue with a multiprocessing queue. Records already queued are written
+        out first so the order is kept.
+
+        Returns:
+            multiprocessing.Queue: The queue.
+        """
+        PatchesLogger.get_logger()
+        if PatchesLogger._listener_pid == os.getpid() and isinstance(PatchesLogger._queue, queue.SimpleQueue):
+            import multiprocessing
+
+            PatchesLogger.flush(restart=False)
+            PatchesLogger._listen(multiprocessing.Queue(-1))
+            # multiprocessing closes its queues in its own exit handler. Registering again makes the listener stop first.
+            atexit.register(PatchesLogger.flush, restart=False)
+        return PatchesLogger._queue
+
+    @staticmethod
+    def configure_worker(log_queue):
+        """Sends the log records of a worker process to the parent process's queue.
+
+        Call this from a process pool initializer. It works for both forked and spawned workers.
+
+        Args:
+            log_queue (multiprocessing.Queue): The queue returned by `log_queue` in the parent process.
+
+        Returns:
+            None
+        """
+        PatchesLogger._queue = log_queue
+        PatchesLogger._listener = None
+        PatchesLogger._logger = PatchesLogger._attach(log_queue)
+
+    @staticmethod
+    def flush(restart=True):
+        """Waits until every queued record has been written.
+
+        Call this before writing to the terminal directly, for example before prompting, so earlier log records are
+        not printed after the prompt. Only the process that owns the listener can flush. Elsewhere this does nothing.
+
+        Args:
+            restart (bool): Whether to keep listening afterwards.
+
+        Returns:
+            None
+        """
+        # A forked worker inherits the listener object but must never stop the parent's listener
+        if PatchesLogger._listener is None or PatchesLogger._listener_pid != os.getpid():
+            return
+        PatchesLogger._listener.stop()
+        if restart:
+            PatchesLogger._listener.start()
+        else:
+            PatchesLogger._listener = None
+
+
+def patches_read(prompt):
+    """Custom read command for Patches scripts.
+
+    Prompts the user for input and sets the text color to a bold blue.
+
+    Args:
+        prompt (str): The prompt message to display to the user.
+
+    Returns:
+        str: The user input.
+    """
+    color = '\033[1;34m' if sys.stdout.isatty() else ''  # Bold blue color
+    reset_color = '\033[0m' if sys.stdout.isatty() else ''  # Reset color
+
+    # Write out any queued log records first so they appear above the prompt
+    PatchesLogger.flush()
+
+    # Print first line of 80 #
+    print('#' * 80)
+
+    # Wrap the prompt at 80 characters
+    wrapped_prompt = ""
+    line_length = 0
+    words = prompt.split()
+    for word in words:
+        if line_length + len(word) > 80:
+            wrapped_prompt += '\n' + word
+            line_length = len(word)
+        else:
+            if line_length > 0:
+                wrapped_prompt += ' ' + word
+                line_length += len(word) + 1
+            else:
+                wrapped_prompt += word
+                line_length = len(word)
+
+    # Print prompt message
+    print(f'{color}{wrapped_prompt}{reset_color}')
+
+    # Print last line of 80 #
+    print('#' * 80)
+
+    # Read user input
+    user_input = input()
+
+    return user_input
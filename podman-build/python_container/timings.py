@@ -0,0 +1,197 @@
+"""
+Phase level timing and profiling for the certificate scripts.
+
+Code wraps each phase of its work in `timings.span(phase, item)`, for example key generation or signing for one
+certificate. Spans cost almost nothing until instrumentation is turned on with --timings, --metrics-file or --profile.
+At the end of the run the samples are aggregated per phase (count, total, p50, p95 and max) and per item, logged as a
+summary and written to a JSON metrics file.
+
+Worker processes record into their own copy of `timings`. They hand their samples back with `drain` and the main
+process adds them with `merge`.
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from patches_logging import PatchesLogger
+
+logger = PatchesLogger.get_logger()
+
+# One timing sample: the phase, the item it was recorded for (or None) and the duration in seconds
+Sample = Tuple[str, Optional[str], float]
+
+# Bump this if the layout of the metrics file changes
+METRICS_VERSION = 1
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Returns a nearest-rank percentile.
+
+    Args:
+        sorted_values (list): The values in ascending order. Must not be empty.
+        fraction (float): The percentile as a fraction, for example 0.95.
+
+    Returns:
+        float: The smallest value that at least `fraction` of the values are less than or equal to.
+    """
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class PhaseTimings:
+    """Collects timing samples for the phases of a run.
+
+    Attributes:
+        enabled (bool): Whether spans record anything.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._samples: List[Sample] = []
+
+    @contextmanager
+    def span(self, phase: str, item: Optional[str] = None) -> Iterator[None]:
+        """Times the body of a with statement as one sample of a phase.
+
+        Args:
+            phase (str): The name of the phase, for example "keygen".
+            item (str, optional): What the phase worked on, for example the name of a certificate.
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._samples.append((phase, item, time.perf_counter() - started))
+
+    def configure_worker(self, enabled: bool) -> None:
+        """Sets up the timings of a worker process. Samples a forked worker inherited from its parent are dropped so
+        they are not merged twice."""
+        self.enabled = enabled
+        self._samples = []
+
+    def add(self, phase: str, seconds: float, item: Optional[str] = None) -> None:
+        """Records a sample measured elsewhere."""
+        if self.enabled:
+            self._samples.append((phase, item, seconds))
+
+    def drain(self) -> List[Sample]:
+        """Returns the samples recorded so far and forgets them. Worker processes return these to the main process."""
+        samples, self._samples = self._samples, []
+        return samples
+
+    def merge(self, samples: List[Sample]) -> None:
+        """Adds samples recorded in another process."""
+        if self.enabled:
+            self._samples.extend(tuple(sample) for sample in samples)
+
+    def phase_stats(self) -> Dict[str, Dict[str, float]]:
+        """Aggregates the samples per phase.
+
+        Returns:
+            dict: For each phase, in the order it was first recorded, the count, total, p50, p95 and max in seconds.
+        """
+        durations: Dict[str, List[float]] = {}
+        for phase, _, seconds in self._samples:
+            durations.setdefault(phase, []).append(seconds)
+
+        stats = {}
+        for phase, values in durations.items():
+            values.sort()
+            stats[phase] = {'count': len(values), 'total': sum(values), 'p50': percentile(values, 0.5),
+                            'p95': percentile(values, 0.95), 'max': values[-1]}
+        return stats
+
+    def item_totals(self) -> Dict[str, Dict[str, float]]:
+        """Aggregates the samples per item.
+
+        Returns:
+            dict: For each item, the seconds spent in each phase and in total.
+        """
+        totals: Dict[str, Dict[str, float]] = {}
+        for phase, item, seconds in self._samples:
+            if item is None:
+                continue
+            item_total = totals.setdefault(item, {'total': 0.0})
+            item_total[phase] = item_total.get(phase, 0.0) + seconds
+            item_total['total'] += seconds
+        return totals
+
+    def log_summary(self, run_seconds: float) -> None:
+        """Logs one line per phase with its count, total, p50, p95 and max."""
+        logger.info(f"Timings for the run ({run_seconds:.2f} s in total):")
+        for phase, stats in self.phase_stats().items():
+            logger.info(f"{phase}: {stats['count']} x, total {stats['total']:.3f} s, p50 {stats['p50'] * 1000:.1f} ms, "
+                        f"p95 {stats['p95'] * 1000:.1f} ms, max {stats['max'] * 1000:.1f} ms")
+
+    def write_metrics(self, metrics_file: str, run_seconds: float) -> None:
+        """Writes the per phase and per item aggregates to a JSON file.
+
+        Args:
+            metrics_file (str): The path of the file.
+            run_seconds (float): The wall clock time of the whole run.
+
+        Returns:
+            None
+        """
+        metrics = {'version': METRICS_VERSION, 'run_seconds': run_seconds, 'phases': self.phase_stats(),
+                   'items': self.item_totals()}
+        temp_path = f"{metrics_file}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(metrics, f, indent=2)
+        os.replace(temp_path, metrics_file)
+
+
+# The timings of this process
+timings = PhaseTimings()
+
+
+def add_instrumentation_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds --timings, --metrics-file and --profile to a script's parser."""
+    parser.add_argument('--timings', dest='timings', action='store_true', default=False,
+                        help='Log how long each phase took (p50, p95 and max per phase) at the end of the run.')
+    parser.add_argument('--metrics-file', dest='metrics_file', type=str, default=None,
+                        help='Write the phase timings, per phase and per certificate, to this JSON file.')
+    parser.add_argument('--profile', dest='profile', type=str, default=None,
+                        help='Profile the main process with cProfile and write the pstats dump to this file. Load it '
+                             'with python -m pstats. Worker processes are not profiled.')
+
+
+@contextmanager
+def instrumented(args: argparse.Namespace) -> Iterator[None]:
+    """Turns on the instrumentation requested on the command line for the body of a with statement.
+
+    The summary, metrics file and profile are written even if the body fails.
+
+    Args:
+        args (Namespace): Parsed arguments from a parser passed to add_instrumentation_arguments.
+    """
+    timings.enabled = bool(args.timings or args.metrics_file or args.profile)
+    timings.drain()
+    profiler = None
+    if args.profile:
+        import cProfile  # Only --profile needs the profiler, so runs without it do not pay for the import
+        profiler = cProfile.Profile()
+    started = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logger.info(f"Wrote the cProfile stats to {args.profile}.")
+        run_seconds = time.perf_counter() - started
+        if args.timings:
+            timings.log_summary(run_seconds)
+        if args.metrics_file:
+            timings.write_metrics(args.metrics_file, run_seconds)
+            logger.info(f"Wrote the timing metrics to {args.metrics_file}.")
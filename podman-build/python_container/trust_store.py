@@ -0,0 +1,359 @@
+import copy
+import json
+import os
+from typing import List, Optional, Tuple
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.x509 import Certificate
+
+from artifact_cache import ArtifactCache
+from helper_functions import PatchesLogger, verify_certificate_signature
+
+logger = PatchesLogger.get_logger()
+
+# Bump this if the layout of the on-disk index cache changes. Caches with a different version are ignored.
+CACHE_VERSION = 2
+
+# The longest chain build_chain will follow from a leaf to a trust anchor before giving up
+MAX_CHAIN_DEPTH = 8
+
+
+def subject_key_identifier(certificate: Certificate) -> bytes:
+    """Returns the subject key identifier of a certificate.
+
+    The identifier from the SubjectKeyIdentifier extension is used when present. Otherwise it is computed from the
+    public key the same way most CAs compute it (SHA1 of the public key).
+
+    Args:
+        certificate (Certificate): The certificate.
+
+    Returns:
+        bytes: The subject key identifier.
+    """
+    try:
+        return certificate.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value.digest
+    except x509.ExtensionNotFound:
+        return x509.SubjectKeyIdentifier.from_public_key(certificate.public_key()).digest
+
+
+def authority_key_identifier(certificate: Certificate) -> Optional[bytes]:
+    """Returns the authority key identifier of a certificate, or None if it does not have one.
+
+    Args:
+        certificate (Certificate): The certificate.
+
+    Returns:
+        bytes: The key identifier from the AuthorityKeyIdentifier extension, or None.
+    """
+    try:
+        return certificate.extensions.get_extension_for_class(x509.AuthorityKeyIdentifier).value.key_identifier
+    except x509.ExtensionNotFound:
+        return None
+
+
+def authority_key_identifier_for(issuer: Certificate) -> x509.AuthorityKeyIdentifier:
+    """Builds the AuthorityKeyIdentifier extension for a certificate issued by the given CA.
+
+    Args:
+        issuer (Certificate): The certificate of the issuing CA.
+
+    Returns:
+        AuthorityKeyIdentifier: An extension whose key identifier matches the subject key identifier of the CA.
+    """
+    try:
+        ski = issuer.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value
+        return x509.AuthorityKeyIdentifier.from_issuer_subject_key_identifier(ski)
+    except x509.ExtensionNotFound:
+        return x509.AuthorityKeyIdentifier.from_issuer_public_key(issuer.public_key())
+
+
+def is_self_signed(certificate: Certificate) -> bool:
+    """Checks whether a certificate is self-signed, which is what makes it a root CA.
+
+    Args:
+        certificate (Certificate): The certificate.
+
+    Returns:
+        bool: True if the certificate is its own issuer and its signature verifies with its own public key.
+    """
+    if certificate.subject != certificate.issuer:
+        return False
+    try:
+        verify_certificate_signature(certificate.public_key(), certificate)
+        return True
+    except InvalidSignature:
+        return False
+
+
+class TrustStore:
+    """An index of CA certificates keyed by subject DN and subject key identifier.
+
+    Finding the issuer of a certificate is a dictionary lookup on the certificate's authority key identifier, or on
+    its issuer DN when it has no authority key identifier, so only the signature of the matching CA is verified.
+    Certificates are parsed lazily. With an on-disk cache, files whose hash is unchanged are indexed without being
+    parsed at all, and chain links that were verified on an earlier run are not verified again.
+
+    Root CA files are added as trust anchors. Intermediate CA files are added as untrusted and are only used to build a
+    chain from a leaf certificate up to a trust anchor.
+
+    Attributes:
+        files (list): The CA certificate files in the order they were added.
+        cache_file (str): The JSON file the index and verified links are cached in, or None.
+        artifacts (ArtifactCache): The cache the CA files are read and parsed through.
+    """
+
+    def __init__(self, cache_file: Optional[str] = None, artifacts: Optional[ArtifactCache] = None):
+        self.files = []
+        self.cache_file = cache_file
+        self.artifacts = artifacts if artifacts is not None else ArtifactCache()
+        self._trusted = set()
+        self._by_subject = {}
+        self._by_key_id = {}
+        self._certificates = {}
+        self._file_hashes = {}
+        self._cached_entries = {}
+        self._links = set()
+        self._dirty = False
+
+        if cache_file:
+            try:
+                with open(cache_file, 'r') as f:
+                    data = json.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    self._cached_entries = data.get('entries', {})
+                    self._links = set(data.get('links', []))
+            except FileNotFoundError:
+                pass
+            except (ValueError, AttributeError) as e:
+                logger.warning(f"Ignoring unreadable trust store cache {cache_file}: {e}")
+
+    def _index(self, path: str, subject: bytes, key_id: bytes, trusted: bool) -> None:
+        """Adds a file to the lookup tables."""
+        self.files.append(path)
+        self._by_subject.setdefault(subject, []).append(path)
+        self._by_key_id.setdefault(key_id, []).append(path)
+        if trusted:
+            self._trusted.add(path)
+
+    def add(self, path: str, certificate: Certificate, trusted: bool = True) -> None:
+        """Adds a parsed CA certificate to the store.
+
+        Args:
+            path (str): The file the certificate was read from.
+            certificate (Certificate): The CA certificate.
+            trusted (bool): Whether the certificate is a trust anchor. Defaults to True.
+
+        Returns:
+            None
+        """
+        self._certificates[path] = certificate
+        self._index(path, certificate.subject.public_bytes(), subject_key_identifier(certificate), trusted)
+
+    def add_files(self, ca_files: List[str], trusted: bool = True) -> None:
+        """Adds CA certificate files in PEM format to the store.
+
+        Files whose hash is in the cache are indexed from the cache instead of being parsed.
+
+        Args:
+            ca_files (list): The paths of the CA certificate files.
+            trusted (bool): Whether the certificates are trust anchors (root CAs) or intermediates. Defaults to True.
+
+        Returns:
+            None
+        """
+        cache_hits = 0
+        for path in ca_files:
+            file_hash = self.artifacts.sha256(path)
+            self._file_hashes[path] = file_hash
+            entry = self._cached_entries.get(file_hash)
+            if entry is not None:
+                cache_hits += 1
+                self._index(path, bytes.fromhex(entry['subject']), bytes.fromhex(entry['key_id']), trusted)
+            else:
+                certificate = self.artifacts.certificate(path)
+                self.add(path, certificate, trusted)
+                self._cached_entries[file_hash] = {'subject': certificate.subject.public_bytes().hex(),
+                                                   'key_id': subject_key_identifier(certificate).hex()}
+                self._dirty = True
+
+        kind = 'root' if trusted else 'intermediate'
+        logger.info(f"Indexed {len(ca_files)} {kind} CA certificates ({cache_hits} from the cache).")
+
+    def save_cache(self) -> None:
+        """Writes the index and the verified chain links to the cache file if anything new was learned.
+
+        Entries for files that are no longer in the store are dropped.
+
+        Returns:
+            None
+        """
+        if not self.cache_file or not self._dirty:
+            return
+
+        file_hashes = set(self._file_hashes.values())
+        entries = {file_hash: entry for file_hash, entry in self._cached_entries.items() if file_hash in file_hashes}
+        links = sorted(link for link in self._links if link.split(':')[1] in file_hashes)
+
+        temp_path = f"{self.cache_file}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': entries, 'links': links}, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.cache_file)
+        self._dirty = False
+
+    def certificate(self, path: str) -> Certificate:
+        """Returns the certificate of a file in the store, parsing it on first use.
+
+        Args:
+            path (str): The file the certificate was read from.
+
+        Returns:
+            Certificate: The CA certificate.
+        """
+        if path not in self._certificates:
+            self._certificates[path] = self.artifacts.certificate(path)
+        return self._certificates[path]
+
+    def is_trusted(self, path: str) -> bool:
+        """Returns whether the CA file was added as a trust anchor."""
+        return path in self._trusted
+
+    @classmethod
+    def from_files(cls, ca_files: List[str], cache_file: Optional[str] = None,
+                   intermediate_files: Optional[List[str]] = None,
+                   artifacts: Optional[ArtifactCache] = None) -> 'TrustStore':
+        """Builds a trust store from CA certificate files in PEM format.
+
+        Args:
+            ca_files (list): The paths of the root CA certificate files. These are the trust anchors.
+            cache_file (str, optional): A JSON file caching the subject and key identifier of each CA file, keyed by the
+                                        SHA256 of the file contents, and the chain links already verified. It is
+                                        created or updated as needed. Defaults to None, which parses every file.
+            intermediate_files (list, optional): The paths of intermediate CA certificate files. Defaults to None.
+            artifacts (ArtifactCache, optional): The cache to read the files through, shared with the rest of the run.
+                                                 Defaults to None, which uses a private cache.
+
+        Returns:
+            TrustStore: The trust store.
+        """
+        store = cls(cache_file, artifacts)
+        store.add_files(ca_files, trusted=True)
+        if intermediate_files:
+            store.add_files(intermediate_files, trusted=False)
+        store.save_cache()
+        return store
+
+    def extended(self, intermediates: List[Tuple[str, Certificate]]) -> 'TrustStore':
+        """Returns a copy of the store with extra intermediate CA certificates added.
+
+        The copy shares the artifact cache and the verified links with this store, so building one per candidate file
+        is cheap. This store is left unchanged.
+
+        Args:
+            intermediates (list): The name and certificate of each intermediate CA, for example the CA certificates
+                                  shipped inside a PKCS#12 bundle.
+
+        Returns:
+            TrustStore: The extended store.
+        """
+        store = copy.copy(self)
+        store.files = list(self.files)
+        store._trusted = set(self._trusted)
+        store._by_subject = {subject: list(paths) for subject, paths in self._by_subject.items()}
+        store._by_key_id = {key_id: list(paths) for key_id, paths in self._by_key_id.items()}
+        store._certificates = dict(self._certificates)
+        for path, certificate in intermediates:
+            store.add(path, certificate, trusted=False)
+        return store
+
+    def find_issuer_candidates(self, certificate: Certificate) -> List[str]:
+        """Looks up the CA files that may have issued a certificate.
+
+        Args:
+            certificate (Certificate): The certificate whose issuer is wanted.
+
+        Returns:
+            list: The paths of the candidate CA files. Usually exactly one.
+        """
+        key_id = authority_key_identifier(certificate)
+        if key_id is not None and key_id in self._by_key_id:
+            return list(self._by_key_id[key_id])
+        return list(self._by_subject.get(certificate.issuer.public_bytes(), []))
+
+    def find_signer(self, certificate: Certificate) -> Optional[Tuple[str, Certificate]]:
+        """Finds the CA in the store that signed a certificate.
+
+        Only the candidates from find_issuer_candidates are verified. If none match, for example because a CA was
+        renamed without being reissued, every CA in the store is tried as a fallback.
+
+        Args:
+            certificate (Certificate): The certificate to check.
+
+        Returns:
+            tuple: The path and certificate of the signing CA, or None if no CA in the store signed it.
+        """
+        fingerprint = certificate.fingerprint(hashes.SHA256()).hex()
+        candidates = self.find_issuer_candidates(certificate)
+        for path in candidates:
+            if self._verifies(path, certificate, fingerprint):
+                return path, self.certificate(path)
+
+        if len(candidates) != len(self.files):
+            logger.warning("The issuer index found no CA certificate that signed the certificate. Checking every CA "
+                           "certificate instead...")
+            for path in self.files:
+                if path not in candidates and self._verifies(path, certificate, fingerprint):
+                    return path, self.certificate(path)
+
+        return None
+
+    def build_chain(self, certificate: Certificate) -> Optional[List[Tuple[str, Certificate]]]:
+        """Builds the chain from a certificate up to a trust anchor.
+
+        Args:
+            certificate (Certificate): The leaf certificate.
+
+        Returns:
+            list: The path and certificate of each CA in the chain, starting with the issuer of the leaf and ending with
+                  the trust anchor. None if no chain to a trust anchor exists in the store.
+        """
+        chain = []
+        visited = set()
+        current = certificate
+        while len(chain) < MAX_CHAIN_DEPTH:
+            signer = self.find_signer(current)
+            if signer is None:
+                return None
+            path, issuer = signer
+            if path in visited:
+                logger.warning(f"Found a loop in the certificate chain at {path}.")
+                return None
+            visited.add(path)
+            chain.append(signer)
+            if path in self._trusted:
+                return chain
+            current = issuer
+
+        logger.warning(f"Gave up building the certificate chain after {MAX_CHAIN_DEPTH} CA certificates.")
+        return None
+
+    def _verifies(self, path: str, certificate: Certificate, fingerprint: str) -> bool:
+        """Checks whether the CA in path signed the certificate, using the verified link cache where possible."""
+        file_hash = self._file_hashes.get(path)
+        link = f"{fingerprint}:{file_hash}"
+        if file_hash is not None and link in self._links:
+            return True
+
+        try:
+            verify_certificate_signature(self.certificate(path).public_key(), certificate)
+        except InvalidSignature:
+            return False
+
+        if file_hash is not None:
+            self._links.add(link)
+            self._dirty = True
+        return True
+
+    def __len__(self) -> int:
+        return len(self.files)
@@ -36,6 +36,11 @@ var redirectFlag = false;
 
 app.use(bodyParser.json());
 
+// When true, nginx forwards the fields of the client certificate it verified in
+// X-SSL-Client-* headers instead of the whole certificate in X-SSL-CERT. See
+// CLIENT_IDENTITY_HEADERS in config.yml.
+const useIdentityHeaders = process.env.CLIENT_IDENTITY_HEADERS === 'true';
+
 /**
  * clientAuthMiddleware checks inbound requests and validates that the client
  * request is using a certificate signed by the CA Patches is using.
@@ -51,21 +56,31 @@ app.use(bodyParser.json());
  * @throws {Error} If the client certificate is invalid.
  */
 const clientAuthMiddleware = () => (req, res, next) => {
-  // Extract the client certificate from the X-SSL-CERT header
-  const cert = req.headers['x-ssl-cert'];
+  let user = null;
 
-  if (cert) {
-    // Parse the PEM-encoded certificate
-    const parsedCert = parseCertificate(cert);
+  if (useIdentityHeaders) {
+    // nginx already verified the certificate. Without verification (optional_no_ca)
+    // the certificate is only accepted when client certificate authentication is off.
+    const subject = req.headers['x-ssl-client-subject'];
+    const verify = req.headers['x-ssl-client-verify'];
+    if (subject && (verify === 'SUCCESS' || process.env.DISABLE_CLIENT_CERT_AUTH === 'true')) {
+      user = userFromIdentityHeaders(subject, req.headers['x-ssl-client-issuer'] || '');
+    }
+  } else if (req.headers['x-ssl-cert']) {
+    // Parse the PEM-encoded certificate from the X-SSL-CERT header
+    const parsedCert = parseCertificate(req.headers['x-ssl-cert']);
 
-    req.user = {
+    user = {
       subject: parsedCert.subject.getField('CN').value,
       issuer: parsedCert.issuer.getField('CN').value,
       organizational_unit: parsedCert.subject.getField('OU').value,
       organization: parsedCert.subject.getField('O').value,
       country: parsedCert.subject.getField('C').value,
     };
+  }
 
+  if (user) {
+    req.user = user;
     return next();
   } else if (process.env.DISABLE_CLIENT_CERT_AUTH === 'true') {
     // Set req.user with default values
@@ -96,6 +111,81 @@ function parseCertificate(cert) {
   return forge.pki.certificateFromPem(decodedCert);
 }
 
+/**
+ * Parses an RFC 2253 distinguished name such as nginx's $ssl_client_s_dn,
+ * for example "CN=gelante,OU=Federal,O=Dell,C=US". Escaped characters and
+ * \XX escaped UTF-8 bytes are decoded. RFC 2253 lists the attributes in
+ * reverse order, so when an attribute appears more than once the last one
+ * is kept. That is the first one in the certificate, as with forge's getField.
+ *
+ * @param {string} dn - The distinguished name.
+ * @returns {Object} The value of each attribute keyed by its upper case short name.
+ */
+function parseDistinguishedName(dn) {
+  const fields = {};
+  let name = '';
+  let value = [];
+  let inValue = false;
+
+  const finishAttribute = () => {
+    if (name.trim()) {
+      fields[name.trim().toUpperCase()] = Buffer.from(value).toString('utf8');
+    }
+    name = '';
+    value = [];
+    inValue = false;
+  };
+
+  for (let i = 0; i < dn.length; i++) {
+    const c = dn[i];
+    if (!inValue) {
+      if (c === '=') {
+        inValue = true;
+      } else {
+        name += c;
+      }
+    } else if (c === '\\' && i + 1 < dn.length) {
+      const hex = dn.slice(i + 1, i + 3);
+      if (/^[0-9A-Fa-f]{2}$/.test(hex)) {
+        value.push(parseInt(hex, 16));
+        i += 2;
+      } else {
+        value.push(...Buffer.from(dn[i + 1]));
+        i += 1;
+      }
+    } else if (c === ',' || c === '+') {
+      finishAttribute();
+    } else {
+      value.push(...Buffer.from(c));
+    }
+  }
+  finishAttribute();
+
+  return fields;
+}
+
+/**
+ * Builds req.user from the subject and issuer distinguished names nginx
+ * forwards in identity header mode. The fields match the ones read from
+ * the full certificate.
+ *
+ * @param {string} subjectDn - The subject DN from X-SSL-Client-Subject.
+ * @param {string} issuerDn - The issuer DN from X-SSL-Client-Issuer.
+ * @returns {Object} The user.
+ */
+function userFromIdentityHeaders(subjectDn, issuerDn) {
+  const subject = parseDistinguishedName(subjectDn);
+  const issuer = parseDistinguishedName(issuerDn);
+
+  return {
+    subject: subject.CN,
+    issuer: issuer.CN,
+    organizational_unit: subject.OU,
+    organization: subject.O,
+    country: subject.C,
+  };
+}
+
 /**
  * redirectAllClients - This is triggered when the redirectFlag is set to true. 
  * If the redirectFlag is set to true it will stop all further processing and